@@ -1,7 +1,37 @@
-import yaml
+YAML_TAG = "!FileMetadata"
 
+# the yaml module, once imported and the tag registered
+_yaml = None
 
-class FileMetadata(yaml.YAMLObject):
+
+def loadYaml():
+    """
+    Imports yaml on first use, and registers the representer and
+    constructor of the !FileMetadata tag with it.
+
+    Returns:
+        module: The yaml module
+    """
+    global _yaml
+    if _yaml is None:
+        import yaml
+
+        yaml.add_representer(FileMetadata, representFileMetadata)
+        yaml.add_constructor(YAML_TAG, constructFileMetadata)
+        _yaml = yaml
+    return _yaml
+
+
+def representFileMetadata(dumper, metadata):
+    return dumper.represent_mapping(YAML_TAG, metadata.__dict__)
+
+
+def constructFileMetadata(loader, node):
+    fields = loader.construct_mapping(node)
+    return FileMetadata(**fields)
+
+
+class FileMetadata:
     """
     The class of file metadata.
 
@@ -17,9 +47,11 @@ class FileMetadata(yaml.YAMLObject):
             originOrg (str): The agent responsible for providing the source file.
             script (str): The name of the program that created the file.
             status (str): A status flag in processing this entity
+            offset (int): The byte offset of the file within its container, if any
+            length (int): The number of bytes of the file within its container
+            source (str): The release file the file was extracted from
     """
 
-    yaml_tag = "!FileMetadata"
     title = None
     filename = None
     filepath = None
@@ -31,6 +63,9 @@ class FileMetadata(yaml.YAMLObject):
     originOrg = None
     script = None
     status = None
+    offset = None
+    length = None
+    source = None
 
     def __init__(
         self,
@@ -45,6 +80,9 @@ class FileMetadata(yaml.YAMLObject):
         originOrg=None,
         script=None,
         status=None,
+        offset=None,
+        length=None,
+        source=None,
     ):
         if title is not None:
             self.title = title
@@ -68,3 +106,9 @@ class FileMetadata(yaml.YAMLObject):
             self.script = script
         if status is not None:
             self.status = status
+        if offset is not None:
+            self.offset = offset
+        if length is not None:
+            self.length = length
+        if source is not None:
+            self.source = source
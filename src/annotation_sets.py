@@ -0,0 +1,238 @@
+import argparse
+import csv
+import glob
+import gzip
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import date
+
+from clean import clean_text
+
+
+def parseRanges(value):
+    """Parses length ranges such as "150-600,600-1200" into (low, high) tuples."""
+    ranges = []
+    for item in value.split(","):
+        low, high = item.split("-")
+        ranges.append((int(low), int(high)))
+    return ranges
+
+
+def marketOf(source):
+    """Tells the market of a release file from its name, rx, otc, or unknown
+    for a source that is not a release file, such as a merged CSV file."""
+    if "_otc_" in source:
+        return "otc"
+    if "_rx_" in source:
+        return "rx"
+    return "unknown"
+
+
+def listInputs(inputs):
+    """Expands the input CSV files, a directory standing for the per release
+    file parts it contains (results/parts)."""
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(f"{path}/*.csv")))
+        else:
+            files.append(path)
+    return files
+
+
+def readSourceRows(csv_files):
+    """
+    Yields the indication rows of CSV files, with their release file.
+
+    The release file is the source column when there is one, or else the
+    name of the part the rows were read from.
+    """
+    csv.field_size_limit(sys.maxsize)
+    for csv_file in csv_files:
+        default_source = os.path.basename(csv_file)[: -len(".csv")]
+        with open(csv_file, "r", newline="") as f:
+            for row in csv.DictReader(f):
+                row.setdefault("source", default_source)
+                yield row
+
+
+class StratifiedReservoir:
+    """
+    Draws a uniform sample of at most k records from every stratum of a
+    stream, in memory bounded by k times the number of strata.
+
+    Attributes:
+            k (int): The sample size of every stratum
+            seen (dict): stratum -> number of records offered
+            samples (dict): stratum -> sampled records
+    """
+
+    def __init__(self, k, rng):
+        self.k = k
+        self.rng = rng
+        self.seen = {}
+        self.samples = {}
+
+    def offer(self, stratum, record):
+        n = self.seen.get(stratum, 0) + 1
+        self.seen[stratum] = n
+        sample = self.samples.setdefault(stratum, [])
+        if len(sample) < self.k:
+            sample.append(record)
+        else:
+            # keep the n-th record with probability k / n
+            j = self.rng.randrange(n)
+            if j < self.k:
+                sample[j] = record
+
+
+def buildAnnotationSet(
+    csv_files, output_dir, per_stratum, ranges, shard_size=1000, seed=42
+):
+    """
+    Streams indication rows into a sample stratified by market (Rx or OTC)
+    and cleaned text length, and writes it as gzipped JSONL shards with a
+    manifest.
+
+    Rows whose cleaned text is a duplicate, or whose length is outside the
+    ranges, are skipped. Rows whose market cannot be told from their release
+    file, such as the rows of the merged indications CSV file, are sampled
+    in unknown strata, with a warning.
+
+    Args:
+        csv_files: the indication CSV files
+        output_dir: the directory of the shards and manifest
+        per_stratum: the sample size of every (market, length range) stratum
+        ranges: the (low, high) length ranges, bounds included
+        shard_size: the number of records per shard
+        seed: the seed of the sampling and of the order of the records
+
+    Returns:
+        dict: The manifest
+    """
+    rng = random.Random(seed)
+    reservoir = StratifiedReservoir(per_stratum, rng)
+    seen_texts = set()
+    n_rows = 0
+    n_duplicates = 0
+    unknown_sources = set()
+    for row in readSourceRows(csv_files):
+        n_rows += 1
+        text = clean_text(row["text"])
+        digest = hashlib.md5(text.encode()).digest()
+        if digest in seen_texts:
+            n_duplicates += 1
+            continue
+        seen_texts.add(digest)
+        length_range = next(
+            (f"{low}-{high}" for low, high in ranges if low <= len(text) <= high),
+            None,
+        )
+        if length_range is None:
+            continue
+        market = marketOf(row["source"])
+        if market == "unknown" and row["source"] not in unknown_sources:
+            unknown_sources.add(row["source"])
+            print(
+                f"Warning: the market of {row['source']} is unknown, sample the "
+                "per release file parts (results/parts) to stratify by market"
+            )
+        record = {
+            "set_id": row["set_id"],
+            "xml_id": row["xml_id"],
+            "version_number": int(row["version_number"]),
+            "source": row["source"],
+            "market": market,
+            "length_range": length_range,
+            "text": text,
+        }
+        reservoir.offer(f"{market}:{length_range}", record)
+
+    records = [
+        r for stratum in sorted(reservoir.samples) for r in reservoir.samples[stratum]
+    ]
+    rng.shuffle(records)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for path in glob.glob(f"{output_dir}/annotations-*.jsonl.gz"):
+        os.remove(path)
+    shards = []
+    for start in range(0, len(records), shard_size):
+        filename = f"annotations-{len(shards):05d}.jsonl.gz"
+        data = "".join(
+            json.dumps(r) + "\n" for r in records[start : start + shard_size]
+        ).encode()
+        with open(f"{output_dir}/{filename}", "wb") as f:
+            f.write(gzip.compress(data, mtime=0))
+        shards.append(
+            {
+                "filename": filename,
+                "records": min(shard_size, len(records) - start),
+                "md5": hashlib.md5(data).hexdigest(),
+            }
+        )
+
+    manifest = {
+        "date": date.today().strftime("%Y-%m-%d"),
+        "inputs": [os.path.basename(f) for f in csv_files],
+        "seed": seed,
+        "per_stratum": per_stratum,
+        "length_ranges": [f"{low}-{high}" for low, high in ranges],
+        "rows": n_rows,
+        "duplicates": n_duplicates,
+        "strata": {
+            stratum: {"rows": reservoir.seen[stratum], "sampled": len(sample)}
+            for stratum, sample in sorted(reservoir.samples.items())
+        },
+        "records": len(records),
+        "shards": shards,
+    }
+    with open(f"{output_dir}/manifest.json.tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{output_dir}/manifest.json.tmp", f"{output_dir}/manifest.json")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build a stratified annotation set from the indications."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Indication CSV files, or directories of parts (results/parts)",
+    )
+    parser.add_argument("-o", "--output", required=True, help="Output directory")
+    parser.add_argument(
+        "-n", "--per-stratum", type=int, default=500, help="Records per stratum"
+    )
+    parser.add_argument(
+        "--lengths",
+        default="150-600",
+        help="Comma-separated ranges of cleaned text length, e.g. 150-600,600-1200",
+    )
+    parser.add_argument(
+        "--shard-size", type=int, default=1000, help="Records per output shard"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Sampling seed")
+    args = parser.parse_args()
+
+    start = time.time()
+    manifest = buildAnnotationSet(
+        listInputs(args.inputs),
+        args.output,
+        args.per_stratum,
+        parseRanges(args.lengths),
+        args.shard_size,
+        args.seed,
+    )
+    for stratum, counts in manifest["strata"].items():
+        print(f"{stratum}: sampled {counts['sampled']} of {counts['rows']}")
+    print(
+        f"Wrote {manifest['records']} record(s) in {len(manifest['shards'])} "
+        f"shard(s) to {args.output} in {time.time() - start:.1f} seconds"
+    )
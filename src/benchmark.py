@@ -0,0 +1,548 @@
+import argparse
+import concurrent.futures
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+import zipfile
+from xml.sax.saxutils import escape
+
+from FileMetadata import FileMetadata, loadYaml
+
+STAGES = ["extract", "process", "explore", "clean_text", "gold_standard"]
+
+INDICATION_CODE = "34067-9"
+OTHER_CODES = [
+    ("34084-4", "ADVERSE REACTIONS SECTION"),
+    ("34068-7", "DOSAGE &amp; ADMINISTRATION SECTION"),
+    ("34070-3", "CONTRAINDICATIONS SECTION"),
+    ("43685-7", "WARNINGS AND PRECAUTIONS SECTION"),
+]
+
+WORDS = (
+    "patients adults pediatric chronic acute severe infection hypertension pain "
+    "therapy dose tablets injection symptoms disease risk adjunct relief "
+    "moderate management reduction clinical studies treatment control"
+).split()
+TRIGGERS = [
+    "indicated for the treatment of",
+    "indicated as an adjunct to",
+    "used to treat",
+    "for the management of",
+]
+
+
+def makeSentence(rng, n_words):
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    if rng.random() < 0.5:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(TRIGGERS))
+    return " ".join(words).capitalize() + "."
+
+
+def makeSectionText(rng, section_size):
+    """Builds the <text> body of a section of roughly section_size characters,
+    split into paragraphs and an occasional list."""
+    parts = []
+    size = 0
+    while size < section_size:
+        sentences = " ".join(makeSentence(rng, rng.randint(6, 20)) for _ in range(3))
+        if rng.random() < 0.2:
+            parts.append(f"<list><item>{escape(sentences)}</item></list>")
+        else:
+            parts.append(f"<paragraph>{escape(sentences)}</paragraph>")
+        size += len(sentences)
+    return "\n".join(parts)
+
+
+def makeSplXml(rng, section_size, n_sections):
+    """
+    Generates one synthetic SPL document.
+
+    The document has the header elements read by process() and n_sections
+    sections, the first of which is an indications section.
+
+    Args:
+        rng: a random.Random instance
+        section_size: the approximate number of characters in each section
+        n_sections: the number of sections in the document
+
+    Returns:
+        tuple(str, str, bytes): The setId, the document id and the XML content
+    """
+    set_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    doc_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    sections = []
+    for i in range(n_sections):
+        code, name = (
+            (INDICATION_CODE, "INDICATIONS &amp; USAGE SECTION")
+            if i == 0
+            else rng.choice(OTHER_CODES)
+        )
+        sections.append(
+            f"""<component><section ID="s{i}">
+<id root="{uuid.UUID(int=rng.getrandbits(128))}"/>
+<code code="{code}" codeSystem="2.16.840.1.113883.6.1" displayName="{name}"/>
+<title>{i + 1} {name}</title>
+<text>{makeSectionText(rng, section_size)}</text>
+</section></component>"""
+        )
+    xml = f"""<?xml version="1.0" encoding="UTF-8"?>
+<document xmlns="urn:hl7-org:v3" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<id root="{doc_id}"/>
+<code code="34391-3" codeSystem="2.16.840.1.113883.6.1"
+  displayName="HUMAN PRESCRIPTION DRUG LABEL"/>
+<title>SYNTHETIC LABEL</title>
+<effectiveTime value="20230101"/>
+<setId root="{set_id}"/>
+<versionNumber value="{rng.randint(1, 30)}"/>
+<component><structuredBody>
+{"".join(sections)}
+</structuredBody></component>
+</document>
+"""
+    return set_id, doc_id, xml.encode()
+
+
+def makeSyntheticRelease(path, n_labels, section_size=2000, n_sections=5, seed=0):
+    """
+    Writes a release zip shaped like the DailyMed ones: an outer zip containing
+    one inner zip per label, each holding a single XML file.
+
+    Args:
+        path: the path of the release zip to write
+        n_labels: the number of labels in the release
+        section_size: the approximate number of characters in each section
+        n_sections: the number of sections per label
+        seed: the seed of the generator
+
+    Returns:
+        int: The number of bytes of XML written
+    """
+    rng = random.Random(seed)
+    xml_bytes = 0
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as outer:
+        for i in range(n_labels):
+            set_id, doc_id, xml = makeSplXml(rng, section_size, n_sections)
+            xml_bytes += len(xml)
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as inner:
+                inner.writestr(f"{doc_id}.xml", xml)
+            outer.writestr(f"prescription/20230101_{set_id}.zip", buffer.getvalue())
+    return xml_bytes
+
+
+def makeSyntheticCorpus(
+    working_dir,
+    n_parts=1,
+    n_labels=100,
+    section_size=2000,
+    n_sections=5,
+    seed=0,
+    markets=("rx",),
+):
+    """
+    Lays out a working directory as if dm_parser had downloaded n_parts
+    release files of every market, including the download metadata read by
+    checkFiles().
+
+    Returns:
+        list: The filenames of the synthetic release parts
+    """
+    download_dir = f"{working_dir}/download"
+    dated_dir = f"{download_dir}/synthetic"
+    os.makedirs(dated_dir, exist_ok=True)
+    metadata = {}
+    for k, market in enumerate(markets):
+        for i in range(1, n_parts + 1):
+            filename = f"dm_spl_release_human_{market}_part{i}.zip"
+            filepath = f"{dated_dir}/{filename}"
+            makeSyntheticRelease(
+                filepath,
+                n_labels,
+                section_size,
+                n_sections,
+                seed=seed + k * n_parts + i,
+            )
+            metadata[filename] = FileMetadata(
+                filename=filename,
+                filepath=filepath,
+                script=os.path.basename(__file__),
+            )
+    with open(f"{download_dir}/files.meta.yaml", "w") as f:
+        loadYaml().dump(metadata, f, default_flow_style=False)
+    return list(metadata)
+
+
+def directorySize(path):
+    n_files = 0
+    n_bytes = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_file():
+                n_files += 1
+                n_bytes += entry.stat().st_size
+    return n_files, n_bytes
+
+
+def useWorkingDir(working_dir, filenames):
+    """Configures a dm_parser pipeline on the synthetic corpus."""
+    import dm_parser
+    from bs4 import BeautifulSoup
+
+    # dm_parser imports bs4 and its lxml builder on first use, import them
+    # here so that they are not timed as part of a stage
+    BeautifulSoup(b"", "xml")
+
+    pipeline = dm_parser.DailyMedPipeline(
+        working_dir=working_dir, files=",".join(filenames)
+    )
+    return dm_parser, pipeline
+
+
+def benchExtract(working_dir, filenames, options):
+    dm_parser, pipeline = useWorkingDir(working_dir, filenames)
+    files = pipeline.files()
+    n_bytes = sum(os.path.getsize(files[f].filepath) for f in files)
+    n_files = 0
+    for f in files:
+        with zipfile.ZipFile(files[f].filepath) as zf:
+            n_files += len(zf.namelist())
+    return lambda: dm_parser.extract(files, pipeline.paths), n_files, n_bytes
+
+
+def benchProcess(working_dir, filenames, options):
+    dm_parser, pipeline = useWorkingDir(working_dir, filenames)
+    n_files, n_bytes = directorySize(f"{working_dir}/extract")
+    return lambda: dm_parser.process({}, pipeline.paths), n_files, n_bytes
+
+
+def benchExplore(working_dir, filenames, options):
+    from collections import defaultdict
+
+    import code_explorer
+    from spl_codec import readFile
+    from vocabulary import compileVocabulary
+
+    terms = compileVocabulary(options["terms_file"])
+    extraction_dir = f"{working_dir}/extract"
+    n_files, n_bytes = directorySize(extraction_dir)
+
+    def run():
+        code_dict = defaultdict(code_explorer.CodeInfo)
+        term_dict = defaultdict(int)
+        with os.scandir(extraction_dir) as it:
+            for entry in it:
+                # the files may be plain, gzipped or zstd compressed XML
+                xml_file = io.BytesIO(readFile(entry.path))
+                code_explorer.explore(xml_file, terms, code_dict, term_dict)
+
+    return run, n_files, n_bytes
+
+
+def makeIndicationTexts(n_texts, section_size, seed):
+    """Generates raw indication texts shaped like the text column of
+    indications.csv, independently of the output of process()."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n_texts):
+        paragraphs = []
+        size = 0
+        while size < section_size:
+            paragraph = " ".join(
+                makeSentence(rng, rng.randint(6, 20)) for _ in range(3)
+            )
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+        texts.append("1 INDICATIONS AND USAGE\n\n  " + "\n  \n".join(paragraphs))
+    return texts
+
+
+def benchCleanText(working_dir, filenames, options):
+    from clean import clean_text
+
+    texts = makeIndicationTexts(
+        options["texts"], options["section_size"], options["seed"]
+    )
+
+    def run():
+        for text in texts:
+            clean_text(text)
+
+    return run, len(texts), sum(len(t) for t in texts)
+
+
+def benchGoldStandard(working_dir, filenames, options):
+    import pandas as pd
+
+    from clean import clean_text
+    from dissimilar import create_gold_standard_dataset
+
+    texts = makeIndicationTexts(
+        options["gold_rows"], options["section_size"], options["seed"]
+    )
+    df = pd.DataFrame({"text": [clean_text(t) for t in texts]})
+    n_bytes = sum(len(t) for t in df["text"])
+
+    def run():
+        create_gold_standard_dataset(df, options["threshold"])
+
+    return run, len(df), n_bytes
+
+
+# Each benchmark prepares its inputs and returns the callable to time along
+# with the number of input files and bytes it consumes.
+BENCHMARKS = {
+    "extract": benchExtract,
+    "process": benchProcess,
+    "explore": benchExplore,
+    "clean_text": benchCleanText,
+    "gold_standard": benchGoldStandard,
+}
+
+
+def runStage(stage, working_dir, filenames, options):
+    """
+    Runs one stage and measures it. This is executed in a fresh child process
+    so that the peak RSS reported belongs to the stage alone.
+
+    Returns:
+        dict: The measurements of the stage
+    """
+    devnull = open(os.devnull, "w")
+    stdout = sys.stdout
+    sys.stdout = devnull
+    try:
+        run, n_files, n_bytes = BENCHMARKS[stage](working_dir, filenames, options)
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        run()
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {
+        "stage": stage,
+        "files": n_files,
+        "bytes": n_bytes,
+        "seconds": seconds,
+        "cpu_seconds": cpu_seconds,
+        "files_per_s": n_files / seconds if seconds else 0.0,
+        "mb_per_s": n_bytes / 1e6 / seconds if seconds else 0.0,
+        "peak_rss_mb": peak_rss / 1e6,
+    }
+
+
+def copyWorkingDir(working_dir, run_dir):
+    """Copies the outputs of the previous stages to a fresh working
+    directory, which shares the release files of the corpus."""
+    os.makedirs(run_dir)
+    for name in os.listdir(working_dir):
+        source = os.path.join(working_dir, name)
+        if name == "download":
+            os.symlink(os.path.abspath(source), os.path.join(run_dir, name))
+        elif os.path.isdir(source):
+            shutil.copytree(source, os.path.join(run_dir, name))
+        else:
+            shutil.copy2(source, run_dir)
+
+
+def keepOutputs(run_dir, working_dir):
+    """Replaces the outputs in the working directory with the ones of a run,
+    for the next stages."""
+    for name in os.listdir(run_dir):
+        if name == "download":
+            continue
+        target = os.path.join(working_dir, name)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        shutil.move(os.path.join(run_dir, name), target)
+
+
+def runBenchmarks(working_dir, filenames, stages, options, repeat=1):
+    """
+    Runs each stage `repeat` times and keeps the fastest measurement.
+
+    Every run starts from a fresh copy of the working directory as the
+    previous stages left it, so that a run does not reuse what an earlier
+    run of the same stage recorded, such as the member manifests of the
+    release files.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory(prefix="benchmark-runs-") as runs_dir:
+        for stage in stages:
+            best = None
+            for i in range(repeat):
+                run_dir = os.path.join(runs_dir, f"{stage}-{i}")
+                copyWorkingDir(working_dir, run_dir)
+                with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1, mp_context=context
+                ) as pool:
+                    result = pool.submit(
+                        runStage, stage, run_dir, filenames, options
+                    ).result()
+                if best is None or result["seconds"] < best["seconds"]:
+                    best = result
+            keepOutputs(run_dir, working_dir)
+            results.append(best)
+            printResult(best)
+    return results
+
+
+def printResult(result):
+    line = (
+        f"{result['stage']:<14} {result['files']:>8} files "
+        f"{result['seconds']:>9.3f} s {result['files_per_s']:>10.1f} files/s "
+        f"{result['mb_per_s']:>8.2f} MB/s {result['peak_rss_mb']:>8.1f} MB peak RSS"
+    )
+    print(line)
+
+
+def compareResults(results, baseline_file, max_slowdown=None, config=None):
+    """
+    Prints the throughput change of each stage against a saved run.
+
+    Args:
+        results: the measurements of the stages
+        baseline_file: the JSON result file of the saved run
+        max_slowdown: the largest drop of files/s allowed, in percent, none\
+            by default
+        config: the corpus configuration of the run, compared with the one of\
+            the saved run
+
+    Returns:
+        list[str] The stages slower than allowed
+    """
+    with open(baseline_file) as f:
+        saved = json.load(f)
+    baseline = {r["stage"]: r for r in saved["results"]}
+    print(f"\nComparison with {baseline_file}")
+    if config is not None and saved.get("config") != config:
+        print("Warning: the baseline was measured on another corpus configuration")
+    slower = []
+    for result in results:
+        base = baseline.get(result["stage"])
+        if base is None or base["files_per_s"] == 0:
+            continue
+        change = (result["files_per_s"] / base["files_per_s"] - 1) * 100
+        flag = ""
+        if max_slowdown is not None and change < -max_slowdown:
+            slower.append(result["stage"])
+            flag = f"  slower than the allowed {max_slowdown:g}%"
+        print(f"{result['stage']:<14} {change:+7.1f}% files/s{flag}")
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the extraction and processing stages on a synthetic \
+            SPL corpus."
+    )
+    parser.add_argument(
+        "-w",
+        "--working_dir",
+        default=None,
+        help="Directory for the synthetic corpus (default: a temporary directory)",
+    )
+    parser.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help=f"Comma-separated stages to run. options: {'|'.join(STAGES)}",
+    )
+    parser.add_argument("--parts", type=int, default=1, help="Release parts")
+    parser.add_argument("--labels", type=int, default=1000, help="Labels per part")
+    parser.add_argument(
+        "--section-size", type=int, default=2000, help="Characters per section"
+    )
+    parser.add_argument("--sections", type=int, default=5, help="Sections per label")
+    parser.add_argument("--seed", type=int, default=0, help="Generator seed")
+    parser.add_argument(
+        "--terms",
+        default=os.path.join(os.path.dirname(__file__), "..", "res", "terms.txt"),
+        help="Terms file used by the explore stage",
+    )
+    parser.add_argument(
+        "--texts", type=int, default=20000, help="Texts used by clean_text"
+    )
+    parser.add_argument(
+        "--gold-rows", type=int, default=2000, help="Rows used by gold_standard"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.9, help="Similarity threshold"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per stage, the fastest is kept"
+    )
+    parser.add_argument("-o", "--output", help="Write the results to a JSON file")
+    parser.add_argument("--compare", help="Compare with a previous JSON result file")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=None,
+        help="Fail when the files/s of a stage drops by more than this percentage "
+        "from the --compare run",
+    )
+    args = parser.parse_args()
+    if args.max_slowdown is not None and not args.compare:
+        parser.error("--max-slowdown requires --compare")
+
+    stages = args.stages.split(",")
+    for stage in stages:
+        if stage not in BENCHMARKS:
+            parser.error(f"Unknown stage {stage}")
+
+    tmp = None
+    working_dir = args.working_dir
+    if working_dir is None:
+        tmp = tempfile.TemporaryDirectory()
+        working_dir = tmp.name
+
+    print(f"Generating {args.parts} x {args.labels} synthetic labels in {working_dir}")
+    filenames = makeSyntheticCorpus(
+        working_dir,
+        args.parts,
+        args.labels,
+        args.section_size,
+        args.sections,
+        args.seed,
+    )
+    options = {
+        "terms_file": args.terms,
+        "texts": args.texts,
+        "section_size": args.section_size,
+        "seed": args.seed,
+        "gold_rows": args.gold_rows,
+        "threshold": args.threshold,
+    }
+    results = runBenchmarks(working_dir, filenames, stages, options, args.repeat)
+
+    config = {
+        "parts": args.parts,
+        "labels": args.labels,
+        "section_size": args.section_size,
+        "sections": args.sections,
+        "seed": args.seed,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+    slower = []
+    if args.compare:
+        slower = compareResults(results, args.compare, args.max_slowdown, config)
+    if tmp is not None:
+        tmp.cleanup()
+    if slower:
+        print(f"Throughput regression in {', '.join(slower)}")
+        sys.exit(1)
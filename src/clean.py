@@ -1,6 +1,5 @@
 import argparse
 import re
-import random
 import pandas as pd
 
 def clean_text(text):
@@ -12,6 +11,16 @@ def clean_text(text):
     cleaned_text = cleaned_text.encode("ascii", "ignore").decode()
     return cleaned_text.strip()
 
+def clean_dataframe(df, seed=42):
+    # the sentence offsets of dm_parser refer to the raw text
+    df = df.drop(columns=['sentences'], errors='ignore')
+    df['text'] = df['text'].apply(clean_text)
+    df = df.drop_duplicates(subset=['text'])
+    return shuffle(df, seed)
+
+def shuffle(df, seed=42):
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Clean and shuffle text data from a CSV file.")
     parser.add_argument("input_file", help="Path to the input CSV file")
@@ -22,11 +31,6 @@ if __name__ == "__main__":
     out_file = args.output_file
     
     df = pd.read_csv(in_file)
-
-    df['text'] = df['text'].apply(clean_text)
-    df = df.drop_duplicates(subset=['text'])
-
-    random.seed(42)
-    df_shuffled = df.sample(frac=1).reset_index(drop=True)
+    df_shuffled = clean_dataframe(df)
 
     df_shuffled.to_csv(out_file, index=False)
\ No newline at end of file
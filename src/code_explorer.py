@@ -1,14 +1,19 @@
-import re
 import csv
 import os
 import argparse
+import io
 from lxml import etree
 from collections import defaultdict
+from shard_store import ShardStore
+from vocabulary import Vocabulary, compileVocabulary
+from sentences import segmentSentences
+from spl_codec import readFile
 
 class CodeInfo:
     def __init__(self):
         self.display_name = ""
         self.term_dist = defaultdict(int)
+        self.category_dist = defaultdict(int)
         self.total_occurrences = 0
         self.matching_occurrences = 0
 
@@ -18,12 +23,10 @@ class CodeInfo:
     def increment_matching(self):
         self.matching_occurrences += 1
     
-def generate_sentence_regex(terms):
-    # Construct the regex pattern. Join the escaped terms using the pipe (|) operator for alternation 
-    escaped_terms = [re.escape(term) for term in terms]
-    return r'[^.]*\b(' + '|'.join(escaped_terms) + r')\b[^.]*\.'
-
 def explore(xmlfile, terms, code_dict, term_dict):
+    # terms is a compiled Vocabulary, or a list of terms compiled for this file
+    vocabulary = terms if isinstance(terms, Vocabulary) else Vocabulary({None: terms})
+
     tree = etree.parse(xmlfile)
     root = tree.getroot()
 
@@ -32,8 +35,6 @@ def explore(xmlfile, terms, code_dict, term_dict):
     namespace_prefix = "ns"
     namespace_map = {namespace_prefix: namespace_uri}
 
-    regex_pattern = generate_sentence_regex(terms)
-
     # Get all "section" tags that contain the child tag "code"
     for section in tree.xpath(f".//{namespace_prefix}:section[{namespace_prefix}:code]", namespaces=namespace_map):
         code_tag = section.find(f"{namespace_prefix}:code", namespaces=namespace_map)
@@ -44,26 +45,43 @@ def explore(xmlfile, terms, code_dict, term_dict):
         if code_info.total_occurrences == 0:
             code_info.display_name = code_tag.attrib.get('displayName')
 
-        has_matching = False
-        for text in section.itertext():
-            # Find all matches in the text content using regex
-            matches = re.findall(regex_pattern, text)
-            if matches:
-                has_matching = True
+        # Segment the text of the section once, and find the terms of each sentence.
+        # The whitespace is collapsed first, as a sentence wrapped over several
+        # lines of the XML would otherwise be split at every line break.
+        text = " ".join("".join(section.itertext()).split())
+        matches = vocabulary.findInSentences(text, segmentSentences(text))
 
-            # Increase the occurrences in the term_dict for each match
-            for match in matches:
-                term_dict[match] += 1
-                code_dict[code].term_dist[match] += 1
+        # Increase the occurrences in the term_dict for each match
+        for match, category in matches:
+            term_dict[match] += 1
+            code_dict[code].term_dist[match] += 1
+            code_dict[code].category_dist[category] += 1
 
-        if has_matching:
+        if matches:
             code_dict[code].increment_matching()
         code_dict[code].increment_total()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Explore XML files and generate statistical data.")
-    parser.add_argument("xml_directory", type=str, help="Path to the directory containing XML files.")
-    parser.add_argument("terms_file", type=str, help="Path to the file containing terms.")
+    parser.add_argument(
+        "xml_directory",
+        type=str,
+        help="Path to the directory containing XML files, or the shard directory "
+        "of dm_parser.",
+    )
+    parser.add_argument(
+        "terms_file",
+        type=str,
+        help="Path to the file containing terms, one per line (.txt) or grouped "
+        "by category (.json).",
+    )
+    parser.add_argument(
+        "--vocabulary-cache",
+        type=str,
+        default=os.path.join("result", "vocabulary.pickle"),
+        help="Path to the compiled vocabulary, reused while the terms file is "
+        "unchanged.",
+    )
     args = parser.parse_args()
 
     result_dir = "result"
@@ -74,18 +92,25 @@ if __name__ == "__main__":
     xml_dir = args.xml_directory
     terms_fname = args.terms_file
 
-    terms = []
-    with open(terms_fname) as file:
-        terms = [line.rstrip() for line in file]
+    vocabulary = compileVocabulary(terms_fname, args.vocabulary_cache)
 
     code_dict = defaultdict(CodeInfo)
     term_dict = defaultdict(int)
 
     print("Exploring the code section for terms...")
     num_files = 0
-    for xmlfile in [os.path.join(xml_dir, f) for f in os.listdir(xml_dir)]:
-        explore(xmlfile, terms, code_dict, term_dict)
-        num_files += 1
+    if ShardStore.isShardDirectory(xml_dir):
+        with ShardStore(xml_dir) as store:
+            for entry, xml_bytes in store.scan():
+                explore(io.BytesIO(xml_bytes), vocabulary, code_dict, term_dict)
+                num_files += 1
+    else:
+        with os.scandir(xml_dir) as it:
+            for entry in it:
+                # the files may be plain, gzipped or zstd compressed XML
+                xml_file = io.BytesIO(readFile(entry.path))
+                explore(xml_file, vocabulary, code_dict, term_dict)
+                num_files += 1
 
     print(f"Completed. Total of {num_files} file(s) scanned.")
     print(f'Writing the statistical data in the folder "{result_dir}"...')
@@ -108,19 +133,39 @@ if __name__ == "__main__":
         } for (code_val, code_info) in sorted_code_list)
 
     with open(code_occr_dist_file, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, ['code', 'display name', '# of occurrence', '# of match', 'distribution of terms'])
+        writer = csv.DictWriter(csvfile, [
+            'code', 'display name', '# of occurrence', '# of match',
+            'distribution of terms', 'distribution of categories'
+        ])
         writer.writeheader()
         writer.writerows({
             'code': code_val, 
             'display name': code_info.display_name, 
             '# of occurrence': code_info.total_occurrences, 
             '# of match': code_info.matching_occurrences, 
-            'distribution of terms': '\n'.join([f'{occr}:\t {term}' for (term, occr) in sorted(code_info.term_dist.items(), key=lambda item: item[1], reverse=True)])
+            'distribution of terms': '\n'.join([
+                f'{occr}:\t {term}' for (term, occr) in
+                sorted(
+                    code_info.term_dist.items(), key=lambda item: item[1], reverse=True
+                )
+            ]),
+            'distribution of categories': '\n'.join([
+                f'{occr}:\t {category or ""}' for (category, occr) in
+                sorted(
+                    code_info.category_dist.items(),
+                    key=lambda item: item[1],
+                    reverse=True,
+                )
+            ])
         } for (code_val, code_info) in sorted_code_list)
 
     with open(term_occr_file, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, ['term', '# of occurrence'])
+        writer = csv.DictWriter(csvfile, ['term', 'category', '# of occurrence'])
         writer.writeheader()
-        writer.writerows({'term': term, '# of occurrence': occr} for (term, occr) in sorted_term_list)
+        writer.writerows({
+            'term': term,
+            'category': vocabulary.category(term) or '',
+            '# of occurrence': occr
+        } for (term, occr) in sorted_term_list)
 
     print("Completed.")
\ No newline at end of file
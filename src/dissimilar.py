@@ -1,54 +1,159 @@
 import argparse
+import os
+import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from feature_store import FeatureStore, computeNeighbours, hashTexts
+from embeddings import (
+    ANN_BACKENDS, DEFAULT_MODEL, computeEmbeddings, denseNeighbours, resolveBackend
+)
 
-def create_gold_standard_dataset(df, similarity_threshold):
-    print("Vectorizing text...")
+def compute_features(texts, store=None):
+    # Reuse the features of the same texts from the store, if any
     vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(df['text'])
+    key = hashTexts(texts, repr(sorted(vectorizer.get_params().items())))
+    if store is not None and store.has(key):
+        print("Loading features from the feature store...")
+        tfidf_matrix, _, _ = store.load(key)
+        return tfidf_matrix, key
+
+    print("Vectorizing text...")
+    tfidf_matrix = vectorizer.fit_transform(texts)
+    if store is not None:
+        store.save(key, tfidf_matrix, vectorizer)
+    return tfidf_matrix, key
+
+def compute_neighbours(texts, min_threshold, store=None):
+    tfidf_matrix, key = compute_features(texts, store)
 
     print("Calculating cosine similarities...")
-    cosine_similarities = cosine_similarity(tfidf_matrix, tfidf_matrix)
+    if store is not None:
+        return store.neighbours(key, tfidf_matrix, min_threshold)
+    return computeNeighbours(tfidf_matrix, min_threshold)
+
+def compute_dense_neighbours(texts, min_threshold, store=None, model=DEFAULT_MODEL,
+                             backend='auto', k=32, batch_size=32):
+    # Reuse the embeddings of the same texts, from plot.py or a previous run
+    embeddings, key = computeEmbeddings(texts, model, store, batch_size)
+
+    print("Searching nearest neighbours...")
+    backend = resolveBackend(backend)
+
+    def compute(matrix, threshold):
+        return denseNeighbours(matrix, threshold, k, backend)
+
+    if store is not None:
+        name = 'dense_exact' if backend == 'exact' else f'dense_{backend}_{k}'
+        return store.neighbours(key, embeddings, min_threshold, compute, name)
+    return compute(embeddings, min_threshold)
+
+def find_neighbours(texts, min_threshold, store=None, mode='tfidf', dense_options=None):
+    # Lexical similarities of TF-IDF features, or semantic ones of embeddings
+    if mode == 'dense':
+        return compute_dense_neighbours(
+            texts, min_threshold, store, **(dense_options or {})
+        )
+    return compute_neighbours(texts, min_threshold, store)
+
+def select_dissimilar(neighbours, similarity_threshold):
+    # Keep each paragraph unless a paragraph kept before it is similar to it
+    removed = np.zeros(neighbours.shape[0], dtype=bool)
+    indptr, indices, sims = neighbours.indptr, neighbours.indices, neighbours.data
+    for i in range(neighbours.shape[0]):
+        if not removed[i]:
+            start, end = indptr[i], indptr[i + 1]
+            removed[indices[start:end][sims[start:end] >= similarity_threshold]] = True
+    return np.flatnonzero(removed)
+
+def create_gold_standard_dataset(df, similarity_threshold, store=None, mode='tfidf',
+                                 dense_options=None):
+    neighbours = find_neighbours(
+        df['text'], similarity_threshold, store, mode, dense_options
+    )
 
     print("Finding similar paragraphs...")
-    selected_indices = set()
-
-    for i in range(len(cosine_similarities)):
-        if i not in selected_indices:
-            similar_indices = set(
-                idx for idx, sim in enumerate(cosine_similarities[i])
-                if sim >= similarity_threshold and idx != i
-            )
-            selected_indices.update(similar_indices)
-    
+    selected_indices = select_dissimilar(neighbours, similarity_threshold)
+
     # Drop selected paragraphs
-    df.drop(index=selected_indices, inplace=True)
-    
+    df.drop(index=df.index[selected_indices], inplace=True)
+
+def sweep_thresholds(df, similarity_thresholds, store=None, mode='tfidf',
+                     dense_options=None):
+    # The similarities are computed once, down to the lowest threshold
+    neighbours = find_neighbours(
+        df['text'], min(similarity_thresholds), store, mode, dense_options
+    )
+
+    print("Finding similar paragraphs...")
+    return {
+        threshold: select_dissimilar(neighbours, threshold)
+        for threshold in similarity_thresholds
+    }
+
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Generate a gold standard dataset by removing similar paragraphs from a CSV file.")
+    parser = argparse.ArgumentParser(
+        description="Generate a gold standard dataset by removing similar "
+        "paragraphs from a CSV file.")
     parser.add_argument("input_csv", type=str, help="Path to the input CSV file.")
-    parser.add_argument("similarity_threshold", type=float, help="Threshold for cosine similarity.")
-    parser.add_argument("output_csv", type=str, help="Path to the output CSV file.")
+    parser.add_argument(
+        "similarity_threshold", type=str,
+        help="Threshold for cosine similarity, or a comma-separated list of "
+        "thresholds to sweep.")
+    parser.add_argument(
+        "output_csv", type=str,
+        help="Path to the output CSV file. With several thresholds, one file is "
+        "written per threshold, suffixed with the threshold.")
+    parser.add_argument(
+        "--features", type=str, default=None,
+        help="Directory of the feature store, to reuse the features, embeddings "
+        "and similarities of previous runs on the same texts.")
+    parser.add_argument(
+        "--mode", choices=['tfidf', 'dense'], default='tfidf',
+        help="Compare TF-IDF features (lexical near-duplicates) or sentence "
+        "embeddings (semantic near-duplicates).")
+    parser.add_argument(
+        "--model", type=str, default=DEFAULT_MODEL,
+        help="SentenceTransformer model of the dense mode.")
+    parser.add_argument(
+        "--ann", choices=ANN_BACKENDS, default='auto',
+        help="Nearest neighbour search of the dense mode: an HNSW index of "
+        "hnswlib or faiss, or an exact search. auto uses the first one installed.")
+    parser.add_argument(
+        "--neighbours", type=int, default=32,
+        help="Number of nearest neighbours searched per paragraph by the HNSW index.")
+    parser.add_argument(
+        "--batch-size", type=int, default=32,
+        help="Number of paragraphs encoded at once in the dense mode.")
     args = parser.parse_args()
 
+    thresholds = [float(t) for t in args.similarity_threshold.split(",")]
+    store = FeatureStore(args.features) if args.features else None
+
     print("Loading CSV file...")
     df = pd.read_csv(args.input_csv)
     total_paragraphs = len(df)
 
     print("Applying gold standard dataset creation...")
-    create_gold_standard_dataset(df, args.similarity_threshold)
-
-    num_retained_paragraphs = len(df)
-    num_removed_paragraphs = total_paragraphs - num_retained_paragraphs
-    percent_removed = (num_removed_paragraphs / total_paragraphs) * 100
-
-    print("Writing dissimilar paragraphs to output CSV...")
-    df.to_csv(args.output_csv, index=False)
+    dense_options = {
+        'model': args.model, 'backend': args.ann, 'k': args.neighbours,
+        'batch_size': args.batch_size,
+    }
+    removed = sweep_thresholds(df, thresholds, store, args.mode, dense_options)
 
     print("\nSummary:")
     print(f"Total paragraphs: {total_paragraphs}")
-    print(f"Retained paragraphs: {num_retained_paragraphs}")
-    print(f"Removed paragraphs: {num_removed_paragraphs}")
-    print(f"Percentage removed: {percent_removed:.2f}%")
-    print("Done!")
\ No newline at end of file
+    root, ext = os.path.splitext(args.output_csv)
+    for threshold, selected_indices in removed.items():
+        num_removed_paragraphs = len(selected_indices)
+        num_retained_paragraphs = total_paragraphs - num_removed_paragraphs
+        percent_removed = (num_removed_paragraphs / total_paragraphs) * 100
+
+        output_csv = (
+            args.output_csv if len(thresholds) == 1 else f"{root}-{threshold}{ext}"
+        )
+        df.drop(index=df.index[selected_indices]).to_csv(output_csv, index=False)
+
+        print(f"Threshold {threshold}: retained {num_retained_paragraphs}, "
+              f"removed {num_removed_paragraphs} ({percent_removed:.2f}%), "
+              f"written to {output_csv}")
+    print("Done!")
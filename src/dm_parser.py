@@ -1,60 +1,154 @@
+import io
 import os
 import sys
 import argparse
-import requests
-import gzip
-import csv
-import yaml
 import time
+import threading
 from datetime import date
+from typing import Iterable
 import shutil
 import zipfile
 import hashlib
-from bs4 import BeautifulSoup
-from FileMetadata import FileMetadata
+import json
+import socket
+from FileMetadata import FileMetadata, loadYaml
+from run_metrics import RunMetrics, Profiler
+from parse_cache import ParseCache
+from shard_store import ShardStore, ShardWriter, sniffSetId
+from pipeline_state import PipelineState
+from search_index import SearchIndex, buildFromCSV
+from sentences import segmentSentences, formatSpans
+from release_diff import diffIndications, readRecord, writeRecord
+from work_queue import LeaseLost, LeaseQueue
+from spl_codec import EXTENSIONS, parseCodec, readFile
+from indication_record import (
+    INDICATION_FIELDS,
+    IndicationColumns,
+    IndicationRecord,
+    fromRow,
+    readRecords,
+    validateRecords,
+    writeRecords,
+)
+from prefetch import prefetch
+from release_manifest import (
+    memberEntry,
+    readManifestHeader,
+    readReleaseManifest,
+    readXml,
+    readZip,
+    releaseStat,
+    writeReleaseManifest,
+    zipOffset,
+)
 import re
 
+# bs4, yaml and requests are imported when first used, so that importing this
+# module stays fast
 
-def constructor(loader, node):
-    fields = loader.construct_mapping(node)
-    return FileMetadata(**fields)
+data_source = "dailymed"
 
+# version of the indication extraction, to bump whenever parseIndications()
+# changes its output so that cached parse results are not reused
+EXTRACTOR_VERSION = "5"
 
-yaml.add_constructor("!FileMetadata", constructor)
+# LOINC code of the indications & usage section
+INDICATION_CODE = "34067-9"
 
 
-def progressbar(it, prefix="", size=60, out=sys.stdout):
+class LazyCount:
+    """
+    Counts items in a background thread, so that a progress bar can start
+    before a large directory or index has been fully enumerated.
+
+    Calling the object returns the count once it is known, None before.
+    """
+
+    def __init__(self, counter):
+        self.count = None
+        self.thread = threading.Thread(target=self.run, args=(counter,), daemon=True)
+        self.thread.start()
+
+    def run(self, counter):
+        self.count = counter()
+
+    def __call__(self):
+        return self.count
+
+
+def formatDuration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def progressbar(it, prefix="", size=60, out=None, total=None, interval=0.2):
     """
         A progress bar.
 
+    The bar is redrawn at most every `interval` seconds, and shows the
+    throughput and, when the total is known, the estimated time remaining.
+
     Args:
         it: an iterable. anything that len() can be used on such as a list,
-            a dict, or range().
+            a dict, or range(), or a generator when total is given.
         prefix: text that appears to the left of the progress bar.
         size: the size of the progress bar in characters.
-        out: the stream to write to.
+        out: the stream to write to, the current sys.stdout by default.
+        total: the number of items, or a callable returning it or None while\
+            it is not known yet, such as a LazyCount. Defaults to len(it).
+        interval: the minimum number of seconds between two redraws.
 
     Returns:
         None
     """
-    count = len(it)
+    if out is None:
+        out = sys.stdout
+    if total is None and hasattr(it, "__len__"):
+        total = len(it)
+    start = time.monotonic()
 
     def show(j):
-        x = int(size * j / count)
-        print(
-            "{}[{}{}] {}/{}".format(prefix, "#" * x, "." * (size - x), j, count),
-            end="\r",
-            file=out,
-            flush=True,
-        )
+        count = total() if callable(total) else total
+        elapsed = time.monotonic() - start
+        rate = j / elapsed if elapsed > 0 else 0.0
+        if count is None:
+            bar = "?" * size
+            status = f"{j}/? {rate:.1f}/s"
+        else:
+            x = min(int(size * j / count), size) if count else size
+            bar = "#" * x + "." * (size - x)
+            eta = (count - j) / rate if rate > 0 else 0
+            status = f"{j}/{count} {rate:.1f}/s ETA {formatDuration(eta)}"
+        print(f"{prefix}[{bar}] {status}", end="\r", file=out, flush=True)
 
     show(0)
-    for i, item in enumerate(it):
+    last = start
+    j = 0
+    for j, item in enumerate(it, 1):
         yield item
-        show(i + 1)
+        now = time.monotonic()
+        if now - last >= interval:
+            show(j)
+            last = now
+    show(j)
     print("\n", flush=True, file=out)
 
 
+def scanDirectory(directory):
+    """Yields the files of a directory as FileMetadata, without listing the
+    whole directory first."""
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_file():
+                yield FileMetadata(filename=entry.name, filepath=entry.path)
+
+
+def countFiles(directory):
+    with os.scandir(directory) as it:
+        return sum(1 for entry in it if entry.is_file())
+
+
 def getScriptName():
     return os.path.basename(__file__)
 
@@ -83,7 +177,7 @@ def getMetadataFromFile(filepath: str) -> dict[str, FileMetadata]:
     try:
         f = open(filepath, "r")
         with f:
-            return yaml.full_load(f)  # yaml.load(f, Loader=SafeLoader)
+            return loadYaml().full_load(f)  # yaml.load(f, Loader=SafeLoader)
     except OSError:
         print(f"Unable to open/read {filepath}")
     return None
@@ -113,7 +207,7 @@ def addEntryToMetadataFile(
         f = open(metadata_filename, "r")
         with f:
             # metadata_dict = yaml.load(f, Loader=SafeLoader)
-            metadata_dict = yaml.full_load(f)
+            metadata_dict = loadYaml().full_load(f)
 
     except OSError:
         print(f"Unable to open/read {metadata_filename}")
@@ -122,36 +216,38 @@ def addEntryToMetadataFile(
     metadata_dict[filename] = metadata
     try:
         with open(metadata_filename, "w") as f:
-            yaml.dump(metadata_dict, f, default_flow_style=False)
+            loadYaml().dump(metadata_dict, f, default_flow_style=False)
     except OSError:
         print(f"Unable to write to {metadata_filename}")
     return metadata_dict
 
 
-def makeFileList():
-    """Generate a list of files to process. Parses command line argument (--files)
+def makeFileList(config):
+    """Generate a list of files to process. Uses the files option (--files)
         or generates from preset Dailymed file names.
 
+    Args:
+        config: (argparse.Namespace) : The configuration, see makeConfig()
+
     Returns:
         dict:Dictionary containing FileMetadata descriptions of files
     """
     files = {}
-    args = argParser.parse_args()
-    if args.files in ["all", "prescription", "otc"]:
-        if args.files in ["all", "prescription"]:
+    if config.files in ["all", "prescription", "otc"]:
+        if config.files in ["all", "prescription"]:
             for i in range(1, 6):
                 f = FileMetadata()
                 f.filename = f"dm_spl_release_human_rx_part{i}.zip"
                 f.status = "requested"
                 files[f.filename] = f
-        if args.files in ["all", "otc"]:
+        if config.files in ["all", "otc"]:
             for i in range(1, 10):
                 f = FileMetadata()
                 f.filename = f"dm_spl_release_human_otc_part{i}.zip"
                 f.status = "requested"
                 files[f.filename] = f
-    elif len(args.files) > 1:
-        file_list = args.files.split(",")
+    elif len(config.files) > 1:
+        file_list = config.files.split(",")
         for filename in file_list:
             f = FileMetadata()
             f.filename = filename
@@ -160,8 +256,33 @@ def makeFileList():
     return files
 
 
-def getPaths():
-    """Provides a list of of directories from the args-provided working directory.
+def makePaths(config):
+    """Names the directories of the configured working directory, see
+    getPaths(), without creating them.
+
+    Args:
+        config: (argparse.Namespace) : The configuration, see makeConfig()
+
+    Returns:
+        dict:Dictionary containing application paths
+    """
+    dirs = {}
+    dirs["working_dir"] = config.working_dir
+    dirs["download_dir"] = f"{config.working_dir}/download"
+    dirs["dated_download_dir"] = f"{config.working_dir}/download/{config.date}"
+    dirs["extraction_dir"] = f"{config.working_dir}/extract"
+    dirs["shard_dir"] = f"{config.working_dir}/shards"
+    dirs["state_dir"] = f"{config.working_dir}/state"
+    dirs["result_dir"] = f"{config.working_dir}/results"
+    dirs["cache_dir"] = f"{config.working_dir}/cache"
+    dirs[
+        "download_metadata_filename"
+    ] = f"{config.working_dir}/download/files.meta.yaml"
+    return dirs
+
+
+def getPaths(config):
+    """Provides a list of of directories from the configured working directory.
     It names and creates the follwoing directories
     * working_dir = working directory
     * download_dir = base directory for all downloads
@@ -169,27 +290,21 @@ def getPaths():
     * extraction_dir = a directory to contain zip-extracted files
     * result_dir = a directory to contain the results of the application
 
+    Args:
+        config: (argparse.Namespace) : The configuration, see makeConfig()
+
     Returns:
         dict:Dictionary containing application paths
     """
-    args = argParser.parse_args()
-    dirs = {}
-    dirs["working_dir"] = args.working_dir
-    dirs["download_dir"] = f"{args.working_dir}/download"
-    dirs["dated_download_dir"] = f"{args.working_dir}/download/{args.date}"
-    dirs["extraction_dir"] = f"{args.working_dir}/extract"
-    dirs["result_dir"] = f"{args.working_dir}/results"
-
+    dirs = makePaths(config)
     os.makedirs(dirs["download_dir"], exist_ok=True)
     os.makedirs(dirs["extraction_dir"], exist_ok=True)
     os.makedirs(dirs["result_dir"], exist_ok=True)
     # we don't create dated download dir until we need it.
-
-    dirs["download_metadata_filename"] = f"{args.working_dir}/download/files.meta.yaml"
     return dirs
 
 
-def checkFiles(files: dict[str, FileMetadata]) -> dict[str, FileMetadata]:
+def checkFiles(files: dict[str, FileMetadata], config) -> dict[str, FileMetadata]:
     """
     A function to check whether there is existing metadata in the specified directory,\
         and if so, return the input dict with the read object.
@@ -197,13 +312,13 @@ def checkFiles(files: dict[str, FileMetadata]) -> dict[str, FileMetadata]:
     Args:
         files: (Dict[str, FileMetadata]) : A dictionary with filename as string key\
             and FileMetadata values
+        config: (argparse.Namespace) : The configuration, see makeConfig()
 
     Return:
         Dict[str, FileMetadata]: A dictionary with filenames as string key \
             and FileMetadata as values
     """
-    argParser.parse_args()
-    paths = getPaths()
+    paths = getPaths(config)
     download_metadata = getMetadataFromFile(paths["download_metadata_filename"])
 
     for filename in files:
@@ -215,7 +330,7 @@ def checkFiles(files: dict[str, FileMetadata]) -> dict[str, FileMetadata]:
             try:
                 f = open(file_metadata_filename, "r")
                 with f:
-                    all_files_metadata = yaml.full_load(f)
+                    all_files_metadata = loadYaml().full_load(f)
 
                     try:
                         f_metadata = all_files_metadata[filename]
@@ -275,7 +390,9 @@ def computeMD5Hash(filepath: str):
         return md5_returned
 
 
-def download(files: dict[str, FileMetadata]) -> dict[str, FileMetadata]:
+def download(
+    files: dict[str, FileMetadata], config, metrics=None
+) -> dict[str, FileMetadata]:
     """
     Download the Dailymed release files.
 
@@ -285,11 +402,17 @@ def download(files: dict[str, FileMetadata]) -> dict[str, FileMetadata]:
     Args:
         files: (Dict[str, FileMetadata]) : A dictionary with filename as string key\
             and FileMetadata values
+        config: (argparse.Namespace) : The configuration, see makeConfig()
+        metrics: (RunMetrics) : The telemetry of the run, none by default
 
     Return:
         dict[str, FileMetadata] Updated files and their metadata
     """
-    paths = getPaths()
+    if metrics is None:
+        metrics = RunMetrics()
+    import requests
+
+    paths = getPaths(config)
 
     for filename in files:
         file_metadata = files[filename]
@@ -310,7 +433,7 @@ def download(files: dict[str, FileMetadata]) -> dict[str, FileMetadata]:
         if remote_etag is not None and remote_etag == file_metadata.etag:
             # we already have this file
             print(f"Most recent eTag of {filename} is same as remote version")
-            if args.force is True:
+            if config.force is True:
                 print("Forcing download as commanded")
             else:
                 if file_metadata.filepath != "":
@@ -327,9 +450,12 @@ def download(files: dict[str, FileMetadata]) -> dict[str, FileMetadata]:
 
         # Retrieve and save the file
         os.makedirs(dated_download_dir, exist_ok=True)
-        with requests.get(url, stream=True) as r:
-            with open(local_file_path, "wb") as f:
-                shutil.copyfileobj(r.raw, f)
+        with metrics.timer("download", "network"):
+            with requests.get(url, stream=True) as r:
+                with open(local_file_path, "wb") as f:
+                    shutil.copyfileobj(r.raw, f)
+        metrics.count("download", "files")
+        metrics.count("download", "bytes_in", os.path.getsize(local_file_path))
 
         # create file metadata
         metadata = FileMetadata()
@@ -340,7 +466,8 @@ def download(files: dict[str, FileMetadata]) -> dict[str, FileMetadata]:
         metadata.originUrl = url
         metadata.originOrg = data_source
         metadata.script = getScriptName()
-        metadata.md5 = computeMD5Hash(local_file_path)
+        with metrics.timer("download", "md5"):
+            metadata.md5 = computeMD5Hash(local_file_path)
 
         files[filename] = metadata
 
@@ -354,25 +481,139 @@ def download(files: dict[str, FileMetadata]) -> dict[str, FileMetadata]:
     return files
 
 
-def extract(files):
+def releaseFingerprint(metadata: FileMetadata) -> str:
+    """
+    Identifies the content of a release file by its ETag, its MD5 or, for
+    files that were not downloaded by this script, its size and mtime.
+    """
+    if metadata.etag is not None:
+        return f"etag:{metadata.etag}"
+    if metadata.md5 is not None:
+        return f"md5:{metadata.md5}"
+    return f"stat:{releaseStat(metadata.filepath)}"
+
+
+def writeExtractManifest(
+    manifest_filename: str, xml_files: dict[str, FileMetadata]
+) -> str:
+    """
+    Writes the list of XML files extracted from a release file.
+
+    Args:
+        manifest_filename: (str) : The path of the manifest
+        xml_files: (Dict[str, FileMetadata]) : The extracted files
+
+    Return:
+        str The MD5 of the manifest, which fingerprints the extraction
+    """
+    with open(manifest_filename, "w") as f:
+        for key, m in xml_files.items():
+            offset = "" if m.offset is None else m.offset
+            f.write(
+                f"{key}\t{m.filename}\t{m.filepath}\t{offset}\t{m.length}\t{m.md5}\n"
+            )
+    return computeMD5Hash(manifest_filename)
+
+
+def readExtractManifest(manifest_filename: str, source: str) -> dict[str, FileMetadata]:
+    """
+    Reads the list of XML files extracted from a release file.
+
+    Args:
+        manifest_filename: (str) : The path of the manifest
+        source: (str) : The release file the XML files were extracted from
+
+    Return:
+        dict[str, FileMetadata] The extracted files and their metadata
+    """
+    xml_files = {}
+    with open(manifest_filename, "r") as f:
+        for line in f:
+            key, filename, filepath, offset, length, md5 = line.rstrip("\n").split("\t")
+            xml_files[key] = FileMetadata(
+                filename=filename,
+                filepath=filepath,
+                offset=int(offset) if offset != "" else None,
+                length=int(length),
+                md5=md5,
+                source=source,
+            )
+    return xml_files
+
+
+def readExtractManifests(
+    files: dict[str, FileMetadata], paths: dict
+) -> dict[str, FileMetadata]:
+    """
+    Reads the lists of XML files previously extracted from the release files.
+
+    Args:
+        files: (Dict[str, FileMetadata]) : The release files
+        paths: (dict) : The application paths, see getPaths()
+
+    Return:
+        dict[str, FileMetadata] The extracted files of every release file that\
+            has an extraction manifest
+    """
+    xml_files = {}
+    for filename in files:
+        manifest_filename = f"{paths['state_dir']}/{filename}.extract.tsv"
+        if os.path.exists(manifest_filename):
+            xml_files.update(readExtractManifest(manifest_filename, filename))
+    return xml_files
+
+
+def extract(
+    files,
+    paths,
+    store="files",
+    shard_size=1024,
+    state=None,
+    codec="gzip:9",
+    threads=4,
+    queue_depth=64,
+    metrics=None,
+    check_lease=None,
+):
     """
     This function will extract all XML files contained in zip files
       to the extraction directory
 
     Each release zip file contains a set of SPL specific zip files.
     Within each SPL zip file, there contains one xml file. We then
-    extract this xml file as a gzipped file into the target directory
+    extract this xml file as a compressed file into the target directory,
+    or, with the shards store, append it to the indexed shards of its
+    release file in the shard directory
+
+    The XML files extracted from each release file are listed in a manifest
+    in the state directory. With a pipeline state, a release file whose
+    ETag (or MD5) has not changed since its last extraction is skipped and
+    its XML files are read from that manifest.
 
     Args:
         files: (Dict[str, FileMetadata]) : A dictionary with filename as string key\
             and FileMetadata values
+        paths: (dict) : The application paths, see getPaths()
+        store: (str) : files for one gzipped file per XML, shards for a few\
+            large indexed shard files per release file
+        shard_size: (int) : The size in MB at which a new shard is started
+        state: (PipelineState) : The optional record of previous runs
+        codec: (str) : The compression of the extracted files, gzip[:level],\
+            zstd[:level] or none
+        threads: (int) : The number of threads reading and compressing the\
+            SPL zip files ahead of the writes, 0 for none
+        queue_depth: (int) : The maximum number of SPL zip files read ahead
+        metrics: (RunMetrics) : The telemetry of the run, none by default
+        check_lease: (Callable) : Called before the outputs are written,\
+            raises LeaseLost to stop the work unit of a distributed run\
+            whose lease was lost, none by default
 
     Return:
-        dict[str, FileMetadata] A dictionary of gzipped XML files and their metadata
+        dict[str, FileMetadata] A dictionary of compressed XML files and their metadata
     """
-    paths = getPaths()
-    paths["download_dir"]
-    extraction_dir = paths["extraction_dir"]
+    if metrics is None:
+        metrics = RunMetrics()
+    os.makedirs(paths["state_dir"], exist_ok=True)
 
     n_package_files = 0
     n_zip_files = 0
@@ -381,44 +622,49 @@ def extract(files):
 
     for filename in files:
         meta = files[filename]
-        zip_file_path = meta.filepath
-        with zipfile.ZipFile(zip_file_path, "r") as zf:
-            print(f"Processing {filename}")
-            n_package_files += 1
-            for f in progressbar(zf.namelist(), "Extracting: ", 40):
-                # if zip file, then open and extract xml file
-                if f.endswith(".zip"):
-                    with zf.open(f) as f2:
-                        n_zip_files += 1
-
-                        with zipfile.ZipFile(f2, "r") as zf2:
-                            xml_file_counter = 0
-                            for f3 in zf2.namelist():
-                                if f3.endswith(".xml"):
-                                    # zf2.extract(f3, extraction_dir)
-                                    xml_fp = zf2.open(f3)
-                                    gz_xml_filepath = f"{extraction_dir}/{f3}.gz"
-                                    with gzip.open(gz_xml_filepath, "wb") as gz_fp:
-                                        gz_fp.write(xml_fp.read())
-
-                                        xml_metadata = FileMetadata(
-                                            filename=f"{f3}.gz",
-                                            filepath=gz_xml_filepath,
-                                            dateCreated=getCurrentDate,
-                                            md5=computeMD5Hash(gz_xml_filepath),
-                                            script=getScriptName(),
-                                        )
-
-                                        xml_files[gz_xml_filepath] = xml_metadata
-
-                                    n_xml_files += 1
-
-                                    xml_file_counter += 1
-                                    if xml_file_counter > 1:
-                                        print(
-                                            f"Found {xml_file_counter} xml files for \
-                                                  {f}"
-                                        )
+        manifest_filename = f"{paths['state_dir']}/{filename}.extract.tsv"
+        input_fingerprint = f"{releaseFingerprint(meta)}:{store}:{codec}"
+        if state is not None and state.isFresh("extract", filename, input_fingerprint):
+            part_files = readExtractManifest(manifest_filename, filename)
+            # the extracted files or shards may have been deleted since
+            if all(
+                os.path.exists(path)
+                for path in {m.filepath for m in part_files.values()}
+            ):
+                print(f"{filename} is unchanged since its last extraction, skipping")
+                metrics.count("extract", "skipped_package_files")
+                xml_files.update(part_files)
+                continue
+            print(f"Files extracted from {filename} are missing, extracting again")
+
+        part_files, n_part_zip_files = extractRelease(
+            filename,
+            meta,
+            paths,
+            store,
+            shard_size,
+            parseCodec(codec),
+            threads,
+            queue_depth,
+            metrics,
+            check_lease,
+        )
+        n_package_files += 1
+        n_zip_files += n_part_zip_files
+        n_xml_files += len(part_files)
+        xml_files.update(part_files)
+
+        if check_lease is not None:
+            check_lease()
+        output_fingerprint = writeExtractManifest(manifest_filename, part_files)
+        if state is not None:
+            state.record(
+                "extract",
+                filename,
+                input_fingerprint,
+                output_fingerprint,
+                [manifest_filename],
+            )
 
     print("Number of package zip file(s): " + str(n_package_files))
     print("Number of extracted zip file(s): " + str(n_zip_files))
@@ -426,78 +672,736 @@ def extract(files):
     return xml_files
 
 
-def process(xml_files):
+def extractRelease(
+    filename,
+    meta,
+    paths,
+    store="files",
+    shard_size=1024,
+    codec=None,
+    threads=4,
+    queue_depth=64,
+    metrics=None,
+    check_lease=None,
+):
+    """
+    Extracts the XML files of one release zip file.
+
+    The SPL zip files are read, decompressed, hashed and compressed again by
+    a pool of prefetch threads, while this thread writes the results in the
+    order of the release file.
+
+    The first extraction of a release file lists the offsets, sizes and CRC
+    of its SPL zip files and XML files, with their setId, in a member
+    manifest (state/<release file>.members.tsv). While the ETag or MD5 of
+    the release file is unchanged, later extractions read the SPL zip files
+    at these offsets, without reading the zip directories.
+
+    Args:
+        filename: (str) : The name of the release file
+        meta: (FileMetadata) : The metadata of the release file
+        paths: (dict) : The application paths
+        store: (str) : files or shards, see extract()
+        shard_size: (int) : The size in MB at which a new shard is started
+        codec: (Codec) : The compression of the extracted files, gzip:9 by\
+            default
+        threads: (int) : The number of prefetch threads, 0 for none
+        queue_depth: (int) : The maximum number of SPL zip files read ahead
+        metrics: (RunMetrics) : The telemetry of the run, none by default
+        check_lease: (Callable) : Called before every write, see extract()
+
+    Return:
+        tuple(dict[str, FileMetadata], int) The extracted XML files and their\
+            metadata, and the number of SPL zip files read
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    extraction_dir = paths["extraction_dir"]
+    xml_files = {}
+    n_zip_files = 0
+
+    if codec is None:
+        codec = parseCodec("gzip:9")
+    # extensions of the files of the other codecs, left by previous extractions
+    other_extensions = [e for e in EXTENSIONS.values() if e != codec.extension]
+    zip_file_path = meta.filepath
+    shard_writer = None
+    if store == "shards":
+        shard_writer = ShardWriter(
+            paths["shard_dir"],
+            os.path.splitext(filename)[0],
+            shard_size * 1024**2,
+            codec,
+        )
+
+    def prepare(xml_bytes, timings):
+        # the hash of the XML content, which unlike the gzip file is stable
+        # across extractions
+        start = time.perf_counter()
+        md5 = hashlib.md5(xml_bytes).hexdigest()
+        middle = time.perf_counter()
+        member = codec.compress(xml_bytes)
+        timings["md5"] += middle - start
+        timings["compress"] += time.perf_counter() - middle
+        return md5, member
+
+    def scanZip(f):
+        # runs on a prefetch thread: zlib, zstd and hashlib release the GIL
+        timings = {"read": 0.0, "md5": 0.0, "compress": 0.0}
+        documents = []
+        start = time.perf_counter()
+        zip_info = zf.getinfo(f)
+        zip_bytes = zf.read(zip_info)
+        zip_offset = zipOffset(fd, zip_info)
+        with zipfile.ZipFile(io.BytesIO(zip_bytes), "r") as zf2:
+            for xml_info in zf2.infolist():
+                if xml_info.filename.endswith(".xml"):
+                    xml_bytes = zf2.read(xml_info)
+                    timings["read"] += time.perf_counter() - start
+                    entry = memberEntry(
+                        f,
+                        zip_offset,
+                        zip_info,
+                        zip_bytes,
+                        xml_info,
+                        sniffSetId(xml_bytes),
+                    )
+                    md5, member = prepare(xml_bytes, timings)
+                    documents.append((entry, len(xml_bytes), md5, member))
+                    start = time.perf_counter()
+        return documents, timings
+
+    def seekZip(entries):
+        # the documents of an SPL zip, read at their offsets in the manifest
+        timings = {"read": 0.0, "md5": 0.0, "compress": 0.0}
+        documents = []
+        start = time.perf_counter()
+        zip_bytes = readZip(fd, entries[0])
+        for entry in entries:
+            xml_bytes = readXml(zip_bytes, entry)
+            timings["read"] += time.perf_counter() - start
+            md5, member = prepare(xml_bytes, timings)
+            documents.append((entry, len(xml_bytes), md5, member))
+            start = time.perf_counter()
+        return documents, timings
+
+    print(f"Processing {filename}")
+    members_filename = f"{paths['state_dir']}/{filename}.members.tsv"
+    fingerprint = releaseFingerprint(meta)
+    entries = readReleaseManifest(members_filename, fingerprint)
+    zf = None
+    fd = os.open(zip_file_path, os.O_RDONLY)
+    try:
+        if entries is not None:
+            # seek to the SPL zip files instead of reading the directories of
+            # the release file and of every SPL zip
+            print(f"Reading the members listed in {members_filename}")
+            groups = {}
+            for entry in entries:
+                groups.setdefault(entry.zip_name, []).append(entry)
+            units, load = list(groups.values()), seekZip
+        else:
+            zf = zipfile.ZipFile(zip_file_path, "r")
+            # if zip file, then open and extract xml file
+            units, load = [f for f in zf.namelist() if f.endswith(".zip")], scanZip
+        release_entries = []
+        loaded = prefetch(units, load, threads, queue_depth)
+        for unit, result, error in progressbar(
+            loaded, "Extracting: ", 40, total=len(units)
+        ):
+            if error is not None:
+                raise error
+            documents, timings = result
+            n_zip_files += 1
+            metrics.count("extract", "zip_files")
+            for part, seconds in timings.items():
+                metrics.addTime("extract", part, seconds)
+
+            for entry, n_bytes, md5, member in documents:
+                if check_lease is not None:
+                    check_lease()
+                f3 = entry.xml_name
+                release_entries.append(entry)
+                xml_metadata = FileMetadata(
+                    filename=f"{f3}{codec.extension}",
+                    dateCreated=getCurrentDate(),
+                    md5=md5,
+                    script=getScriptName(),
+                    source=filename,
+                )
+
+                with metrics.timer("extract", "write"):
+                    if shard_writer is not None:
+                        shard_entry = shard_writer.addCompressed(
+                            f3, member, entry.set_id
+                        )
+                        xml_metadata.filepath = shard_entry.shard
+                        xml_metadata.offset = shard_entry.offset
+                        xml_metadata.length = shard_entry.length
+                        key = f"{shard_entry.shard}:{shard_entry.offset}"
+                    else:
+                        path = f"{extraction_dir}/{f3}"
+                        key = path + codec.extension
+                        with open(key, "wb") as out_fp:
+                            out_fp.write(member)
+                        for extension in other_extensions:
+                            if os.path.exists(path + extension):
+                                os.remove(path + extension)
+                        xml_metadata.filepath = key
+                        xml_metadata.length = len(member)
+
+                xml_files[key] = xml_metadata
+                metrics.count("extract", "files")
+                metrics.count("extract", "bytes_in", n_bytes)
+                metrics.count("extract", "bytes_out", xml_metadata.length)
+
+            if len(documents) > 1:
+                print(
+                    f"Found {len(documents)} xml files for {documents[0][0].zip_name}"
+                )
+    finally:
+        os.close(fd)
+        if zf is not None:
+            zf.close()
+    if check_lease is not None:
+        check_lease()
+    header = readManifestHeader(members_filename)
+    if (
+        entries is None
+        or header.release_path != zip_file_path
+        or header.release_stat != releaseStat(zip_file_path)
+    ):
+        # the release file is new, or was moved or copied since its manifest
+        writeReleaseManifest(
+            members_filename, fingerprint, release_entries, zip_file_path
+        )
+    if shard_writer is not None:
+        shard_writer.close()
+    return xml_files, n_zip_files
+
+
+# elements that start a new line in the text of a section
+BLOCK_ELEMENTS = {"title", "paragraph", "item", "caption", "tr", "section", "br"}
+CELL_ELEMENTS = {"td", "th"}
+WHITESPACE = re.compile(r"\s+")
+NEWLINE_SPACES = re.compile(r" *\n[ \n]*")
+
+
+def sectionText(section) -> str:
+    """
+    Assembles the text of a section in a single walk over its elements.
+
+    Inline whitespace is collapsed to single spaces as strings are visited,
+    and titles, paragraphs, list items, captions, table rows and subsections
+    each start on a new line, as does the text after a line break. The cells
+    of a row are separated by a space.
+
+    Args:
+        section: (Tag) : The section element
+
+    Return:
+        str The text of the section
+    """
+    from bs4.element import NavigableString, Comment, Declaration, Doctype
+    from bs4.element import ProcessingInstruction
+
+    skipped_strings = (Comment, Declaration, Doctype, ProcessingInstruction)
+    parts = []
+    for node in section.descendants:
+        if isinstance(node, NavigableString):
+            if not isinstance(node, skipped_strings):
+                parts.append(WHITESPACE.sub(" ", node))
+        elif node.name in BLOCK_ELEMENTS:
+            parts.append("\n")
+        elif node.name in CELL_ELEMENTS:
+            parts.append(" ")
+    return NEWLINE_SPACES.sub("\n", "".join(parts)).strip()
+
+
+def parseIndications(xml_string: bytes) -> list[IndicationRecord]:
+    """
+    Parses an SPL document and returns a record for each indication section.
+
+    Args:
+        xml_string: (bytes) : The content of the XML file
+
+    Return:
+        list[IndicationRecord] The records of the indication sections
+    """
+    from bs4 import BeautifulSoup
+
+    indications = []
+    soup = BeautifulSoup(xml_string, "xml")
+
+    set_id = soup.setId["root"]
+    xml_id = soup.id["root"]
+    version_number = int(soup.versionNumber["value"])
+
+    for section in soup.find_all("section"):
+        # only the section that owns the code, not its enclosing sections
+        code = section.find("code", recursive=False)
+        if code is None or code.get("code") != INDICATION_CODE:
+            continue
+        text = sectionText(section)
+        record = IndicationRecord(
+            set_id,
+            xml_id,
+            version_number,
+            "indication",
+            len(text),
+            text,
+            # the sentences are segmented once here, as start:end offsets
+            formatSpans(segmentSentences(text)),
+        )
+        indications.append(record)
+    return indications
+
+
+def readQuarantine(quarantine_filename: str) -> dict[str, FileMetadata]:
+    """
+    Reads the quarantine manifest of a previous run.
+
+    Args:
+        quarantine_filename: (str) : The path to the quarantine manifest
+
+    Return:
+        dict[str, FileMetadata] The quarantined files and their metadata
+    """
+    files = {}
+    try:
+        with open(quarantine_filename, "r") as f:
+            for line in f:
+                entry = json.loads(line)
+                metadata = FileMetadata(
+                    filename=entry["filename"],
+                    filepath=entry["filepath"],
+                    status="quarantined",
+                )
+                if entry.get("length") is not None:
+                    metadata.offset = entry["offset"]
+                    metadata.length = entry["length"]
+                metadata.source = entry.get("source")
+                files[f"{entry['filepath']}:{entry['offset']}"] = metadata
+    except OSError:
+        print(f"Unable to open/read {quarantine_filename}")
+    return files
+
+
+def readXML(metadata: FileMetadata, shards: ShardStore) -> bytes:
+    """
+    Reads the content of an extracted XML file, from its own file or from the
+    shard containing it, whatever its codec.
+
+    Args:
+        metadata: (FileMetadata) : The metadata of the extracted file
+        shards: (ShardStore) : The store used to read shards
+
+    Return:
+        bytes The XML content
+    """
+    if metadata.offset is not None:
+        return shards.read(metadata.filepath, metadata.offset, metadata.length)
+    return readFile(metadata.filepath)
+
+
+def writeIndications(
+    filename: str, indications: Iterable[IndicationRecord], append=False
+):
+    """
+    Writes indication records to a CSV file.
+
+    Args:
+        filename: (str) : The CSV file
+        indications: (Iterable[IndicationRecord]) : The records, such as\
+            IndicationColumns
+        append: (bool) : Append the records to the file if it exists
+    """
+    append = append and os.path.exists(filename)
+    # a new file replaces the previous one at once, so that concurrent
+    # readers and writers of the same results never see a partial file
+    tmp_filename = filename if append else f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "a" if append else "w") as csvfile:
+        writeRecords(csvfile, indications, header=not append)
+    if not append:
+        os.replace(tmp_filename, filename)
+
+
+def mergeParts(parts_dir: str, indications_filename: str, sources=None):
+    """
+    Concatenates the indications of processed release files into a single
+    CSV file. Given the release files of a run, the parts of other release
+    files, left in the parts directory by previous runs, are not merged.
+
+    Args:
+        parts_dir: (str) : The directory of the per release file CSV files
+        indications_filename: (str) : The merged CSV file
+        sources: (Iterable[str]) : The release files of the run, all the\
+            parts in the directory by default
+    """
+    if sources is None:
+        parts = [part for part in os.listdir(parts_dir) if part.endswith(".csv")]
+    else:
+        parts = [f"{source}.csv" for source in sources]
+    tmp_filename = f"{indications_filename}.tmp"
+    with open(tmp_filename, "w") as out:
+        out.write(",".join(INDICATION_FIELDS) + "\n")
+        for part in sorted(parts):
+            if os.path.exists(f"{parts_dir}/{part}"):
+                with open(f"{parts_dir}/{part}", "r") as f:
+                    f.readline()
+                    shutil.copyfileobj(f, out)
+    os.replace(tmp_filename, indications_filename)
+
+
+def processFiles(
+    files,
+    shards,
+    quarantine,
+    cache=None,
+    prefix="Processing: ",
+    total=None,
+    search_index=None,
+    threads=4,
+    queue_depth=64,
+    metrics=None,
+    check_lease=None,
+):
+    """
+    Parses a group of XML files, quarantining the ones that fail.
+
+    Args:
+        files: (Iterable[FileMetadata]) : The XML files to process
+        shards: (ShardStore) : The store used to read shards
+        quarantine: (file) : The open quarantine manifest
+        cache: (ParseCache) : An optional cache of parse results
+        prefix: (str) : The label of the progress bar
+        total: (int) : The number of files, or a LazyCount
+        search_index: (SearchIndex) : An optional full-text index updated with the\
+            rows of every document
+        threads: (int) : The number of threads reading and decompressing the\
+            files ahead of the parser, 0 for none
+        queue_depth: (int) : The maximum number of files read ahead
+        metrics: (RunMetrics) : The telemetry of the run, none by default
+        check_lease: (Callable) : Called before every document, see process()
+
+    Return:
+        tuple(IndicationColumns, int) The indication records and the number\
+            of quarantined files
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    indications = IndicationColumns()
+    n_quarantined = 0
+
+    def lookup():
+        # the cache is only used from this thread
+        for metadata in files:
+            rows = None
+            if cache is not None and metadata.md5 is not None:
+                rows = cache.get(metadata.md5)
+                if rows is not None:
+                    rows = [fromRow(row) for row in rows]
+            yield metadata, rows
+
+    def load(item):
+        # runs on a prefetch thread: file reads and zlib release the GIL
+        metadata, rows = item
+        if rows is not None:
+            return None, 0.0
+        start = time.perf_counter()
+        xml_string = readXML(metadata, shards)
+        return xml_string, time.perf_counter() - start
+
+    if total is None and hasattr(files, "__len__"):
+        total = len(files)
+    loaded = prefetch(lookup(), load, threads, queue_depth)
+    for index, (item, result, error) in enumerate(
+        progressbar(loaded, prefix, 40, total=total)
+    ):
+        metadata, rows = item
+        path = metadata.filepath
+        if check_lease is not None:
+            check_lease()
+
+        metrics.count("process", "files")
+        md5 = metadata.md5
+
+        try:
+            if error is not None:
+                raise error
+            if rows is None:
+                xml_string, seconds = result
+                metrics.addTime("process", "io", seconds)
+                metrics.count("process", "bytes_in", len(xml_string))
+                if cache is not None and md5 is None:
+                    md5 = hashlib.md5(xml_string).hexdigest()
+                    rows = cache.get(md5)
+                    if rows is not None:
+                        rows = [fromRow(row) for row in rows]
+
+            if rows is None:
+                with metrics.timer("process", "parse"):
+                    rows = parseIndications(xml_string)
+                    validateRecords(rows)
+                if cache is not None:
+                    cache.put(md5, rows)
+        except Exception as e:
+            metrics.count("process", "parse_failures")
+            n_quarantined += 1
+            entry = {
+                "filename": metadata.filename,
+                "filepath": path,
+                "offset": metadata.offset or 0,
+                "length": metadata.length if metadata.offset is not None else None,
+                "source": metadata.source,
+                "index": index,
+                "exception": type(e).__name__,
+                "message": str(e),
+                "date": getCurrentDate(),
+            }
+            quarantine.write(json.dumps(entry) + "\n")
+            quarantine.flush()
+            continue
+
+        indications.extend(rows)
+        metrics.count("process", "rows", len(rows))
+        if search_index is not None:
+            with metrics.timer("process", "index"):
+                search_index.addRows(rows)
+    return indications, n_quarantined
+
+
+def process(
+    xml_files,
+    paths,
+    retry_quarantine=False,
+    cache=None,
+    store="files",
+    state=None,
+    index=None,
+    quarantine_filename=None,
+    merge=True,
+    threads=4,
+    queue_depth=64,
+    metrics=None,
+    check_lease=None,
+    records=None,
+    write=True,
+):
     """
     This function will process XML files to extract the indication section
     and produce a CSV file with the SetId, XMLId, Version#, length of text \
     and the indication section
 
+    A document that cannot be read or parsed does not stop the run. It is
+    recorded in the quarantine manifest (results/quarantine.jsonl) with its
+    path, offset and exception, and the next document is processed.
+
+    XML files that come from a known release file are processed per release
+    file into results/parts/<release file>.csv, and these are then merged
+    into the indications CSV. With a pipeline state, a release file whose
+    extraction has not changed since it was last processed is skipped and
+    its previous results are merged as they are, and added to the index when
+    it does not hold them yet.
+
+    The records can also be handed to a consumer in memory, as they are
+    parsed, with the results written only as an optional checkpoint. A
+    release file that is not written is processed again by the next run.
+
     Args:
         files: (Dict[str, FileMetadata]) : A dictionary with xml files as string key\
             and FileMetadata values
+        paths: (dict) : The application paths, see getPaths()
+        retry_quarantine: (bool) : Only reprocess the files of the quarantine\
+            manifest, and append their rows to the existing CSV file
+        cache: (ParseCache) : An optional cache of parse results. Documents\
+            whose MD5 is known from extraction and cached are not even read
+        store: (str) : Where to find the extracted files when xml_files is\
+            empty, files for the extraction directory or shards for the\
+            shard directory
+        state: (PipelineState) : The optional record of previous runs
+        index: (SearchIndex) : An optional full-text index of the sections,\
+            updated as documents are processed
+        quarantine_filename: (str) : The quarantine manifest, by default\
+            results/quarantine.jsonl
+        merge: (bool) : Merge the per release file results into the\
+            indications CSV
+        threads: (int) : The number of threads reading and decompressing the\
+            files ahead of the parser, 0 for none
+        queue_depth: (int) : The maximum number of files read ahead
+        metrics: (RunMetrics) : The telemetry of the run, none by default
+        check_lease: (Callable) : Called before the outputs are written,\
+            raises LeaseLost to stop the work unit of a distributed run\
+            whose lease was lost, none by default
+        records: (Callable) : Called with each release file, None for the\
+            files of no known release file, and its indication records, read\
+            from the results of a previous run when it is skipped, none by\
+            default
+        write: (bool) : Write the results, to results/parts and the\
+            indications CSV
 
     """
+    if metrics is None:
+        metrics = RunMetrics()
 
-    paths = getPaths()
     extraction_dir = paths["extraction_dir"]
     result_dir = paths["result_dir"]
+    parts_dir = f"{result_dir}/parts"
+    if quarantine_filename is None:
+        quarantine_filename = f"{result_dir}/quarantine.jsonl"
+    indications_filename = f"{result_dir}/indications.csv"
 
-    hashes = {}
     files = {}
-    indications = []
-    if len(xml_files) == 0:
-        for xml_file in os.listdir(extraction_dir):
-            metadata = FileMetadata(
-                filename=xml_file, filepath=f"{extraction_dir}/{xml_file}"
+    total = None
+    if retry_quarantine:
+        files = readQuarantine(quarantine_filename)
+        print(f"Retrying {len(files)} quarantined file(s)")
+    elif len(xml_files) == 0 and store == "shards":
+        store_reader = ShardStore(paths["shard_dir"])
+        files = (
+            FileMetadata(
+                filename=entry.name,
+                filepath=entry.shard,
+                offset=entry.offset,
+                length=entry.length,
             )
-            files[xml_file] = metadata
+            for entry in store_reader.entries()
+        )
+        total = LazyCount(lambda: sum(1 for _ in store_reader.entries()))
+    elif len(xml_files) == 0:
+        # enumerate lazily, the extraction directory may hold 150k files
+        files = scanDirectory(extraction_dir)
+        total = LazyCount(lambda: countFiles(extraction_dir))
     else:
         files = xml_files
 
-    for file in progressbar(files, "Processing: ", 40):
-        metadata = files[file]
-        # path = f'{extraction_dir}/{file}'
-        path = metadata.filepath
+    # group the files by the release file they were extracted from
+    if isinstance(files, dict):
+        groups = {}
+        for file in files:
+            groups.setdefault(files[file].source, []).append(files[file])
+    else:
+        groups = {None: files}
+
+    n_quarantined = 0
+    shards = ShardStore(paths["shard_dir"])
+    with shards, open(quarantine_filename, "w") as quarantine:
+        for source, group in groups.items():
+            if source is None:
+                indications, n_failed = processFiles(
+                    group,
+                    shards,
+                    quarantine,
+                    cache,
+                    total=total,
+                    search_index=index,
+                    threads=threads,
+                    queue_depth=queue_depth,
+                    metrics=metrics,
+                    check_lease=check_lease,
+                )
+                n_quarantined += n_failed
+                if records is not None:
+                    records(None, indications)
+                if write:
+                    with metrics.timer("process", "write"):
+                        writeIndications(
+                            indications_filename, indications, retry_quarantine
+                        )
+                continue
 
-        with gzip.open(path, "rb") as f:
-            xml_string = f.read()
-            soup = BeautifulSoup(xml_string, "xml")
-
-            set_id = soup.setId["root"]
-            xml_id = soup.id["root"]
-            version_number = soup.versionNumber["value"]
-
-            sections = soup.find_all("section")
-            for section in sections:
-                for code in section.find_all("code", attrs={"code": "34067-9"}):
-                    # Replace the matching sequences with a single newline
-                    text = "###\n".join(section.text)
-                    row = {
-                        "set_id": set_id,
-                        "xml_id": xml_id,
-                        "version_number": version_number,
-                        "type": "indication",
-                        "length": len(text),
-                        "text": text.split(),
-                    }
-                    indications.append(row)
-
-    # Creating a csv dict writer object
-    with open(f"{result_dir}/indications.csv", "w") as csvfile:
-        fields = ["set_id", "xml_id", "version_number", "type", "length", "text"]
-        writer = csv.DictWriter(csvfile, fieldnames=fields, delimiter=",")
-        writer.writeheader()
-        writer.writerows(indications)
+            part_filename = f"{parts_dir}/{source}.csv"
+            extract_fingerprint = None
+            if state is not None:
+                extract_fingerprint = state.outputFingerprint("extract", source)
+            input_fingerprint = f"{extract_fingerprint}:{EXTRACTOR_VERSION}"
+            if (
+                not retry_quarantine
+                and extract_fingerprint is not None
+                and state.isFresh("process", source, input_fingerprint)
+            ):
+                print(f"{source} is unchanged since it was last processed, skipping")
+                metrics.count("process", "skipped_package_files")
+                output_fingerprint = state.outputFingerprint("process", source)
+                if index is not None and (
+                    index.sourceFingerprint(source) != output_fingerprint
+                ):
+                    # processed without the index, or the index was deleted since
+                    with metrics.timer("process", "index"):
+                        buildFromCSV(index, part_filename)
+                        index.recordSource(source, output_fingerprint)
+                if records is not None:
+                    records(source, readRecords(part_filename))
+                continue
 
+            indications, n_failed = processFiles(
+                group,
+                shards,
+                quarantine,
+                cache,
+                f"Processing {source}: ",
+                search_index=index,
+                threads=threads,
+                queue_depth=queue_depth,
+                metrics=metrics,
+                check_lease=check_lease,
+            )
+            n_quarantined += n_failed
+            if records is not None:
+                records(source, indications)
+            if not write:
+                continue
+            if check_lease is not None:
+                check_lease()
+            os.makedirs(parts_dir, exist_ok=True)
+            with metrics.timer("process", "write"):
+                writeIndications(part_filename, indications, retry_quarantine)
+
+            if state is not None and extract_fingerprint is not None:
+                # a release file with quarantined documents is not recorded,
+                # so that it is processed again by the next run
+                if n_failed == 0:
+                    output_fingerprint = computeMD5Hash(part_filename)
+                    state.record(
+                        "process",
+                        source,
+                        input_fingerprint,
+                        output_fingerprint,
+                        [part_filename],
+                    )
+                    if index is not None:
+                        index.recordSource(source, output_fingerprint)
+                else:
+                    state.invalidate("process", source)
 
-if __name__ == "__main__":
-    startTime = time.time()
+    if cache is not None:
+        metrics.count("process", "cache_hits", cache.hits)
+        metrics.count("process", "cache_misses", cache.misses)
+        print(f"Parse cache: {cache.hits} hit(s), {cache.misses} miss(es)")
+
+    if n_quarantined > 0:
+        print(f"Quarantined {n_quarantined} file(s) in {quarantine_filename}")
+
+    if not merge or not write:
+        return
+    sources = [source for source in groups if source is not None]
+    if sources:
+        with metrics.timer("process", "write"):
+            mergeParts(parts_dir, indications_filename, sources)
+    metrics.count("process", "bytes_out", os.path.getsize(indications_filename))
+
+
+def makeArgParser():
+    """Builds the command line parser of the application.
+
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
     argParser = argparse.ArgumentParser(
         prog="Dailymed Parser",
         description="Downloads and parses Dailymed product labels",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
-    data_source = "dailymed"
     argParser.add_argument(
         "-w",
         "--working_dir",
@@ -515,7 +1419,8 @@ if __name__ == "__main__":
         "--force",
         default=False,
         action="store_true",
-        help="Replace files, even if they were previously downloaded",
+        help="Replace files, even if they were previously downloaded, extracted \
+            or processed",
     )
     argParser.add_argument(
         "-a",
@@ -537,20 +1442,425 @@ if __name__ == "__main__":
     argParser.add_argument(
         "-p", "--process", default=True, help="Extract XML files from download files"
     )
-    args = argParser.parse_args()
+    argParser.add_argument(
+        "--store",
+        default="files",
+        choices=["files", "shards"],
+        help="Store extracted XML as one gzipped file each, or packed in \
+            indexed shards",
+    )
+    argParser.add_argument(
+        "--shard-size",
+        default=1024,
+        type=int,
+        help="Size in MB at which a new shard is started",
+    )
+    argParser.add_argument(
+        "--codec",
+        default="gzip:9",
+        help="Compression of the extracted XML files: gzip[:level], zstd[:level] "
+        "or none. Readers detect it, whatever it was",
+    )
+    argParser.add_argument(
+        "--prefetch-threads",
+        default=4,
+        type=int,
+        help="Threads reading and decompressing documents ahead of the parser, "
+        "0 to read them on the main thread",
+    )
+    argParser.add_argument(
+        "--queue-depth",
+        default=64,
+        type=int,
+        help="Maximum number of documents read ahead by the prefetch threads",
+    )
+    argParser.add_argument(
+        "--retry-quarantine",
+        default=False,
+        action="store_true",
+        help="Only reprocess the files recorded in the quarantine manifest",
+    )
+    argParser.add_argument(
+        "--no-cache",
+        default=False,
+        action="store_true",
+        help="Do not reuse or store parse results in the parse cache",
+    )
+    argParser.add_argument(
+        "--cache-size",
+        default=2048,
+        type=int,
+        help="Maximum size of the parse cache in MB",
+    )
+    argParser.add_argument(
+        "--index",
+        default=False,
+        action="store_true",
+        help="Update the full-text index results/indications.sqlite while processing",
+    )
+    argParser.add_argument(
+        "--diff",
+        default=False,
+        action="store_true",
+        help="Write the indications added, changed or removed since the previous "
+        "run to results/indications.diff.csv",
+    )
+    argParser.add_argument(
+        "--mode",
+        default="local",
+        choices=["local", "coordinator", "worker"],
+        help="Run alone, or split the release files of a run between a coordinator "
+        "and workers sharing the working directory",
+    )
+    argParser.add_argument(
+        "--lease-seconds",
+        default=600,
+        type=float,
+        help="Time after which the release file of a silent worker is taken over",
+    )
+    argParser.add_argument(
+        "--worker-id",
+        default=None,
+        help="Identifier of the worker, host:pid by default",
+    )
+    argParser.add_argument(
+        "--metrics", default=None, help="Write per-stage metrics of the run to a file"
+    )
+    argParser.add_argument(
+        "--metrics-format",
+        default="json",
+        choices=["json", "prometheus"],
+        help="Format of the metrics file",
+    )
+    argParser.add_argument(
+        "--profile",
+        default="none",
+        choices=["none", "cprofile", "py-spy"],
+        help="Profile the run with cProfile or py-spy",
+    )
+    argParser.add_argument(
+        "--profile-output", default=None, help="File to write the profile to"
+    )
+    return argParser
 
-    # get file list from command line, or the default set
-    files = checkFiles(makeFileList())
 
-    if args.download == "True":
-        files = download(files)
+def makeConfig(argv=None, **options):
+    """Builds the configuration of a run from command line arguments, then
+    from keyword options, without reading sys.argv.
 
-    xml_files = {}
-    if args.extract == "True":
-        xml_files = extract(files)
+    The download, extract and process flags are booleans in the
+    configuration, enabled when given as "True" on the command line.
+
+    Args:
+        argv: (list[str]) : Command line arguments, none by default
+        options: Values of configuration options, by their attribute name\
+            (working_dir, files, store, ...)
+
+    Returns:
+        argparse.Namespace: The configuration
+    """
+    config = makeArgParser().parse_args([] if argv is None else argv)
+    for name in ["download", "extract", "process"]:
+        setattr(config, name, getattr(config, name) == "True")
+    for name, value in options.items():
+        if not hasattr(config, name):
+            raise TypeError(f"Unknown configuration option {name}")
+        setattr(config, name, value)
+    return config
+
+
+class DailyMedPipeline:
+    """
+    The download, extraction, processing and diff of a set of release
+    files, with an explicit configuration. A pipeline can be run repeatedly,
+    each run reusing what the previous ones recorded in the working directory.
+
+    Attributes:
+            config (argparse.Namespace): The configuration, see makeConfig()
+            paths (dict): The application paths, see getPaths()
+            metrics (RunMetrics): The telemetry of the last run
+    """
+
+    def __init__(self, config=None, **options):
+        self.config = config if config is not None else makeConfig(**options)
+        self.paths = getPaths(self.config)
+        self.metrics = RunMetrics()
+
+    def files(self):
+        """Lists the configured release files, with their local metadata."""
+        return checkFiles(makeFileList(self.config), self.config)
+
+    def run(self, records=None, write=True):
+        """
+        Runs the stages enabled in the configuration, alone, or as the
+        coordinator or a worker of a distributed run.
+
+        Args:
+            records: (Callable) : Called with each release file and its\
+                indication records, see process()
+            write: (bool) : Write the results of the process stage
+
+        Returns:
+            RunMetrics: The telemetry of the run
+        """
+        # the stages report to the metrics of the current run
+        metrics = self.metrics = RunMetrics()
+        config = self.config
+        if not write and (config.diff or config.retry_quarantine):
+            raise ValueError(
+                "--diff and --retry-quarantine need the results to be written"
+            )
+        if config.mode != "local":
+            if config.index or config.retry_quarantine or records or not write:
+                raise ValueError(
+                    "--index, --retry-quarantine and in-memory records are not "
+                    f"supported with --mode {config.mode}"
+                )
+            queue = LeaseQueue(
+                f"{self.paths['working_dir']}/queue",
+                config.lease_seconds,
+                config.worker_id,
+            )
+            if config.mode == "coordinator":
+                self.coordinate(queue)
+            elif queue.waitForRun(config.lease_seconds) is None:
+                print(f"No run with pending units was started in {queue.directory}")
+            else:
+                self.work(queue)
+            return self.metrics
+
+        paths = self.paths
+
+        # get file list from the configuration, or the default set
+        files = self.files()
+
+        if config.download:
+            with metrics.stage("download"):
+                files = download(files, config, metrics)
+
+        state = PipelineState(f"{paths['state_dir']}/pipeline.yaml", config.force)
+
+        xml_files = {}
+        if config.extract:
+            with metrics.stage("extract"):
+                xml_files = extract(
+                    files,
+                    paths,
+                    config.store,
+                    config.shard_size,
+                    state,
+                    config.codec,
+                    config.prefetch_threads,
+                    config.queue_depth,
+                    metrics,
+                )
+        elif not config.retry_quarantine:
+            # process the files of previous extractions of the requested release files
+            xml_files = readExtractManifests(files, paths)
+
+        if config.process or config.retry_quarantine:
+            cache = None
+            if not config.no_cache:
+                os.makedirs(paths["cache_dir"], exist_ok=True)
+                cache = ParseCache(
+                    f"{paths['cache_dir']}/parse_cache.sqlite",
+                    EXTRACTOR_VERSION,
+                    config.cache_size * 1024**2,
+                )
+            index = None
+            if config.index:
+                os.makedirs(paths["result_dir"], exist_ok=True)
+                index = SearchIndex(f"{paths['result_dir']}/indications.sqlite")
+            with metrics.stage("process"):
+                process(
+                    xml_files,
+                    paths,
+                    config.retry_quarantine,
+                    cache,
+                    config.store,
+                    state,
+                    index,
+                    threads=config.prefetch_threads,
+                    queue_depth=config.queue_depth,
+                    metrics=metrics,
+                    records=records,
+                    write=write,
+                )
+            if cache is not None:
+                cache.close()
+            if index is not None:
+                index.close()
+
+        if config.diff:
+            self.diff()
+
+        return self.metrics
+
+    def diff(self):
+        paths = self.paths
+        metrics = self.metrics
+        with metrics.stage("diff"):
+            record_filename = f"{paths['state_dir']}/indications.record.tsv"
+            record, counts = diffIndications(
+                f"{paths['result_dir']}/indications.csv",
+                readRecord(record_filename),
+                f"{paths['result_dir']}/indications.diff.csv",
+            )
+            writeRecord(record_filename, record)
+            for change, n in counts.items():
+                metrics.count("diff", change, n)
+
+    def runUnit(self, unit, check_lease=None):
+        """
+        Extracts and processes one release file, the work unit of a
+        distributed run. The unit has its own pipeline state and quarantine
+        manifest, and its results are left in results/parts for the
+        coordinator to merge.
+
+        Args:
+            unit: (str) : The release file
+            check_lease: (Callable) : Called before the outputs are written,\
+                raises LeaseLost to stop the unit once its lease was lost
+        """
+        config = self.config
+        paths = self.paths
+        metrics = self.metrics
+        unit_config = argparse.Namespace(**vars(config))
+        unit_config.files = unit
+        files = checkFiles(makeFileList(unit_config), unit_config)
+        state = PipelineState(
+            f"{paths['state_dir']}/pipeline-{unit}.yaml", config.force
+        )
+
+        if config.extract:
+            with metrics.stage("extract"):
+                xml_files = extract(
+                    files,
+                    paths,
+                    config.store,
+                    config.shard_size,
+                    state,
+                    config.codec,
+                    config.prefetch_threads,
+                    config.queue_depth,
+                    metrics,
+                    check_lease,
+                )
+        else:
+            xml_files = readExtractManifests(files, paths)
+
+        if config.process:
+            cache = None
+            if not config.no_cache:
+                # SQLite is not safe on a shared filesystem, so one cache per node
+                os.makedirs(paths["cache_dir"], exist_ok=True)
+                cache = ParseCache(
+                    f"{paths['cache_dir']}/parse_cache-{socket.gethostname()}.sqlite",
+                    EXTRACTOR_VERSION,
+                    config.cache_size * 1024**2,
+                )
+            quarantine_dir = f"{paths['result_dir']}/quarantine"
+            os.makedirs(quarantine_dir, exist_ok=True)
+            with metrics.stage("process"):
+                process(
+                    xml_files,
+                    paths,
+                    cache=cache,
+                    store=config.store,
+                    state=state,
+                    quarantine_filename=f"{quarantine_dir}/{unit}.jsonl",
+                    merge=False,
+                    threads=config.prefetch_threads,
+                    queue_depth=config.queue_depth,
+                    metrics=metrics,
+                    check_lease=check_lease,
+                )
+            if cache is not None:
+                cache.close()
+
+    def work(self, queue):
+        """
+        Runs the units of the current distributed run until none is left to
+        claim. A unit whose lease is lost stops before its next write, and is
+        left to the worker that took it over.
+
+        Returns:
+            int: The number of units this worker committed
+        """
+        n_units = 0
+        while True:
+            claimed = queue.claim()
+            if claimed is None:
+                return n_units
+            run_id, unit = claimed
+            print(f"Worker {queue.worker_id} claimed {unit} of run {run_id}")
+            start = time.time()
+            try:
+                with queue.heartbeat(run_id, unit) as heartbeat:
+                    self.runUnit(unit, heartbeat.check)
+            except LeaseLost as e:
+                print(f"Worker {queue.worker_id} stopped {unit}: {e}")
+                queue.release(run_id, unit)
+                continue
+            if not queue.commit(run_id, unit, {"seconds": time.time() - start}):
+                print(f"Worker {queue.worker_id} lost {unit} to another worker")
+                continue
+            n_units += 1
+
+    def coordinate(self, queue):
+        """
+        Starts a distributed run over the configured release files, works on
+        it, waits for the other workers, then merges the results.
+        """
+        config = self.config
+        paths = self.paths
+        metrics = self.metrics
+        files = self.files()
+        if config.download:
+            with metrics.stage("download"):
+                files = download(files, config, metrics)
+
+        run_id = queue.start(list(files))
+        print(f"Started run {run_id} of {len(files)} release file(s)")
+        # take over the units of workers that stopped, until all are committed
+        while True:
+            self.work(queue)
+            if not queue.pending(run_id):
+                break
+            time.sleep(min(5, config.lease_seconds / 3))
+
+        if config.process:
+            result_dir = paths["result_dir"]
+            with metrics.stage("process"), metrics.timer("process", "write"):
+                mergeParts(
+                    f"{result_dir}/parts",
+                    f"{result_dir}/indications.csv",
+                    queue.units(run_id),
+                )
+                # gather the quarantine manifests of the units of this run
+                with open(f"{result_dir}/quarantine.jsonl", "w") as out:
+                    for unit in queue.units(run_id):
+                        unit_quarantine = f"{result_dir}/quarantine/{unit}.jsonl"
+                        if os.path.exists(unit_quarantine):
+                            with open(unit_quarantine, "r") as f:
+                                shutil.copyfileobj(f, out)
+        if config.diff:
+            self.diff()
+
+
+if __name__ == "__main__":
+    startTime = time.time()
+    config = makeConfig(sys.argv[1:])
+
+    profiler = Profiler(config.profile, config.profile_output)
+    profiler.start()
+
+    run_metrics = DailyMedPipeline(config).run()
 
-    if args.process == "True":
-        process(xml_files)
+    profiler.stop()
+    run_metrics.summary()
+    if config.metrics is not None:
+        run_metrics.write(config.metrics, config.metrics_format)
 
     executionTime = time.time() - startTime
     print(f"Execution time: {executionTime} seconds")
@@ -0,0 +1,153 @@
+import numpy as np
+from scipy import sparse
+
+from feature_store import hashTexts
+
+# the model plot.py has always used, so that both share their embeddings
+DEFAULT_MODEL = "distilbert-base-nli-mean-tokens"
+ANN_BACKENDS = ["auto", "hnswlib", "faiss", "exact"]
+
+
+def embeddingKey(texts, model_name):
+    """Returns the key of the embeddings of texts by a model in the store."""
+    return hashTexts(texts, f"sentence-transformers:{model_name}")
+
+
+def encodeTexts(texts, model_name=DEFAULT_MODEL, batch_size=32):
+    """
+    Encodes texts with a SentenceTransformer model, one batch at a time.
+
+    Returns:
+        np.ndarray The float32 embeddings, one row per text
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise ImportError("Dense embeddings require the sentence-transformers package")
+    model = SentenceTransformer(model_name)
+    embeddings = model.encode(list(texts), batch_size=batch_size)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def computeEmbeddings(texts, model_name=DEFAULT_MODEL, store=None, batch_size=32):
+    """
+    Returns the embeddings of texts, from the feature store when the same
+    texts were encoded by the same model before.
+
+    Args:
+        texts: the texts
+        model_name: the SentenceTransformer model
+        store: an optional FeatureStore, where new embeddings are saved
+        batch_size: the number of texts encoded at once
+
+    Returns:
+        tuple(np.ndarray, str) The embeddings and their key in the store
+    """
+    key = embeddingKey(texts, model_name)
+    if store is not None and store.hasEmbeddings(key):
+        print("Loading embeddings from the feature store...")
+        return store.loadEmbeddings(key), key
+
+    print("Encoding texts...")
+    embeddings = encodeTexts(texts, model_name, batch_size)
+    if store is not None:
+        store.saveEmbeddings(key, embeddings)
+    return embeddings, key
+
+
+def normalize(embeddings):
+    """Scales the rows to unit length, so that inner products are cosine
+    similarities."""
+    embeddings = np.array(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+def resolveBackend(backend):
+    """Picks the first installed ANN library for the auto backend."""
+    if backend != "auto":
+        return backend
+    for name in ["hnswlib", "faiss"]:
+        try:
+            __import__(name)
+            return name
+        except ImportError:
+            pass
+    print("Neither hnswlib nor faiss is installed, searching exactly")
+    return "exact"
+
+
+def searchHnswlib(vectors, k):
+    try:
+        import hnswlib
+    except ImportError:
+        raise ImportError("The hnswlib backend requires the hnswlib package")
+    index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+    index.init_index(max_elements=len(vectors), ef_construction=200, M=16)
+    index.add_items(vectors, np.arange(len(vectors)))
+    index.set_ef(max(2 * k, 64))
+    labels, distances = index.knn_query(vectors, k=min(k, len(vectors)))
+    # the inner product distance of hnswlib is 1 - similarity
+    return labels.astype(np.int64), 1 - distances
+
+
+def searchFaiss(vectors, k):
+    try:
+        import faiss
+    except ImportError:
+        raise ImportError("The faiss backend requires the faiss-cpu package")
+    index = faiss.IndexHNSWFlat(vectors.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = 200
+    index.hnsw.efSearch = max(2 * k, 64)
+    index.add(vectors)
+    sims, labels = index.search(vectors, min(k, len(vectors)))
+    return labels.astype(np.int64), sims
+
+
+def denseNeighbours(embeddings, min_similarity, k=32, backend="auto", block_size=1024):
+    """
+    Finds the pairs of texts whose embeddings have a cosine similarity of at
+    least min_similarity.
+
+    With an ANN backend, only the k nearest neighbours of every text are
+    searched in an HNSW index, so a text with more than k similar texts may
+    miss some of them. The exact backend compares every pair, one block of
+    rows at a time.
+
+    Args:
+        embeddings: the embeddings, one row per text
+        min_similarity: the lowest similarity kept
+        k: the number of neighbours searched per text with an ANN backend
+        backend: auto, hnswlib, faiss or exact
+        block_size: the number of rows compared at once by the exact search
+
+    Returns:
+        sparse.csr_matrix The symmetric similarity graph, without its diagonal
+    """
+    vectors = normalize(embeddings)
+    n_rows = len(vectors)
+    backend = resolveBackend(backend)
+    if backend == "exact":
+        rows, cols, sims = [], [], []
+        for start in range(0, n_rows, block_size):
+            block = vectors[start : start + block_size] @ vectors.T
+            row, col = np.nonzero(block >= min_similarity)
+            rows.append(row + start)
+            cols.append(col)
+            sims.append(block[row, col])
+        rows, cols, sims = map(np.concatenate, (rows, cols, sims))
+    else:
+        # a text is its own nearest neighbour, so search one more
+        search = searchHnswlib if backend == "hnswlib" else searchFaiss
+        labels, similarities = search(vectors, k + 1)
+        rows = np.repeat(np.arange(n_rows), labels.shape[1])
+        cols = labels.ravel()
+        sims = similarities.ravel()
+    keep = (cols >= 0) & (rows != cols) & (sims >= min_similarity)
+    graph = sparse.csr_matrix(
+        (sims[keep].astype(np.float32), (rows[keep], cols[keep])),
+        shape=(n_rows, n_rows),
+    )
+    # a pair found from one side only is kept on both
+    return graph.maximum(graph.T).tocsr()
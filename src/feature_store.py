@@ -0,0 +1,161 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+
+def hashTexts(texts, params=""):
+    """Returns the MD5 of a sequence of texts and of the parameters of the
+    vectorizer, the key of their features in the store."""
+    md5 = hashlib.md5(params.encode())
+    for text in texts:
+        md5.update(str(text).encode())
+        md5.update(b"\0")
+    return md5.hexdigest()
+
+
+def saveArray(filename, array):
+    tmp_filename = f"{filename}.tmp.npy"
+    np.save(tmp_filename, array)
+    os.replace(tmp_filename, filename)
+
+
+def computeNeighbours(matrix, min_similarity, block_size=1024):
+    """
+    Finds the pairs of rows whose cosine similarity is at least
+    min_similarity, one block of rows at a time.
+
+    Args:
+        matrix: the L2-normalized CSR feature matrix
+        min_similarity: the lowest similarity kept
+        block_size: the number of rows compared to all others at once
+
+    Returns:
+        sparse.csr_matrix The symmetric similarity graph, without its diagonal
+    """
+    n_rows = matrix.shape[0]
+    transposed = matrix.T.tocsc()
+    rows, cols, sims = [], [], []
+    for start in range(0, n_rows, block_size):
+        block = (matrix[start : start + block_size] @ transposed).tocoo()
+        keep = (block.data >= min_similarity) & (block.row + start != block.col)
+        rows.append(block.row[keep] + start)
+        cols.append(block.col[keep])
+        sims.append(block.data[keep])
+    return sparse.csr_matrix(
+        (np.concatenate(sims), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_rows, n_rows),
+    )
+
+
+class FeatureStore:
+    """
+    A directory of TF-IDF features and sentence embeddings, keyed by the hash
+    of the texts they were computed from.
+
+    The fitted vocabulary and idf weights, the CSR feature matrix, the dense
+    embeddings, and the similarity graphs computed from them are saved as
+    .npy arrays that are memory-mapped when loaded, so that a later run on
+    the same texts neither refits the vectorizer, nor encodes the texts
+    again, nor recomputes the similarities.
+
+    Attributes:
+            directory (str): The root directory of the store
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key, name):
+        return os.path.join(self.directory, key, name)
+
+    def has(self, key):
+        return os.path.exists(self.path(key, "meta.json"))
+
+    def save(self, key, matrix, vectorizer):
+        """Saves the feature matrix and the fitted vectorizer of a key."""
+        os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+        matrix = matrix.tocsr()
+        saveArray(self.path(key, "data.npy"), matrix.data)
+        saveArray(self.path(key, "indices.npy"), matrix.indices)
+        saveArray(self.path(key, "indptr.npy"), matrix.indptr)
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        saveArray(self.path(key, "terms.npy"), np.array(terms))
+        saveArray(self.path(key, "idf.npy"), vectorizer.idf_)
+        # the metadata is written last, it marks the features as complete
+        with open(self.path(key, "meta.json.tmp"), "w") as f:
+            json.dump({"shape": list(matrix.shape)}, f)
+        os.replace(self.path(key, "meta.json.tmp"), self.path(key, "meta.json"))
+
+    def load(self, key):
+        """
+        Loads the features of a key, memory-mapped.
+
+        Returns:
+            tuple(sparse.csr_matrix, np.ndarray, np.ndarray) The feature
+                matrix, the vocabulary terms in column order, and their idf
+        """
+        with open(self.path(key, "meta.json"), "r") as f:
+            shape = tuple(json.load(f)["shape"])
+        arrays = [
+            np.load(self.path(key, name), mmap_mode="r")
+            for name in ["data.npy", "indices.npy", "indptr.npy"]
+        ]
+        matrix = sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+        terms = np.load(self.path(key, "terms.npy"), mmap_mode="r")
+        idf = np.load(self.path(key, "idf.npy"), mmap_mode="r")
+        return matrix, terms, idf
+
+    def hasEmbeddings(self, key):
+        return os.path.exists(self.path(key, "embeddings.npy"))
+
+    def saveEmbeddings(self, key, embeddings):
+        """Saves the dense embeddings of a key, one row per text."""
+        os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+        saveArray(self.path(key, "embeddings.npy"), embeddings)
+
+    def loadEmbeddings(self, key):
+        """Loads the dense embeddings of a key, memory-mapped."""
+        return np.load(self.path(key, "embeddings.npy"), mmap_mode="r")
+
+    def neighbours(
+        self, key, matrix, min_similarity, compute=computeNeighbours, name="neighbours"
+    ):
+        """
+        Returns the similarity graph of the rows of a feature matrix, down to
+        min_similarity, from the store when a graph with a lower or equal
+        minimum was saved before.
+
+        Args:
+            key: the key of the features
+            matrix: the feature matrix or the embeddings
+            min_similarity: the lowest similarity kept
+            compute: the function computing the graph of the matrix down to\
+                a similarity, computeNeighbours() by default
+            name: the name of the graphs of this kind of computation, without\
+                dashes
+        """
+        best = None
+        for indptr_filename in glob.glob(self.path(key, f"{name}-*-indptr.npy")):
+            basename = os.path.basename(indptr_filename)
+            floor = float(basename[len(name) + 1 :].split("-")[0])
+            if floor <= min_similarity and (best is None or floor > best[0]):
+                best = (floor, indptr_filename[: -len("-indptr.npy")])
+        if best is not None:
+            prefix = best[1]
+            arrays = [
+                np.load(f"{prefix}-{array}.npy", mmap_mode="r")
+                for array in ["sims", "indices", "indptr"]
+            ]
+            n_rows = matrix.shape[0]
+            return sparse.csr_matrix(tuple(arrays), shape=(n_rows, n_rows), copy=False)
+
+        graph = compute(matrix, min_similarity)
+        prefix = self.path(key, f"{name}-{min_similarity:.6f}")
+        saveArray(f"{prefix}-sims.npy", graph.data)
+        saveArray(f"{prefix}-indices.npy", graph.indices)
+        saveArray(f"{prefix}-indptr.npy", graph.indptr)
+        return graph
@@ -0,0 +1,265 @@
+import argparse
+import glob
+import itertools
+import os
+import time
+
+from clean import clean_text, shuffle
+from indication_record import readRecords
+
+# the columns of the cleaned CSV file of clean.py
+CLEANED_FIELDS = ["set_id", "xml_id", "version_number", "type", "length", "text"]
+
+
+def listIndicationFiles(result_dir, sources=None):
+    """
+    Lists the CSV files holding the indications of release files: their
+    parts in results/parts, sorted by name as mergeParts() concatenates
+    them, or the merged indications CSV file when there are none.
+
+    Args:
+        result_dir: the result directory of the parser
+        sources: the release files to read, all of them by default
+    """
+    if sources is None:
+        parts = sorted(glob.glob(f"{result_dir}/parts/*.csv"))
+    else:
+        parts = [f"{result_dir}/parts/{source}.csv" for source in sources]
+        parts = sorted(part for part in parts if os.path.exists(part))
+    return parts or [f"{result_dir}/indications.csv"]
+
+
+def cleanRows(records):
+    """
+    Cleans the text of a stream of indication records, as clean.py does.
+
+    Returns:
+        generator of tuple The CLEANED_FIELDS values of each record
+    """
+    for record in records:
+        text = clean_text(record.text)
+        yield tuple(getattr(record, name) for name in CLEANED_FIELDS[:-1]) + (text,)
+
+
+def dropDuplicates(rows):
+    """Drops the cleaned rows whose text came before, as clean.py does."""
+    seen = set()
+    for row in rows:
+        if row[-1] not in seen:
+            seen.add(row[-1])
+            yield row
+
+
+def readCleanRows(csv_files):
+    """Cleans the records of indication CSV files, read in order."""
+    for csv_file in csv_files:
+        yield from cleanRows(readRecords(csv_file))
+
+
+def parseCleanRows(pipeline, write=False):
+    """
+    Runs the parser, and cleans the indication records of each release file
+    as they are parsed, instead of reading them back from the parser
+    results. The records of the release files skipped as unchanged are read
+    from the results of a previous run.
+
+    Args:
+        pipeline: the DailyMedPipeline of the parser
+        write: also write the parser results, to results/parts and the\
+            indications CSV
+
+    Returns:
+        iterator of tuple The cleaned rows, in the order mergeParts() merges\
+            the release files
+    """
+    cleaned = {}
+
+    def collect(source, records):
+        # only the cleaned texts are kept, without those repeated in the file
+        cleaned[source] = list(dropDuplicates(cleanRows(records)))
+
+    pipeline.run(collect, write)
+    order = sorted(cleaned, key=lambda source: (source is None, source))
+    return itertools.chain.from_iterable(cleaned[source] for source in order)
+
+
+def toDataFrame(rows, seed=42):
+    """
+    Builds the cleaned rows into a DataFrame, one column at a time.
+
+    Returns:
+        pd.DataFrame The shuffled cleaned rows
+    """
+    import pandas as pd
+
+    columns = {name: [] for name in CLEANED_FIELDS}
+    for row in rows:
+        for name, value in zip(CLEANED_FIELDS, row):
+            columns[name].append(value)
+    return shuffle(pd.DataFrame(columns), seed)
+
+
+def suffixed(filename, threshold, n_thresholds):
+    """Names the output of a threshold when several are swept, as
+    dissimilar.py does."""
+    if n_thresholds == 1:
+        return filename
+    root, ext = os.path.splitext(filename)
+    return f"{root}-{threshold}{ext}"
+
+
+def runGoldPipeline(
+    rows,
+    output,
+    thresholds,
+    store=None,
+    mode="tfidf",
+    dense_options=None,
+    plot=None,
+    checkpoint_dir=None,
+    seed=42,
+):
+    """
+    Deduplicates cleaned indications in memory, and writes the gold
+    standard sets, and optionally their t-SNE plots, without the
+    intermediate CSV files of clean.py and dissimilar.py.
+
+    Args:
+        rows: the cleaned rows, see cleanRows(), streamed once
+        output: the gold standard CSV file
+        thresholds: the similarity thresholds, one output per threshold
+        store: an optional FeatureStore, see dissimilar.py
+        mode: tfidf or dense, see dissimilar.py
+        dense_options: the options of the dense mode, see dissimilar.py
+        plot: the image file of the t-SNE plot of every gold standard set,\
+            none by default
+        checkpoint_dir: a directory where the cleaned rows are also written\
+            as cleaned.csv, none by default
+        seed: the seed of the shuffle of the cleaned rows
+
+    Returns:
+        dict: threshold -> (number of rows retained, output file)
+    """
+    from dissimilar import sweep_thresholds
+
+    df = toDataFrame(dropDuplicates(rows), seed)
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        df.to_csv(f"{checkpoint_dir}/cleaned.csv", index=False)
+
+    removed = sweep_thresholds(df, thresholds, store, mode, dense_options)
+
+    results = {}
+    for threshold, selected_indices in removed.items():
+        gold = df.drop(index=df.index[selected_indices])
+        output_csv = suffixed(output, threshold, len(thresholds))
+        gold.to_csv(output_csv, index=False)
+        if plot is not None:
+            from plot import plot_tsne
+
+            plot_tsne(
+                gold["text"].tolist(),
+                suffixed(plot, threshold, len(thresholds)),
+                store,
+            )
+        results[threshold] = (len(gold), output_csv)
+    print(f"Cleaned paragraphs: {len(df)}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parse the release files, then clean, deduplicate and plot "
+        "their indications in one process. Other arguments are passed to "
+        "dm_parser.py.",
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "-t",
+        "--thresholds",
+        required=True,
+        help="Cosine similarity threshold, or a comma-separated list of thresholds",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="Gold standard CSV file, suffixed with the threshold when there are "
+        "several",
+    )
+    parser.add_argument("--plot", default=None, help="Image file of a t-SNE plot")
+    parser.add_argument(
+        "--checkpoint-dir",
+        default=None,
+        help="Directory where the cleaned rows are also written",
+    )
+    parser.add_argument(
+        "--keep-results",
+        default=False,
+        action="store_true",
+        help="Also write the parser results, which the next runs reuse for the "
+        "unchanged release files",
+    )
+    parser.add_argument(
+        "--no-parse",
+        default=False,
+        action="store_true",
+        help="Use the results of a previous parser run as they are",
+    )
+    parser.add_argument(
+        "--features", default=None, help="Directory of the feature store"
+    )
+    parser.add_argument(
+        "--dedup-mode",
+        choices=["tfidf", "dense"],
+        default="tfidf",
+        help="Deduplicate lexically or semantically, see dissimilar.py --mode",
+    )
+    parser.add_argument(
+        "--ann",
+        choices=["auto", "hnswlib", "faiss", "exact"],
+        default="auto",
+        help="Nearest neighbour search of the dense mode",
+    )
+    parser.add_argument(
+        "--neighbours",
+        type=int,
+        default=32,
+        help="Nearest neighbours searched per paragraph in the dense mode",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Shuffle seed")
+    args, parser_args = parser.parse_known_args()
+
+    from dm_parser import DailyMedPipeline, makeConfig, makeFileList
+    from embeddings import DEFAULT_MODEL
+    from feature_store import FeatureStore
+
+    start = time.time()
+    pipeline = DailyMedPipeline(makeConfig(parser_args))
+    rows = None
+    if not args.no_parse:
+        if pipeline.config.process:
+            rows = parseCleanRows(pipeline, args.keep_results)
+        else:
+            pipeline.run()
+        pipeline.metrics.summary()
+    if rows is None:
+        sources = list(makeFileList(pipeline.config))
+        csv_files = listIndicationFiles(pipeline.paths["result_dir"], sources)
+        print(f"Cleaning the indications of {len(csv_files)} file(s)...")
+        rows = readCleanRows(csv_files)
+
+    results = runGoldPipeline(
+        rows,
+        args.output,
+        [float(t) for t in args.thresholds.split(",")],
+        FeatureStore(args.features) if args.features else None,
+        args.dedup_mode,
+        {"model": DEFAULT_MODEL, "backend": args.ann, "k": args.neighbours},
+        args.plot,
+        args.checkpoint_dir,
+        args.seed,
+    )
+    for threshold, (n_retained, output_csv) in results.items():
+        print(f"Threshold {threshold}: retained {n_retained}, written to {output_csv}")
+    print(f"Done in {time.time() - start:.1f} seconds")
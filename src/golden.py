@@ -0,0 +1,750 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from xml.sax.saxutils import escape
+
+from clean import clean_text
+from dm_parser import parseIndications
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+CURATION_FILE = os.path.join(DATA_DIR, "curation.jsonl")
+GOLDEN_FILE = os.path.join(DATA_DIR, "golden.json")
+BASELINE_FILE = os.path.join(DATA_DIR, "benchmark.json")
+TERMS_FILE = os.path.join(os.path.dirname(__file__), "..", "res", "terms.txt")
+SENTENCE_END = re.compile(r"(?<=\.) ")
+
+# texts and the sentences segmentSentences() must split them into
+SENTENCE_CASES = [
+    (
+        "Treats chronic hepatitis C. Also for HIV-1 infection.",
+        ["Treats chronic hepatitis C.", "Also for HIV-1 infection."],
+    ),
+    ("Treats vitamin D. Use with care.", ["Treats vitamin D.", "Use with care."]),
+    (
+        "Studied by Dr. J. R. Smith in adults. Use with care.",
+        ["Studied by Dr. J. R. Smith in adults.", "Use with care."],
+    ),
+    (
+        "Relieves pain, e.g. headache. Approved in the U.S. for adults.",
+        ["Relieves pain, e.g. headache.", "Approved in the U.S. for adults."],
+    ),
+]
+
+# the configuration the golden outputs are recorded with
+DEFAULT_CONFIG = {
+    "limit": 500,
+    "seed": 0,
+    "parts": 2,
+    "labels": 40,
+    "thresholds": [0.8, 0.9],
+}
+
+# the extraction backends run over the synthetic corpus: the store, the
+# codec and the number of prefetch threads
+BACKENDS = [
+    ("files", "gzip:9", 0),
+    ("files", "gzip:9", 4),
+    ("files", "none", 4),
+    ("files", "zstd", 4),
+    ("shards", "gzip:9", 4),
+    ("shards", "zstd", 0),
+]
+
+
+def loadCuration(filename=CURATION_FILE, limit=None):
+    """Loads the curated indication texts, the first `limit` of them."""
+    texts = []
+    with open(filename, "r") as f:
+        for line in f:
+            texts.append(json.loads(line)["text"])
+            if limit is not None and len(texts) >= limit:
+                break
+    return texts
+
+
+def makeLabelXml(text, rng):
+    """
+    Lays out a curated indication text as the indications section of an SPL
+    document, the way labels do: sentences spread over paragraphs, list
+    items, line breaks and the cells of table rows, inline markup, and
+    irregular indentation and line breaks.
+
+    Args:
+        text: the curated text
+        rng: a random.Random instance
+
+    Returns:
+        bytes: The SPL document
+    """
+    blocks = []
+    for sentence in SENTENCE_END.split(text):
+        words = [escape(w) for w in sentence.split(" ")]
+        if len(words) > 2 and rng.random() < 0.5:
+            i = rng.randrange(len(words))
+            words[i] = f'<content styleCode="bold">{words[i]}</content>'
+        separator = rng.choice([" ", "\n      ", "  "])
+        body = separator.join(words)
+        # where the sentence is split between two cells, or by a line break
+        i = rng.randrange(1, len(words)) if len(words) > 1 else None
+        layout = rng.random()
+        if layout < 0.3:
+            blocks.append(f"<list>\n  <item>{body}</item>\n</list>")
+        elif layout < 0.45 and i is not None:
+            cells = [separator.join(words[:i]), separator.join(words[i:])]
+            blocks.append(
+                f"<table>\n  <tbody><tr><td>{cells[0]}</td>"
+                f"<th>{cells[1]}</th></tr></tbody>\n</table>"
+            )
+        elif layout < 0.6 and i is not None:
+            body = f"{separator.join(words[:i])}<br/>{separator.join(words[i:])}"
+            blocks.append(f"<paragraph>\n    {body}\n  </paragraph>")
+        else:
+            blocks.append(f"<paragraph>\n    {body}\n  </paragraph>")
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<document xmlns="urn:hl7-org:v3">
+  <id root="golden-document"/>
+  <setId root="golden-set"/>
+  <versionNumber value="1"/>
+  <component><structuredBody><component>
+  <section>
+    <code code="34067-9" codeSystem="2.16.840.1.113883.6.1"/>
+    <title>1 INDICATIONS AND USAGE</title>
+    <text>
+  {"  ".join(blocks)}
+    </text>
+  </section>
+  </component></structuredBody></component>
+</document>
+""".encode()
+
+
+def parseCurated(texts, seed=0):
+    """Parses a label laid out around each curated text, see makeLabelXml().
+
+    Returns:
+        list[list[IndicationRecord]] The records of every text
+    """
+    rng = random.Random(seed)
+    return [parseIndications(makeLabelXml(text, rng)) for text in texts]
+
+
+def checkTextAssembly(texts, seed=0, parsed=None):
+    """
+    Checks that the text assembled by parseIndications() from a label holding
+    each curated text cleans back to that text.
+
+    Args:
+        texts: the curated texts
+        seed: the seed of the layout of the labels
+        parsed: the records of every text, see parseCurated(), parsed here\
+            by default
+
+    Returns:
+        list[tuple(int, str, str)] The index, expected and actual text of
+            every mismatch
+    """
+    if parsed is None:
+        parsed = parseCurated(texts, seed)
+    mismatches = []
+    for i, (text, rows) in enumerate(zip(texts, parsed)):
+        expected = clean_text(text)
+        actual = None
+        if len(rows) == 1 and rows[0].length == len(rows[0].text):
+            # the section title is the first line of the assembled text
+            title, body = rows[0].text.split("\n", 1)
+            actual = clean_text(body) if title == "1 INDICATIONS AND USAGE" else None
+        if actual != expected:
+            mismatches.append((i, expected, actual))
+    return mismatches
+
+
+def checkSentences(cases=SENTENCE_CASES):
+    """
+    Checks the sentences segmentSentences() splits texts into.
+
+    Returns:
+        list[tuple(str, list, list)] The text, expected and actual sentences
+            of every mismatch
+    """
+    from sentences import segmentSentences
+
+    mismatches = []
+    for text, expected in cases:
+        actual = [text[start:end] for start, end in segmentSentences(text)]
+        if actual != expected:
+            mismatches.append((text, expected, actual))
+    return mismatches
+
+
+def checkWrappedSentence():
+    """
+    Checks that code_explorer.explore() finds the first phrase of a sentence
+    wrapped over several lines of the XML once, as it does on one line.
+
+    Returns:
+        dict: The term counts, empty if they are the expected ones
+    """
+    import code_explorer
+    from vocabulary import Vocabulary
+
+    xml = b"""<document xmlns="urn:hl7-org:v3"><section>
+  <code code="34067-9"/>
+  <text><paragraph>Drug X is indicated for
+      the management of
+      pain.</paragraph></text>
+</section></document>"""
+    code_dict = defaultdict(code_explorer.CodeInfo)
+    term_dict = defaultdict(int)
+    vocabulary = Vocabulary({None: ["indicated for", "management of"]})
+    code_explorer.explore(io.BytesIO(xml), vocabulary, code_dict, term_dict)
+    return {} if dict(term_dict) == {"indicated for": 1} else dict(term_dict)
+
+
+def readSubset(csv_path, jsonl_path):
+    """Reads the records of a subset, from its CSV file without the index
+    column and from its JSONL file, in a canonical order."""
+    import csv
+
+    with open(csv_path, newline="") as f:
+        rows = sorted(tuple(row[1:]) for row in csv.reader(f))
+    with open(jsonl_path) as f:
+        records = sorted(json.dumps(json.loads(line), sort_keys=True) for line in f)
+    return rows, records
+
+
+def checkSubsets(texts, seed=0):
+    """
+    Checks that make_data_subsets.py writes the same records, up to their
+    shuffled order, with and without --stream, from a full text CSV holding
+    the curated texts and duplicates of some of them.
+
+    Args:
+        texts: the curated texts
+        seed: the seed of the shuffle of the streaming mode
+
+    Returns:
+        list[str] The outputs that differ
+    """
+    import csv
+
+    import make_data_subsets
+
+    differences = []
+    with tempfile.TemporaryDirectory() as root:
+        for mode in ["memory", "stream"]:
+            os.makedirs(f"{root}/{mode}")
+            with open(f"{root}/{mode}/indications_full_text.csv", "w") as f:
+                writer = csv.writer(f)
+                writer.writerow(["set_id", "xml_id", "version_number", "indication"])
+                for i, text in enumerate(texts + texts[: len(texts) // 10]):
+                    writer.writerow([f"set-{i}", f"doc-{i}", i % 7 + 1, text])
+        with contextlib.redirect_stdout(io.StringIO()):
+            make_data_subsets.makeSubsets(make_data_subsets.getPaths(f"{root}/memory"))
+            make_data_subsets.streamSubsets(
+                make_data_subsets.getPaths(f"{root}/stream"), 50, 4, seed
+            )
+        memory = make_data_subsets.getPaths(f"{root}/memory")
+        stream = make_data_subsets.getPaths(f"{root}/stream")
+        for csv_name, jsonl_name in [
+            ("cleancsv", "cleanjsonl"),
+            ("smallercsv", "smallerjsonl"),
+        ]:
+            expected = readSubset(memory[csv_name], memory[jsonl_name])
+            actual = readSubset(stream[csv_name], stream[jsonl_name])
+            for name, expected_records, records in zip(
+                [csv_name, jsonl_name], expected, actual
+            ):
+                if records != expected_records:
+                    differences.append(name)
+    return differences
+
+
+def checkGoldPipeline(root, config):
+    """
+    Checks that gold_pipeline.py writes the same gold standard sets as
+    clean.py then dissimilar.py on the merged indications, for release
+    files listed as --files all lists them, the rx parts before the otc ones,
+    both from the records handed over by the parser without writing its
+    results and from the parts of the release files.
+
+    Args:
+        root: a directory for the working directory
+        config: the golden configuration, see DEFAULT_CONFIG
+
+    Returns:
+        list[str] The gold standard sets that differ
+    """
+    import pandas as pd
+
+    from benchmark import makeSyntheticCorpus
+    from clean import clean_dataframe
+    from dissimilar import sweep_thresholds
+    from dm_parser import DailyMedPipeline
+    from gold_pipeline import (
+        listIndicationFiles,
+        parseCleanRows,
+        readCleanRows,
+        runGoldPipeline,
+    )
+
+    working_dir = f"{root}/gold"
+    filenames = makeSyntheticCorpus(
+        working_dir, 1, config["labels"], seed=config["seed"], markets=("rx", "otc")
+    )
+    pipeline = DailyMedPipeline(
+        working_dir=working_dir, files=",".join(filenames), extract=True, process=True
+    )
+    thresholds = config["thresholds"]
+    result_dir = pipeline.paths["result_dir"]
+    differences = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        runGoldPipeline(parseCleanRows(pipeline), f"{root}/memory.csv", thresholds)
+        if os.path.exists(f"{result_dir}/parts") or os.path.exists(
+            f"{result_dir}/indications.csv"
+        ):
+            differences.append("the parser results were written in memory mode")
+        pipeline.run()
+        # the scripts, each reading the output file of the previous one
+        cleaned = clean_dataframe(pd.read_csv(f"{result_dir}/indications.csv"))
+        cleaned.to_csv(f"{root}/cleaned.csv", index=False)
+        df = pd.read_csv(f"{root}/cleaned.csv")
+        removed = sweep_thresholds(df, thresholds)
+        for threshold in thresholds:
+            gold = df.drop(index=df.index[removed[threshold]])
+            gold.to_csv(f"{root}/chain-{threshold}.csv", index=False)
+        runGoldPipeline(
+            readCleanRows(listIndicationFiles(result_dir, filenames)),
+            f"{root}/parts.csv",
+            thresholds,
+        )
+    for threshold in thresholds:
+        for name in ["memory", "parts"]:
+            if fileDigest(f"{root}/chain-{threshold}.csv") != fileDigest(
+                f"{root}/{name}-{threshold}.csv"
+            ):
+                differences.append(
+                    f"the gold standard set at {threshold} from the {name} "
+                    "differs from the one of clean.py and dissimilar.py"
+                )
+    return differences
+
+
+def checkIncrementalRuns(root, config):
+    """
+    Checks the runs that reuse a working directory: a run after the
+    extracted files and a part were deleted extracts and processes them
+    again instead of quarantining every document, and a run over one
+    release file merges only its part. The parse cache is off, as it would
+    hide the deleted files.
+
+    Args:
+        root: a directory for the working directory
+        config: the golden configuration, see DEFAULT_CONFIG
+
+    Returns:
+        list[str] The runs whose outputs are wrong
+    """
+    import csv
+
+    from benchmark import makeSyntheticCorpus
+    from dm_parser import DailyMedPipeline
+
+    working_dir = f"{root}/incremental"
+    filenames = makeSyntheticCorpus(
+        working_dir, 1, 20, seed=config["seed"], markets=("rx", "otc")
+    )
+
+    def run(files):
+        pipeline = DailyMedPipeline(
+            working_dir=working_dir,
+            files=",".join(files),
+            extract=True,
+            process=True,
+            no_cache=True,
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline.run()
+        return pipeline.paths["result_dir"]
+
+    def rows(filename):
+        # the lines of a part end with \r\n, the merged ones with \n
+        with open(filename, newline="") as f:
+            return list(csv.reader(f))
+
+    differences = []
+    result_dir = run(filenames)
+    indications = fileDigest(f"{result_dir}/indications.csv")
+
+    shutil.rmtree(f"{working_dir}/extract")
+    os.remove(f"{result_dir}/parts/{filenames[0]}.csv")
+    run(filenames)
+    if os.path.getsize(f"{result_dir}/quarantine.jsonl") > 0:
+        differences.append("documents quarantined after extract/ was deleted")
+    if fileDigest(f"{result_dir}/indications.csv") != indications:
+        differences.append("indications changed after extract/ was deleted")
+
+    run(filenames[:1])
+    if rows(f"{result_dir}/indications.csv") != rows(
+        f"{result_dir}/parts/{filenames[0]}.csv"
+    ):
+        differences.append(f"a run over {filenames[0]} merged other parts")
+    return differences
+
+
+def checkThroughput(baseline_file, max_slowdown):
+    """
+    Runs benchmark.py on the corpus configuration of a throughput baseline,
+    and compares the files/s of each stage with it. A missing baseline is
+    measured and written instead, as throughput is only comparable on the
+    same machine.
+
+    Args:
+        baseline_file: the JSON result file of benchmark.py
+        max_slowdown: the largest drop of files/s allowed, in percent
+
+    Returns:
+        bool: True if a stage slowed down by more than max_slowdown
+    """
+    command = [sys.executable, os.path.join(os.path.dirname(__file__), "benchmark.py")]
+    if not os.path.exists(baseline_file):
+        subprocess.run(command + ["-o", baseline_file], check=True)
+        print(f"Throughput baseline written to {baseline_file}")
+        return False
+    with open(baseline_file) as f:
+        saved = json.load(f)
+    for name, value in saved["config"].items():
+        command += [f"--{name.replace('_', '-')}", str(value)]
+    command += ["--compare", baseline_file, "--max-slowdown", str(max_slowdown)]
+    return subprocess.run(command).returncode != 0
+
+
+def digest(values):
+    """Returns the MD5 of a sequence of strings, each ended by a NUL."""
+    md5 = hashlib.md5()
+    for value in values:
+        md5.update(str(value).encode())
+        md5.update(b"\0")
+    return md5.hexdigest()
+
+
+def fileDigest(filename):
+    md5 = hashlib.md5()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def exploreDigest(paths, store, vocabulary):
+    """
+    Runs code_explorer.explore() over the extracted documents of a run and
+    returns the digest of its code and term counts, which do not depend on
+    the order of the documents.
+    """
+    import code_explorer
+    from shard_store import ShardStore
+    from spl_codec import readFile
+
+    code_dict = defaultdict(code_explorer.CodeInfo)
+    term_dict = defaultdict(int)
+    if store == "shards":
+        with ShardStore(paths["shard_dir"]) as shards:
+            documents = [xml_bytes for _, xml_bytes in shards.scan()]
+    else:
+        directory = paths["extraction_dir"]
+        documents = [readFile(f"{directory}/{f}") for f in os.listdir(directory)]
+    for xml_bytes in documents:
+        code_explorer.explore(io.BytesIO(xml_bytes), vocabulary, code_dict, term_dict)
+
+    def counts(dist):
+        return sorted(dist.items(), key=lambda item: str(item[0]))
+
+    codes = {
+        code: [
+            info.display_name,
+            info.total_occurrences,
+            info.matching_occurrences,
+            counts(info.term_dist),
+            counts(info.category_dist),
+        ]
+        for code, info in code_dict.items()
+    }
+    return digest([json.dumps(codes, sort_keys=True), json.dumps(counts(term_dict))])
+
+
+def runBackends(root, config, vocabulary, backends=BACKENDS):
+    """
+    Runs the parser with every extraction backend over the same synthetic
+    corpus, each in its own working directory. Each backend runs twice: a
+    first extraction scanning the release files and filling the parse
+    cache, then a forced one reading the members from the member manifests
+    and the records from the cache.
+
+    Args:
+        root: the directory of the working directories
+        config: the golden configuration, see DEFAULT_CONFIG
+        vocabulary: the compiled vocabulary of code_explorer
+        backends: the (store, codec, prefetch threads) of every backend
+
+    Returns:
+        dict: run name -> (indications CSV file, indications digest,\
+            explore digest)
+    """
+    from benchmark import makeSyntheticCorpus
+    from dm_parser import DailyMedPipeline
+
+    runs = {}
+    for store, codec, threads in backends:
+        if codec.startswith("zstd"):
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                print(f"Skipping {store}/{codec}, zstandard is not installed")
+                continue
+        name = f"{store}/{codec}/{threads}"
+        working_dir = f"{root}/{name.replace('/', '-').replace(':', '')}"
+        filenames = makeSyntheticCorpus(
+            working_dir, config["parts"], config["labels"], seed=config["seed"]
+        )
+        for run, force in [("scan", False), ("manifest", True)]:
+            pipeline = DailyMedPipeline(
+                working_dir=working_dir,
+                files=",".join(filenames),
+                extract=True,
+                process=True,
+                force=force,
+                store=store,
+                codec=codec,
+                prefetch_threads=threads,
+            )
+            with contextlib.redirect_stdout(io.StringIO()):
+                pipeline.run()
+                explored = exploreDigest(pipeline.paths, store, vocabulary)
+            csv_file = f"{pipeline.paths['result_dir']}/indications.csv"
+            runs[f"{name} {run}"] = (csv_file, fileDigest(csv_file), explored)
+    return runs
+
+
+def computeOutputs(config, texts, root, parsed=None):
+    """
+    Computes the digests of the outputs of every stage on the golden inputs:
+    the curated texts and a synthetic corpus.
+
+    Args:
+        config: the golden configuration, see DEFAULT_CONFIG
+        texts: the curated texts
+        root: a directory for the working directories of the backends
+        parsed: the records of every curated text, see parseCurated(),\
+            parsed here by default
+
+    Returns:
+        tuple(dict, list[str]) The outputs, see GOLDEN_FILE, and the\
+            disagreements between the extraction backends
+    """
+    import pandas as pd
+
+    from dissimilar import sweep_thresholds
+    from indication_record import readRecords
+    from vocabulary import compileVocabulary
+
+    outputs = {}
+    if parsed is None:
+        parsed = parseCurated(texts, config["seed"])
+    outputs["text_assembly"] = digest(r for rows in parsed for r in rows)
+
+    runs = runBackends(root, config, compileVocabulary(TERMS_FILE))
+    disagreements = []
+    first, (csv_file, indications, explored) = next(iter(runs.items()))
+    for name, (_, other_indications, other_explored) in runs.items():
+        if other_indications != indications:
+            disagreements.append(f"{name}: indications differ from {first}")
+        if other_explored != explored:
+            disagreements.append(f"{name}: explore counts differ from {first}")
+    outputs["indications"] = indications
+    outputs["explore"] = explored
+
+    corpus_texts = [record.text for record in readRecords(csv_file)]
+    outputs["clean_text"] = digest(clean_text(t) for t in corpus_texts + texts)
+
+    # the dedup of the distinct cleaned curated texts, in their curated order
+    cleaned = list(dict.fromkeys(clean_text(t) for t in texts))
+    outputs["texts"] = len(cleaned)
+    with contextlib.redirect_stdout(io.StringIO()):
+        removed = sweep_thresholds(
+            pd.DataFrame({"text": cleaned}), config["thresholds"]
+        )
+    outputs["gold_standard"] = {
+        str(threshold): {"removed": len(indices), "digest": digest(sorted(indices))}
+        for threshold, indices in removed.items()
+    }
+    return outputs, disagreements
+
+
+def compareOutputs(outputs, golden, tolerance=0.01):
+    """
+    Compares outputs with the golden ones. Every output must be identical,
+    except the dedup of the gold standard, whose number of removed texts may
+    differ by a fraction of the texts, as the similarities are floating
+    point sums.
+
+    Args:
+        outputs: the outputs, see computeOutputs()
+        golden: the golden outputs
+        tolerance: the fraction of the texts the dedup may differ by
+
+    Returns:
+        list[str] The differences, with a "within tolerance" note for the\
+            tolerated ones
+    """
+    differences = []
+    for name, value in outputs.items():
+        if name == "gold_standard":
+            continue
+        if golden.get(name) != value:
+            differences.append(f"{name}: {value} instead of {golden.get(name)}")
+    n_texts = golden["texts"]
+    for threshold, dedup in outputs["gold_standard"].items():
+        expected = golden["gold_standard"].get(threshold)
+        if expected is None or expected["digest"] == dedup["digest"]:
+            continue
+        change = abs(dedup["removed"] - expected["removed"])
+        note = " (within tolerance)" if change <= tolerance * n_texts else ""
+        differences.append(
+            f"gold_standard {threshold}: removed {dedup['removed']} texts instead "
+            f"of {expected['removed']}{note}"
+        )
+    return differences
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the indication text assembly against curated texts, "
+        "and the outputs of every extraction backend and stage against the "
+        "golden outputs."
+    )
+    parser.add_argument("--curation", default=CURATION_FILE, help="Curated JSONL")
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help=f"Texts to check (default: {DEFAULT_CONFIG['limit']}, or as recorded "
+        "in the golden file)",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Layout seed")
+    parser.add_argument("--golden", default=GOLDEN_FILE, help="Golden outputs")
+    parser.add_argument(
+        "--update",
+        default=False,
+        action="store_true",
+        help="Record the current outputs as the golden ones, after an intended "
+        "change of the outputs",
+    )
+    parser.add_argument(
+        "--text-only",
+        default=False,
+        action="store_true",
+        help="Only check the text assembly against the curated texts",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.01,
+        help="Fraction of the texts by which the dedup may differ",
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=None,
+        help="Also benchmark the stages, and fail when the files/s of one drops by "
+        "more than this percentage from --baseline",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=BASELINE_FILE,
+        help="Throughput baseline of this machine, measured when missing",
+    )
+    args = parser.parse_args()
+
+    golden = None
+    if os.path.exists(args.golden) and not args.update:
+        with open(args.golden) as f:
+            golden = json.load(f)
+    # the golden outputs are only comparable with their own configuration
+    config = dict(golden["config"] if golden is not None else DEFAULT_CONFIG)
+    for name in ["limit", "seed"]:
+        value = getattr(args, name)
+        if value is not None:
+            if golden is not None and value != config[name] and not args.text_only:
+                parser.error(
+                    f"{args.golden} was recorded with --{name} {config[name]}, "
+                    "use --update to record new golden outputs"
+                )
+            config[name] = value
+
+    texts = loadCuration(args.curation, config["limit"])
+    parsed = parseCurated(texts, config["seed"])
+    mismatches = checkTextAssembly(texts, config["seed"], parsed)
+    sentence_mismatches = checkSentences()
+    for text, expected, actual in sentence_mismatches:
+        print(
+            f"Sentence mismatch on {text!r}:\n  expected: {expected}\n"
+            f"  actual:   {actual}"
+        )
+    wrapped_counts = checkWrappedSentence()
+    if wrapped_counts:
+        print(f"Explore mismatch on a wrapped sentence: {wrapped_counts}")
+    failed = bool(sentence_mismatches or wrapped_counts)
+    if not args.text_only:
+        with tempfile.TemporaryDirectory() as root:
+            outputs, disagreements = computeOutputs(config, texts, root, parsed)
+            subset_differences = checkSubsets(texts, config["seed"])
+            gold_differences = checkGoldPipeline(root, config)
+            incremental_differences = checkIncrementalRuns(root, config)
+        for disagreement in disagreements:
+            print(f"Backend mismatch: {disagreement}")
+        for name in subset_differences:
+            print(f"Subset mismatch: {name} differs with --stream")
+        for difference in gold_differences:
+            print(f"Gold pipeline mismatch: {difference}")
+        for difference in incremental_differences:
+            print(f"Incremental run mismatch: {difference}")
+        failed = failed or bool(
+            disagreements
+            or subset_differences
+            or gold_differences
+            or incremental_differences
+        )
+        if golden is None:
+            with open(args.golden, "w") as f:
+                json.dump({"config": config, "outputs": outputs}, f, indent=2)
+                f.write("\n")
+            print(f"Golden outputs written to {args.golden}")
+        else:
+            differences = compareOutputs(outputs, golden["outputs"], args.tolerance)
+            for difference in differences:
+                print(f"Golden mismatch: {difference}")
+            failed = failed or any(
+                not d.endswith("(within tolerance)") for d in differences
+            )
+            print(
+                f"Golden outputs: {len(differences)} difference(s) with "
+                f"{args.golden}"
+            )
+    for i, expected, actual in mismatches[:10]:
+        print(
+            f"Mismatch on text {i}:\n  expected: {expected!r}\n  actual:   {actual!r}"
+        )
+    print(f"Text assembly: {len(texts) - len(mismatches)}/{len(texts)} texts match")
+    if args.max_slowdown is not None:
+        failed = checkThroughput(args.baseline, args.max_slowdown) or failed
+    sys.exit(1 if mismatches or failed else 0)
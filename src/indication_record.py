@@ -0,0 +1,168 @@
+import csv
+import sys
+from typing import NamedTuple
+
+
+class IndicationRecord(NamedTuple):
+    """
+    An indication section of an SPL document, one row of the indications CSV.
+
+    Attributes:
+            set_id (str): The setId of the label
+            xml_id (str): The id of the document
+            version_number (int): The version of the label
+            type (str): The type of the section, indication
+            length (int): The number of characters of the text
+            text (str): The text of the section
+            sentences (str): The sentence spans of the text, see formatSpans()
+    """
+
+    set_id: str
+    xml_id: str
+    version_number: int
+    type: str
+    length: int
+    text: str
+    sentences: str
+
+
+INDICATION_FIELDS = list(IndicationRecord._fields)
+
+
+def fromRow(row):
+    """
+    Makes a record from a CSV row or a cached row, a dict or a sequence in
+    the order of the fields, whose numbers may be strings.
+    """
+    if isinstance(row, dict):
+        return IndicationRecord(
+            row["set_id"],
+            row["xml_id"],
+            int(row["version_number"]),
+            row.get("type") or "indication",
+            int(row["length"]),
+            row["text"],
+            row.get("sentences") or "",
+        )
+    set_id, xml_id, version_number, type, length, text, sentences = row
+    return IndicationRecord(
+        set_id, xml_id, int(version_number), type, int(length), text, sentences
+    )
+
+
+def validateRecords(records):
+    """
+    Checks the types and consistency of a batch of records, such as the rows
+    of one document.
+
+    Raises:
+        ValueError: if a record is invalid
+    """
+    for i, record in enumerate(records):
+        if not isinstance(record, IndicationRecord):
+            raise ValueError(f"Row {i} is a {type(record).__name__}, not a record")
+        if not record.set_id or not record.xml_id:
+            raise ValueError(f"Row {i} has no setId or document id")
+        if type(record.version_number) is not int or record.version_number < 0:
+            raise ValueError(
+                f"Row {i} of {record.set_id} has an invalid version "
+                f"{record.version_number!r}"
+            )
+        if not isinstance(record.text, str) or record.length != len(record.text):
+            raise ValueError(
+                f"Row {i} of {record.set_id} has a length of {record.length!r} "
+                "that is not the length of its text"
+            )
+
+
+def readRecords(csv_filename):
+    """
+    Reads the records of an indications CSV file. The columns are found by
+    their name, and a file without sentences, such as the output of
+    clean.py, has empty sentences.
+
+    Returns:
+        generator of IndicationRecord
+    """
+    csv.field_size_limit(sys.maxsize)
+    with open(csv_filename, "r", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        missing = {"set_id", "xml_id", "version_number", "text"} - set(header)
+        if missing:
+            raise ValueError(
+                f"{csv_filename} has no {', '.join(sorted(missing))} column(s)"
+            )
+        # the position of every field, None for a missing optional one
+        at = {f: header.index(f) if f in header else None for f in INDICATION_FIELDS}
+        for row in reader:
+            text = row[at["text"]]
+            yield IndicationRecord(
+                row[at["set_id"]],
+                row[at["xml_id"]],
+                int(row[at["version_number"]]),
+                row[at["type"]] if at["type"] is not None else "indication",
+                len(text),
+                text,
+                row[at["sentences"]] if at["sentences"] is not None else "",
+            )
+
+
+def writeRecords(f, records, header=True):
+    """Writes records to an open CSV file, without building a dict per row."""
+    writer = csv.writer(f, delimiter=",")
+    if header:
+        writer.writerow(INDICATION_FIELDS)
+    writer.writerows(records)
+
+
+def importPyArrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Arrow tables require the pyarrow package")
+    return pyarrow
+
+
+class IndicationColumns:
+    """
+    Builds the columns of a set of records, one list per field, so that the
+    records can be written or turned into an Arrow table without a dict per
+    row. Iterating over the columns yields the records.
+
+    Attributes:
+            columns (list[list]): The values of every field, in field order
+    """
+
+    def __init__(self):
+        self.columns = [[] for _ in INDICATION_FIELDS]
+
+    def extend(self, records):
+        records = list(records)
+        if not records:
+            return
+        for column, values in zip(self.columns, zip(*records)):
+            column.extend(values)
+
+    def column(self, name):
+        return self.columns[INDICATION_FIELDS.index(name)]
+
+    def toArrow(self):
+        """
+        Returns the records as a pyarrow Table, with integer versions and
+        lengths. Requires the optional pyarrow package.
+        """
+        pa = importPyArrow()
+        types = {"version_number": pa.int64(), "length": pa.int64()}
+        return pa.table(
+            {
+                name: pa.array(column, type=types.get(name, pa.string()))
+                for name, column in zip(INDICATION_FIELDS, self.columns)
+            }
+        )
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __iter__(self):
+        return map(IndicationRecord._make, zip(*self.columns))
@@ -0,0 +1,169 @@
+import argparse
+import glob
+import os
+import time
+
+from release_manifest import findMembers, readDocument, releaseStat
+from shard_store import ShardStore
+from spl_codec import EXTENSIONS, readFile
+
+MEMBERS_SUFFIX = ".members.tsv"
+
+
+def findEntries(state_dir, key):
+    """
+    Finds the documents of a key in the member manifests written by the
+    extractions of the release files, through their key index.
+
+    Returns:
+        list[tuple(str, ManifestHeader, MemberEntry)] The release file, the\
+            header of its manifest and the entry of every matching document
+    """
+    found = []
+    for members_filename in sorted(glob.glob(f"{state_dir}/*{MEMBERS_SUFFIX}")):
+        members = findMembers(members_filename, key)
+        if members is None:
+            continue
+        release = os.path.basename(members_filename)[: -len(MEMBERS_SUFFIX)]
+        header, entries = members
+        found.extend((release, header, entry) for entry in entries)
+    return found
+
+
+def readFromRelease(release_path, entry):
+    fd = os.open(release_path, os.O_RDONLY)
+    try:
+        return readDocument(fd, entry)
+    finally:
+        os.close(fd)
+
+
+def readFromStore(paths, xml_name):
+    """Reads an extracted XML document from the extraction directory or the
+    shards, whatever its codec. Returns None if it was not extracted."""
+    for extension in EXTENSIONS.values():
+        path = f"{paths['extraction_dir']}/{xml_name}{extension}"
+        if os.path.exists(path):
+            return readFile(path), path
+    with ShardStore(paths["shard_dir"]) as shards:
+        for shard_entry in shards.find(xml_name):
+            return shards.readEntry(shard_entry), shard_entry.shard
+    return None
+
+
+def isCurrent(header):
+    """Tells whether the release file a manifest was read from is still there,
+    unchanged since then."""
+    try:
+        return releaseStat(header.release_path) == header.release_stat
+    except OSError:
+        return False
+
+
+def locateDocuments(key, paths):
+    """
+    Reads the documents of a setId, SPL zip name or XML filename, from the
+    local release file when the member manifest still describes it, or else
+    from the extracted store.
+
+    Args:
+        key: the setId, SPL zip name or XML filename
+        paths: the application paths, see dm_parser.makePaths()
+
+    Returns:
+        list[tuple(str, bytes)] Where each document was read, and its content
+    """
+    documents = []
+    # whether each release file still has the content its manifest describes
+    current = {}
+    for release, header, entry in findEntries(paths["state_dir"], key):
+        if release not in current:
+            current[release] = isCurrent(header)
+        if current[release]:
+            path = header.release_path
+            where = f"{path}:{entry.zip_name}:{entry.xml_name}"
+            documents.append((where, readFromRelease(path, entry)))
+            continue
+        stored = readFromStore(paths, entry.xml_name)
+        if stored is not None:
+            documents.append((stored[1], stored[0]))
+        else:
+            print(f"{entry.xml_name} of {release} is neither local nor extracted")
+
+    if not documents:
+        # without manifests, the shard index also knows setIds and names
+        with ShardStore(paths["shard_dir"]) as shards:
+            for shard_entry in shards.find(key):
+                documents.append((shard_entry.shard, shards.readEntry(shard_entry)))
+    return documents
+
+
+def printSections(xml_string, codes=None):
+    """
+    Prints the coded sections of an SPL document, with their LOINC code,
+    title and text.
+
+    Args:
+        xml_string: the content of the document
+        codes: the LOINC codes of the sections to print, all by default
+    """
+    from bs4 import BeautifulSoup
+    from dm_parser import sectionText
+
+    soup = BeautifulSoup(xml_string, "xml")
+    print(
+        f"setId {soup.setId['root']}, version {soup.versionNumber['value']}, "
+        f"document {soup.id['root']}"
+    )
+    title = soup.find("title")
+    if title is not None:
+        print(" ".join(title.get_text().split()))
+    for section in soup.find_all("section"):
+        code = section.find("code", recursive=False)
+        if code is None or (codes is not None and code.get("code") not in codes):
+            continue
+        print(f"\n== {code.get('code')} {code.get('displayName', '')}")
+        print(sectionText(section))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Print the sections of one label, read directly from the "
+        "local release files or the extracted documents."
+    )
+    parser.add_argument("key", help="setId, SPL zip name or XML filename")
+    parser.add_argument(
+        "-w",
+        "--working_dir",
+        default="/data/dailymed",
+        help="Working directory of dm_parser.py",
+    )
+    parser.add_argument(
+        "-c",
+        "--codes",
+        default=None,
+        help="Comma-separated LOINC codes of the sections to print, e.g. 34067-9",
+    )
+    parser.add_argument(
+        "--xml", default=False, action="store_true", help="Print the raw XML"
+    )
+    args = parser.parse_args()
+
+    from dm_parser import makeConfig, makePaths
+
+    start = time.perf_counter()
+    # the release files and their state are read from the member manifests,
+    # without creating or reading anything else in the working directory
+    paths = makePaths(makeConfig(working_dir=args.working_dir))
+    documents = locateDocuments(args.key, paths)
+    elapsed = time.perf_counter() - start
+    if not documents:
+        print(f"No document found for {args.key}")
+    for where, xml_string in documents:
+        print(f"# {where}")
+        if args.xml:
+            print(xml_string.decode())
+        else:
+            printSections(xml_string, args.codes.split(",") if args.codes else None)
+        print()
+    print(f"Found {len(documents)} document(s) in {elapsed * 1000:.0f} ms")
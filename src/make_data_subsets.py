@@ -1,51 +1,271 @@
-import pandas as pd
-import re
-import os
+import argparse
+import csv
 import gzip
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import re
+import tempfile
+from array import array
 
 folder = "./data"
-os.makedirs(folder, exist_ok=True)
 
-csvfile = f"{folder}/indications_full_text.csv"
-cleancsv = f"{folder}/indications_clean.csv"
-cleanjsonl = f"{folder}/indications_clean.jsonl"
-smallercsv = f"{folder}/indications_clean_150_to_600.csv"
-smallerjsonl = f"{folder}/indications_clean_150_to_600.jsonl"
-hist_plot = f"{folder}/indication_distribution.png"
+MIN_LENGTH = 150
+MAX_LENGTH = 600
+
+# the integer columns of the full text CSV, which pandas reads as numbers
+INTEGER_FIELDS = ["version_number"]
+
+
+def getPaths(folder):
+    """Names the input and output files of the subset generation.
+
+    Args:
+        folder: the directory containing indications_full_text.csv
+
+    Returns:
+        dict: Dictionary containing the file paths
+    """
+    return {
+        "csvfile": f"{folder}/indications_full_text.csv",
+        "cleancsv": f"{folder}/indications_clean.csv",
+        "cleanjsonl": f"{folder}/indications_clean.jsonl",
+        "smallercsv": f"{folder}/indications_clean_{MIN_LENGTH}_to_{MAX_LENGTH}.csv",
+        "smallerjsonl": (
+            f"{folder}/indications_clean_{MIN_LENGTH}_to_{MAX_LENGTH}.jsonl"
+        ),
+        "hist_plot": f"{folder}/indication_distribution.png",
+    }
 
 
 def clean(text):
     return re.sub(r"(\s){2,}", "\n", text.strip().encode("ascii", "ignore").decode())
 
 
-df = (
-    pd.read_csv(csvfile)
-    .drop_duplicates("indication")
-    .sample(frac=1)
-    .reset_index(drop=True)
-)
+def makeSubsets(paths):
+    """Loads the full text CSV in memory, then dedups, shuffles, cleans and
+    writes every output format with pandas.
+
+    Args:
+        paths: the dictionary returned by getPaths()
+    """
+    import pandas as pd
+
+    df = (
+        pd.read_csv(paths["csvfile"])
+        .drop_duplicates("indication")
+        .sample(frac=1)
+        .reset_index(drop=True)
+    )
+
+    df["indication_cleaned"] = df.apply(lambda row: clean(row["indication"]), axis=1)
+    df["length"] = df.apply(lambda row: len(row["indication_cleaned"]), axis=1)
+
+    cleanjsonl = paths["cleanjsonl"]
+    cleandf = df.drop("indication", axis=1)
+    cleandf.to_csv(paths["cleancsv"])
+    cleandf.to_json(cleanjsonl, orient="records", lines=True)
+    with open(cleanjsonl, "rb") as f_in, gzip.open(cleanjsonl + ".gz", "wb") as f_out:
+        f_out.writelines(f_in)
+
+    smallerjsonl = paths["smallerjsonl"]
+    smallerdf = cleandf[cleandf["length"].between(MIN_LENGTH, MAX_LENGTH)]
+    smallerdf.to_csv(paths["smallercsv"])
+    smallerdf.to_json(smallerjsonl, orient="records", lines=True)
+    with open(smallerjsonl, "rb") as f_in, gzip.open(
+        smallerjsonl + ".gz", "wb"
+    ) as f_out:
+        f_out.writelines(f_in)
+
+    ### plotting
+    d = df.drop(
+        ["set_id", "xml_id", "indication", "version_number", "indication_cleaned"],
+        axis=1,
+    )
+    plot = d.plot(kind="hist", bins=500)
+    plot.set_xlim(0, 5000)
+    plot.figure.savefig(paths["hist_plot"])
+
+
+class TeeWriter:
+    """
+    Writes each record to a CSV file, a JSONL file and a gzipped JSONL file
+    at the same time, so that the JSONL never has to be reread to compress it.
+
+    Attributes:
+            fields (list): The record fields, in output order
+            index (int): The number of records written so far, used as the CSV index
+    """
+
+    def __init__(self, csv_path, jsonl_path, fields):
+        self.fields = fields
+        self.index = 0
+        self.csv_fp = open(csv_path, "w", newline="")
+        self.jsonl_fp = open(jsonl_path, "w")
+        self.gz_fp = io.TextIOWrapper(gzip.open(jsonl_path + ".gz", "wb"))
+        self.csv_writer = csv.writer(self.csv_fp)
+        # mirror the unnamed index column written by DataFrame.to_csv
+        self.csv_writer.writerow([""] + fields)
+
+    def write(self, record):
+        self.csv_writer.writerow([self.index] + [record[k] for k in self.fields])
+        line = json.dumps(record) + "\n"
+        self.jsonl_fp.write(line)
+        self.gz_fp.write(line)
+        self.index += 1
+
+    def close(self):
+        self.csv_fp.close()
+        self.jsonl_fp.close()
+        self.gz_fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def readChunks(csv_path, chunk_size):
+    """Reads a CSV file as successive lists of at most chunk_size rows."""
+    with open(csv_path, newline="") as f:
+        reader = csv.DictReader(f)
+        while True:
+            chunk = list(itertools.islice(reader, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+def externalShuffle(records, n_buckets, tmp_dir, rng):
+    """
+    Shuffles records without holding them all in memory.
+
+    Each record is spilled to a randomly chosen bucket file on disk, then
+    every bucket is loaded, shuffled in memory and emitted in turn, so memory
+    is bounded by the size of the largest bucket.
+
+    Args:
+        records: an iterable of JSON serializable records
+        n_buckets: the number of bucket files to spill into
+        tmp_dir: the directory in which bucket files are created
+        rng: a random.Random instance
+
+    Returns:
+        a generator of the shuffled records
+    """
+    bucket_paths = [f"{tmp_dir}/bucket_{i}.jsonl" for i in range(n_buckets)]
+    buckets = [open(p, "w") for p in bucket_paths]
+    try:
+        for record in records:
+            buckets[rng.randrange(n_buckets)].write(json.dumps(record) + "\n")
+    finally:
+        for b in buckets:
+            b.close()
+
+    for path in bucket_paths:
+        with open(path) as f:
+            bucket = [json.loads(line) for line in f]
+        os.remove(path)
+        rng.shuffle(bucket)
+        yield from bucket
+
+
+def streamSubsets(paths, chunk_size=10000, n_buckets=64, seed=None):
+    """
+    Produces the same records as makeSubsets() in bounded memory, shuffled
+    in another order.
+
+    The full text CSV is read in chunks, deduplicated on an MD5 digest of the
+    indication, cleaned, shuffled through bucket files on disk and written to
+    every output format in a single pass. The integer columns are numbers in
+    the JSONL files, as in the ones written by pandas.
+
+    Args:
+        paths: the dictionary returned by getPaths()
+        chunk_size: the number of CSV rows read at a time
+        n_buckets: the number of bucket files used by the external shuffle
+        seed: an optional seed for the shuffle
+    """
+    rng = random.Random(seed)
+    seen = set()
+    lengths = array("I")
+    fields = None
+
+    def cleaned_records():
+        nonlocal fields
+        for chunk in readChunks(paths["csvfile"], chunk_size):
+            for row in chunk:
+                indication = row.pop("indication")
+                digest = hashlib.md5(indication.encode()).digest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                for name in INTEGER_FIELDS:
+                    if name in row:
+                        row[name] = int(row[name]) if row[name] else None
+                row["indication_cleaned"] = clean(indication)
+                row["length"] = len(row["indication_cleaned"])
+                if fields is None:
+                    fields = list(row)
+                yield row
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(paths["cleancsv"])) as tmp:
+        shuffled = externalShuffle(cleaned_records(), n_buckets, tmp, rng)
+        first = next(shuffled, None)
+        if first is None:
+            print(f"No records found in {paths['csvfile']}")
+            return
+        with TeeWriter(
+            paths["cleancsv"], paths["cleanjsonl"], fields
+        ) as clean_writer, TeeWriter(
+            paths["smallercsv"], paths["smallerjsonl"], fields
+        ) as smaller_writer:
+            for record in itertools.chain([first], shuffled):
+                clean_writer.write(record)
+                if MIN_LENGTH <= record["length"] <= MAX_LENGTH:
+                    smaller_writer.write(record)
+                lengths.append(record["length"])
+
+    print(f"Number of unique indication(s): {len(lengths)}")
 
-df["indication_cleaned"] = df.apply(lambda row: clean(row["indication"]), axis=1)
-df["length"] = df.apply(lambda row: len(row["indication_cleaned"]), axis=1)
+    ### plotting
+    import matplotlib.pyplot as plt
 
-cleandf = df.drop("indication", axis=1)
-cleandf.to_csv(cleancsv)
-cleandf.to_json(cleanjsonl, orient="records", lines=True)
-with open(cleanjsonl, "rb") as f_in, gzip.open(cleanjsonl + ".gz", "wb") as f_out:
-    f_out.writelines(f_in)
+    fig, plot = plt.subplots()
+    plot.hist(lengths, bins=500)
+    plot.set_xlim(0, 5000)
+    fig.savefig(paths["hist_plot"])
 
 
-smallerdf = cleandf[cleandf["length"].between(150, 600)]
-smallerdf.to_csv(smallercsv)
-smallerdf.to_json(smallerjsonl, orient="records", lines=True)
-with open(smallerjsonl, "rb") as f_in, gzip.open(smallerjsonl + ".gz", "wb") as f_out:
-    f_out.writelines(f_in)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate cleaned and length-filtered subsets of the indications."
+    )
+    parser.add_argument(
+        "-f", "--folder", default=folder, help="Folder containing the full text CSV"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Process the CSV in chunks with an on-disk shuffle to bound memory",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=10000, help="Rows read per chunk"
+    )
+    parser.add_argument(
+        "--buckets", type=int, default=64, help="Bucket files for the on-disk shuffle"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Shuffle seed")
+    args = parser.parse_args()
 
+    os.makedirs(args.folder, exist_ok=True)
+    paths = getPaths(args.folder)
 
-### plotting
-d = df.drop(
-    ["set_id", "xml_id", "indication", "version_number", "indication_cleaned"], axis=1
-)
-plot = d.plot(kind="hist", bins=500)
-plot.set_xlim(0, 5000)
-plot.figure.savefig(hist_plot)
+    if args.stream:
+        streamSubsets(paths, args.chunk_size, args.buckets, args.seed)
+    else:
+        makeSubsets(paths)
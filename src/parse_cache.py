@@ -0,0 +1,122 @@
+import json
+import sqlite3
+import time
+import zlib
+
+
+class ParseCache:
+    """
+    An on-disk cache of parse results keyed by the MD5 of the XML content
+    and the version of the extractor that produced them.
+
+    Rows are stored as zlib-compressed JSON in a SQLite file. When the total
+    size of the stored rows exceeds max_bytes, the least recently used
+    entries are evicted.
+
+    Attributes:
+            filepath (str): The path of the SQLite file
+            version (str): The extractor version, part of every key
+            max_bytes (int): The maximum size of the stored rows
+            hits (int): The number of lookups answered by the cache
+            misses (int): The number of lookups not answered by the cache
+    """
+
+    def __init__(self, filepath, version, max_bytes=2 * 1024**3, commit_every=1000):
+        self.filepath = filepath
+        self.version = version
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self.pending = 0
+        self.touched = {}
+        self.db = sqlite3.connect(filepath)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                rows BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+        self.db.commit()
+
+    def key(self, md5):
+        return f"{self.version}:{md5}"
+
+    def get(self, md5):
+        """
+        Looks up the rows of a document.
+
+        Args:
+            md5: the MD5 hex digest of the XML content
+
+        Returns:
+            list[dict] The cached rows, or None if the document is not cached
+        """
+        key = self.key(md5)
+        result = self.db.execute(
+            "SELECT rows FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # recency updates are batched and written on commit
+        self.touched[key] = time.time()
+        return json.loads(zlib.decompress(result[0]))
+
+    def put(self, md5, rows):
+        """Stores the rows of a document."""
+        blob = zlib.compress(json.dumps(rows).encode())
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries (key, rows, size, last_used) "
+            "VALUES (?, ?, ?, ?)",
+            (self.key(md5), blob, len(blob), time.time()),
+        )
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def size(self):
+        query = "SELECT COALESCE(SUM(size), 0) FROM entries"
+        return self.db.execute(query).fetchone()[0]
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits in
+        max_bytes.
+
+        Returns:
+            int: The number of evicted entries
+        """
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return 0
+        cursor = self.db.execute("SELECT key, size FROM entries ORDER BY last_used")
+        keys = []
+        for key, size in cursor:
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.db.executemany("DELETE FROM entries WHERE key = ?", keys)
+        self.db.commit()
+        return len(keys)
+
+    def commit(self):
+        if self.touched:
+            self.db.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(t, k) for k, t in self.touched.items()],
+            )
+            self.touched = {}
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.evict()
+        self.db.close()
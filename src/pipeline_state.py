@@ -0,0 +1,79 @@
+import os
+
+
+class PipelineState:
+    """
+    A record, per stage and per release file, of the fingerprint of the
+    inputs a stage consumed and of the outputs it produced.
+
+    A stage can skip a release file when the fingerprint of its current
+    input equals the recorded one and the recorded outputs still exist.
+    The fingerprint of the outputs of one stage is the input fingerprint of
+    the next, so a change propagates down the pipeline and nothing else does.
+
+    Attributes:
+            filepath (str): The yaml file the state is persisted to
+            force (bool): Consider every release file as changed
+            stages (dict): stage -> release file -> {input, output, outputs}
+    """
+
+    def __init__(self, filepath, force=False):
+        self.filepath = filepath
+        self.force = force
+        self.stages = {}
+        import yaml
+
+        try:
+            with open(filepath, "r") as f:
+                self.stages = yaml.safe_load(f) or {}
+        except OSError:
+            pass
+
+    def get(self, stage, filename):
+        return self.stages.get(stage, {}).get(filename)
+
+    def isFresh(self, stage, filename, input_fingerprint):
+        """
+        Tells whether a stage already processed this input for a release file.
+
+        Args:
+            stage: the name of the stage
+            filename: the release file
+            input_fingerprint: the fingerprint of the current input
+
+        Returns:
+            bool: True if the recorded input matches and the outputs exist
+        """
+        if self.force:
+            return False
+        record = self.get(stage, filename)
+        if record is None or record["input"] != input_fingerprint:
+            return False
+        return all(os.path.exists(path) for path in record.get("outputs", []))
+
+    def outputFingerprint(self, stage, filename):
+        record = self.get(stage, filename)
+        return None if record is None else record["output"]
+
+    def record(self, stage, filename, input_fingerprint, output_fingerprint, outputs):
+        """Records the input and outputs of a stage for a release file and
+        persists the state."""
+        self.stages.setdefault(stage, {})[filename] = {
+            "input": input_fingerprint,
+            "output": output_fingerprint,
+            "outputs": list(outputs),
+        }
+        self.save()
+
+    def invalidate(self, stage, filename):
+        self.stages.get(stage, {}).pop(filename, None)
+        self.save()
+
+    def save(self):
+        import yaml
+
+        os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        tmp_filepath = f"{self.filepath}.tmp"
+        with open(tmp_filepath, "w") as f:
+            yaml.safe_dump(self.stages, f, default_flow_style=False)
+        os.replace(tmp_filepath, self.filepath)
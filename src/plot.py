@@ -1,14 +1,15 @@
 import pandas as pd
-from sentence_transformers import SentenceTransformer
 from sklearn.manifold import TSNE
 import plotly.express as px
 import csv
 import argparse
+from embeddings import DEFAULT_MODEL, computeEmbeddings
+from feature_store import FeatureStore
 
-def plot_tsne(sentences, out_file):
+def plot_tsne(sentences, out_file, store=None):
     print("Generating sentence embeddings...")
-    model = SentenceTransformer('distilbert-base-nli-mean-tokens')
-    embeddings = model.encode(sentences)
+    # Kept in the feature store, where dissimilar.py --mode dense reuses them
+    embeddings, _ = computeEmbeddings(sentences, DEFAULT_MODEL, store)
     
     print("Performing t-SNE dimensionality reduction...")
     tsne_embeddings = TSNE(n_components=2, random_state=42).fit_transform(embeddings)
@@ -36,9 +37,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate t-SNE plot for indication data.")
     parser.add_argument("input_csv_file", type=str, help="Path to the input CSV file.")
     parser.add_argument("output_image_file", type=str, help="Path to the output image file.")
+    parser.add_argument(
+        "--features",
+        type=str,
+        default=None,
+        help="Directory of the feature store, to reuse or save the sentence "
+        "embeddings.",
+    )
     args = parser.parse_args()
 
     indications = load_indications(args.input_csv_file)
-    plot_tsne(indications, args.output_image_file)
+    store = FeatureStore(args.features) if args.features else None
+    plot_tsne(indications, args.output_image_file, store)
 
     print("Completed")
\ No newline at end of file
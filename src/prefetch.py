@@ -0,0 +1,52 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+def prefetch(items, load, threads=4, depth=64):
+    """
+    Loads items ahead of their consumer with a pool of threads.
+
+    At most depth items are loaded or waiting to be consumed at any time, so
+    a slow consumer holds the readers back, and a slow reader is hidden by
+    the items already loaded. Items are yielded in their original order.
+    Threads overlap where load() waits for I/O or runs code that releases
+    the GIL, such as zlib, zstd or hashlib.
+
+    Args:
+        items: an iterable, consumed on the calling thread
+        load: a function called on every item from the pool threads
+        threads: the number of threads, 0 to load on the calling thread
+        depth: the maximum number of items loaded ahead
+
+    Returns:
+        a generator of (item, result, exception) tuples, exception being\
+            the exception raised by load(item), or None
+    """
+    if threads <= 0:
+        for item in items:
+            try:
+                yield item, load(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    pending = collections.deque()
+
+    def resolve(item, future):
+        try:
+            return item, future.result(), None
+        except Exception as e:
+            return item, None, e
+
+    with ThreadPoolExecutor(threads) as pool:
+        try:
+            for item in items:
+                pending.append((item, pool.submit(load, item)))
+                if len(pending) >= depth:
+                    yield resolve(*pending.popleft())
+            while pending:
+                yield resolve(*pending.popleft())
+        finally:
+            # the consumer may stop early, do not load what it will not read
+            for _, future in pending:
+                future.cancel()
@@ -0,0 +1,158 @@
+import argparse
+import csv
+import hashlib
+import os
+
+from indication_record import readRecords
+
+DIFF_FIELDS = [
+    "change",
+    "set_id",
+    "xml_id",
+    "version_number",
+    "length",
+    "text",
+    "sentences",
+]
+
+
+def readIndications(csv_filename):
+    """
+    Groups the records of an indications CSV file by setId, keeping the
+    records of the latest version of each label.
+
+    Returns:
+        dict: setId -> list of IndicationRecord
+    """
+    labels = {}
+    for record in readRecords(csv_filename):
+        records = labels.get(record.set_id)
+        if records is None or record.version_number > records[0].version_number:
+            labels[record.set_id] = [record]
+        elif record.version_number == records[0].version_number:
+            records.append(record)
+    return labels
+
+
+def textHash(rows):
+    """Returns the MD5 of the indication texts of a label."""
+    md5 = hashlib.md5()
+    for record in rows:
+        md5.update(record.text.encode())
+        md5.update(b"\0")
+    return md5.hexdigest()
+
+
+def readRecord(record_filename):
+    """
+    Reads the record of a release: the version and text hash of each label.
+
+    Returns:
+        dict: setId -> (version_number, text hash), empty if there is none
+    """
+    record = {}
+    try:
+        with open(record_filename, "r") as f:
+            for line in f:
+                set_id, version_number, text_hash = line.rstrip("\n").split("\t")
+                record[set_id] = (int(version_number), text_hash)
+    except FileNotFoundError:
+        pass
+    return record
+
+
+def writeRecord(record_filename, record):
+    os.makedirs(os.path.dirname(record_filename) or ".", exist_ok=True)
+    tmp_filename = f"{record_filename}.tmp"
+    with open(tmp_filename, "w") as f:
+        for set_id in sorted(record):
+            version_number, text_hash = record[set_id]
+            f.write(f"{set_id}\t{version_number}\t{text_hash}\n")
+    os.replace(tmp_filename, record_filename)
+
+
+def diffIndications(csv_filename, previous, diff_filename):
+    """
+    Compares the indications of a release with the record of the previous
+    one, and writes the labels whose indications were added, changed or
+    removed. A label reissued with a new version but the same text is not
+    written.
+
+    Args:
+        csv_filename: the indications CSV file of the release
+        previous: the record of the previous release, see readRecord()
+        diff_filename: the CSV file the changes are written to
+
+    Returns:
+        tuple(dict, dict) The record of the release, and the number of\
+            labels per change (added, changed, removed, reissued, unchanged)
+    """
+    labels = readIndications(csv_filename)
+    record = {}
+    counts = dict.fromkeys(["added", "changed", "removed", "reissued", "unchanged"], 0)
+    tmp_filename = f"{diff_filename}.tmp"
+    with open(tmp_filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(DIFF_FIELDS)
+        for set_id, rows in labels.items():
+            version_number = rows[0].version_number
+            text_hash = textHash(rows)
+            record[set_id] = (version_number, text_hash)
+            if set_id not in previous:
+                change = "added"
+            elif previous[set_id][1] != text_hash:
+                change = "changed"
+            else:
+                same_version = previous[set_id][0] == version_number
+                counts["unchanged" if same_version else "reissued"] += 1
+                continue
+            counts[change] += 1
+            writer.writerows(
+                (
+                    change,
+                    r.set_id,
+                    r.xml_id,
+                    r.version_number,
+                    r.length,
+                    r.text,
+                    r.sentences,
+                )
+                for r in rows
+            )
+        for set_id in sorted(previous.keys() - labels.keys()):
+            counts["removed"] += 1
+            writer.writerow(("removed", set_id, "", previous[set_id][0], "", "", ""))
+    os.replace(tmp_filename, diff_filename)
+    return record, counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="List the indications added, changed or removed between releases."
+    )
+    parser.add_argument("csv_file", help="Indications CSV file of the new release")
+    parser.add_argument(
+        "-o", "--output", required=True, help="CSV file the changes are written to"
+    )
+    previous_group = parser.add_mutually_exclusive_group(required=True)
+    previous_group.add_argument(
+        "--previous", help="Indications CSV file of the previous release"
+    )
+    previous_group.add_argument(
+        "--record",
+        help="Record of the previous release, updated with the new release",
+    )
+    args = parser.parse_args()
+
+    if args.previous is not None:
+        previous = {
+            set_id: (rows[0].version_number, textHash(rows))
+            for set_id, rows in readIndications(args.previous).items()
+        }
+    else:
+        previous = readRecord(args.record)
+
+    record, counts = diffIndications(args.csv_file, previous, args.output)
+    if args.record is not None:
+        writeRecord(args.record, record)
+    print(", ".join(f"{n} {change}" for change, n in counts.items()))
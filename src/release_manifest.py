@@ -0,0 +1,342 @@
+import os
+import sqlite3
+import struct
+import zipfile
+import zlib
+from collections import namedtuple
+
+MANIFEST_VERSION = 2
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+LOCAL_HEADER_SIZE = 30
+
+# An XML document of a release file: the SPL zip holding it, with the offset
+# of its compressed data in the release file, its compression method, sizes
+# and CRC, then the same for the XML file within the SPL zip, and the setId
+# of the document.
+MemberEntry = namedtuple(
+    "MemberEntry",
+    [
+        "zip_name",
+        "zip_offset",
+        "zip_method",
+        "zip_compressed_size",
+        "zip_size",
+        "zip_crc",
+        "xml_name",
+        "xml_offset",
+        "xml_method",
+        "xml_compressed_size",
+        "xml_size",
+        "xml_crc",
+        "set_id",
+    ],
+)
+
+
+def dataOffset(header, header_offset):
+    """
+    Returns the offset of the data of a zip member, from its local header.
+
+    Args:
+        header: the first bytes of the local header, at least 30
+        header_offset: the offset of the local header in the archive
+    """
+    if header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise ValueError(f"No zip local header at offset {header_offset}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    return header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+
+
+def inflate(data, method, size, crc):
+    """Decompresses the data of a stored or deflated zip member, and checks
+    its size and CRC."""
+    if method == zipfile.ZIP_STORED:
+        content = bytes(data)
+    elif method == zipfile.ZIP_DEFLATED:
+        content = zlib.decompress(data, -15)
+    else:
+        raise ValueError(f"Unsupported zip compression method {method}")
+    if len(content) != size or zlib.crc32(content) != crc:
+        raise ValueError("Zip member does not match its size or CRC")
+    return content
+
+
+def memberEntry(zip_name, zip_offset, zip_info, zip_bytes, xml_info, set_id):
+    """
+    Makes the entry of an XML file of an SPL zip.
+
+    Args:
+        zip_name: the name of the SPL zip in the release file
+        zip_offset: the offset of its compressed data in the release file
+        zip_info: its ZipInfo in the release file
+        zip_bytes: its content
+        xml_info: the ZipInfo of the XML file in the SPL zip
+        set_id: the setId of the XML document
+    """
+    header_offset = xml_info.header_offset
+    xml_offset = dataOffset(
+        zip_bytes[header_offset : header_offset + LOCAL_HEADER_SIZE], header_offset
+    )
+    return MemberEntry(
+        zip_name,
+        zip_offset,
+        zip_info.compress_type,
+        zip_info.compress_size,
+        zip_info.file_size,
+        zip_info.CRC,
+        xml_info.filename,
+        xml_offset,
+        xml_info.compress_type,
+        xml_info.compress_size,
+        xml_info.file_size,
+        xml_info.CRC,
+        set_id,
+    )
+
+
+def zipOffset(fd, zip_info):
+    """Returns the offset of the data of a member of an open release file."""
+    header = os.pread(fd, LOCAL_HEADER_SIZE, zip_info.header_offset)
+    return dataOffset(header, zip_info.header_offset)
+
+
+def readZip(fd, entry):
+    """Reads the content of the SPL zip of an entry from an open release file."""
+    data = os.pread(fd, entry.zip_compressed_size, entry.zip_offset)
+    return inflate(data, entry.zip_method, entry.zip_size, entry.zip_crc)
+
+
+def readXml(zip_bytes, entry):
+    """Reads the content of the XML file of an entry from its SPL zip."""
+    start = entry.xml_offset
+    data = memoryview(zip_bytes)[start : start + entry.xml_compressed_size]
+    return inflate(data, entry.xml_method, entry.xml_size, entry.xml_crc)
+
+
+def readDocument(fd, entry):
+    """Reads the XML document of an entry from an open release file, by
+    seeking to its bytes."""
+    return readXml(readZip(fd, entry), entry)
+
+
+def manifestKeys(entry):
+    """Returns the keys a document is looked up by: its setId, the name of
+    its SPL zip with and without its directory, and its XML filename."""
+    return {
+        entry.set_id,
+        entry.zip_name,
+        os.path.basename(entry.zip_name),
+        entry.xml_name,
+    }
+
+
+def indexKeys(entry):
+    """Returns the keys of a document in the index of a manifest, where SPL
+    zip names are recorded without their directory."""
+    return entry.set_id, entry.xml_name, os.path.basename(entry.zip_name)
+
+
+def indexFilename(filename):
+    """Names the key index of a manifest, state/<release file>.members.sqlite."""
+    return f"{os.path.splitext(filename)[0]}.sqlite"
+
+
+# The header line of a manifest: its version, the fingerprint of the release
+# file, and the path, size and mtime of the release file it was read from.
+ManifestHeader = namedtuple(
+    "ManifestHeader", ["version", "fingerprint", "release_path", "release_stat"]
+)
+
+
+def releaseStat(path):
+    """Identifies the state of a local file by its size and mtime."""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def formatHeader(fingerprint, release_path):
+    return (
+        f"# {MANIFEST_VERSION}\t{fingerprint}\t{release_path}\t"
+        f"{releaseStat(release_path)}\n"
+    )
+
+
+def parseHeader(line):
+    values = line[2:].rstrip("\n").split("\t")
+    return ManifestHeader(*(values + [""] * 4)[:4])
+
+
+def formatEntry(entry):
+    return "\t".join(str(value) for value in entry) + "\n"
+
+
+def parseEntry(line):
+    values = line.rstrip("\n").split("\t")
+    return MemberEntry(
+        values[0],
+        *map(int, values[1:6]),
+        values[6],
+        *map(int, values[7:12]),
+        values[12],
+    )
+
+
+def writeReleaseManifest(filename, fingerprint, entries, release_path):
+    """
+    Writes the member manifest of a release file, atomically, and the index
+    of the offsets of its lines by key, see manifestKeys().
+
+    Args:
+        filename: the manifest file
+        fingerprint: the fingerprint of the release file, see\
+            releaseFingerprint()
+        entries: the MemberEntry of its XML documents
+        release_path: the path of the release file, recorded with its size\
+            and mtime for readers without its metadata
+    """
+    tmp_filename = f"{filename}.tmp"
+    header = formatHeader(fingerprint, release_path)
+    offsets = []
+    offset = len(header.encode())
+    with open(tmp_filename, "w") as f:
+        f.write(header)
+        for entry in entries:
+            line = formatEntry(entry)
+            f.write(line)
+            offsets.append((offset, entry))
+            offset += len(line.encode())
+    writeMemberIndex(indexFilename(filename), fingerprint, offsets)
+    os.replace(tmp_filename, filename)
+
+
+def writeMemberIndex(filename, fingerprint, offsets):
+    """
+    Writes the index of a manifest, atomically: the offset of the line of
+    every document by each of its keys.
+
+    Args:
+        filename: the index file
+        fingerprint: the fingerprint in the header of the manifest
+        offsets: the (offset, MemberEntry) of every line of the manifest
+    """
+    tmp_filename = f"{filename}.tmp"
+    if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+    db = sqlite3.connect(tmp_filename)
+    # the file is only renamed once complete, no journal is needed
+    db.execute("PRAGMA journal_mode = OFF")
+    db.execute("PRAGMA synchronous = OFF")
+    db.execute("CREATE TABLE header (version TEXT NOT NULL, fingerprint TEXT NOT NULL)")
+    db.execute(
+        """CREATE TABLE members (
+            key TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            PRIMARY KEY (key, offset)
+        ) WITHOUT ROWID"""
+    )
+    db.execute("INSERT INTO header VALUES (?, ?)", (str(MANIFEST_VERSION), fingerprint))
+    db.executemany(
+        "INSERT OR IGNORE INTO members VALUES (?, ?)",
+        # in key order, the B-tree is only appended to
+        sorted((key, offset) for offset, entry in offsets for key in indexKeys(entry)),
+    )
+    db.commit()
+    db.close()
+    os.replace(tmp_filename, filename)
+
+
+def readManifestHeader(filename):
+    """
+    Reads the header line of a manifest, without its entries.
+
+    Returns:
+        ManifestHeader The header of the manifest, or None if there is no\
+            manifest
+    """
+    try:
+        with open(filename, "r") as f:
+            return parseHeader(f.readline())
+    except FileNotFoundError:
+        return None
+
+
+def readReleaseManifest(filename, fingerprint=None):
+    """
+    Reads the member manifest of a release file.
+
+    Args:
+        filename: the manifest file
+        fingerprint: the expected fingerprint of the release file, any by\
+            default
+
+    Returns:
+        list[MemberEntry] The entries, or None if there is no manifest, or it\
+            was written for another content or version
+    """
+    try:
+        with open(filename, "r") as f:
+            header = parseHeader(f.readline())
+            if header.version != str(MANIFEST_VERSION) or (
+                fingerprint is not None and header.fingerprint != fingerprint
+            ):
+                return None
+            return [parseEntry(line) for line in f]
+    except FileNotFoundError:
+        return None
+
+
+def findMembers(filename, key):
+    """
+    Finds the documents of a key in a manifest, seeking to their lines
+    through the index of the manifest. A manifest without an index, or with
+    an index written for another content, is read once instead.
+
+    Args:
+        filename: the manifest file
+        key: a setId, SPL zip name or XML filename, see manifestKeys()
+
+    Returns:
+        tuple(ManifestHeader, list[MemberEntry]) The header of the manifest\
+            and the matching entries, or None if there is no manifest of this\
+            version
+    """
+    header = readManifestHeader(filename)
+    if header is None or header.version != str(MANIFEST_VERSION):
+        return None
+    fingerprint = header.fingerprint
+    offsets = None
+    index_filename = indexFilename(filename)
+    if os.path.exists(index_filename):
+        db = sqlite3.connect(f"file:{index_filename}?mode=ro", uri=True)
+        try:
+            if db.execute("SELECT version, fingerprint FROM header").fetchone() == (
+                str(MANIFEST_VERSION),
+                fingerprint,
+            ):
+                offsets = [
+                    offset
+                    for (offset,) in db.execute(
+                        "SELECT offset FROM members WHERE key = ? ORDER BY offset",
+                        (os.path.basename(key),),
+                    )
+                ]
+        except sqlite3.DatabaseError:
+            offsets = None
+        finally:
+            db.close()
+    if offsets is not None:
+        entries = []
+        with open(filename, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                entries.append(parseEntry(f.readline().decode()))
+        return header, [entry for entry in entries if key in manifestKeys(entry)]
+
+    with open(filename, "r") as f:
+        content = f.read()
+    # most manifests do not mention the key, skip them before parsing
+    if key not in content:
+        return header, []
+    lines = content.splitlines()[1:]
+    entries = [parseEntry(line) for line in lines if key in line]
+    return header, [entry for entry in entries if key in manifestKeys(entry)]
@@ -0,0 +1,212 @@
+import json
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class StageMetrics:
+    """
+    The telemetry of one stage of a run.
+
+    Attributes:
+            name (str): The name of the stage
+            seconds (float): The wall clock time spent in the stage
+            cpu_seconds (float): The CPU time spent in the stage
+            peak_rss (int): The peak resident memory of the process, in bytes,
+                at the end of the stage
+            counters (dict[str, int]): Counters such as files, bytes_in, bytes_out
+            timers (dict[str, float]): Seconds spent in parts of the stage,
+                such as io or parse
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss = 0
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+
+    def toDict(self):
+        files = self.counters.get("files", 0)
+        return {
+            "seconds": self.seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "peak_rss_bytes": self.peak_rss,
+            "files_per_s": files / self.seconds if self.seconds else 0.0,
+            "counters": dict(self.counters),
+            "timers": dict(self.timers),
+        }
+
+
+def getPeakRSS():
+    """Returns the peak resident memory of the process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RunMetrics:
+    """
+    Collects per-stage timings, counters and peak memory for a run and
+    exports them as JSON or as a Prometheus textfile.
+    """
+
+    def __init__(self, prefix="dailymed"):
+        self.prefix = prefix
+        self.stages = {}
+        self.started = time.time()
+
+    def get(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name)
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name):
+        """Measures the wall clock time, CPU time and peak memory of a stage."""
+        stage = self.get(name)
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield stage
+        finally:
+            stage.seconds += time.perf_counter() - start
+            stage.cpu_seconds += time.process_time() - cpu_start
+            stage.peak_rss = getPeakRSS()
+
+    @contextmanager
+    def timer(self, name, part):
+        """Adds the time spent in the block to a part (io, parse...) of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.get(name).timers[part] += time.perf_counter() - start
+
+    def addTime(self, name, part, seconds):
+        """Adds seconds measured elsewhere, such as on a prefetch thread, to a
+        part of a stage."""
+        self.get(name).timers[part] += seconds
+
+    def count(self, name, counter, n=1):
+        self.get(name).counters[counter] += n
+
+    def toDict(self):
+        return {
+            "started": self.started,
+            "seconds": time.time() - self.started,
+            "peak_rss_bytes": getPeakRSS(),
+            "stages": {name: s.toDict() for name, s in self.stages.items()},
+        }
+
+    def toPrometheus(self):
+        """Formats the metrics in the Prometheus text exposition format."""
+        p = self.prefix
+        lines = [
+            f"# TYPE {p}_stage_seconds gauge",
+            f"# TYPE {p}_stage_cpu_seconds gauge",
+            f"# TYPE {p}_stage_peak_rss_bytes gauge",
+            f"# TYPE {p}_stage_files_per_second gauge",
+            f"# TYPE {p}_stage_counter gauge",
+            f"# TYPE {p}_stage_part_seconds gauge",
+        ]
+        for name, stage in self.stages.items():
+            d = stage.toDict()
+            label = f'stage="{name}"'
+            lines.append(f"{p}_stage_seconds{{{label}}} {d['seconds']}")
+            lines.append(f"{p}_stage_cpu_seconds{{{label}}} {d['cpu_seconds']}")
+            lines.append(f"{p}_stage_peak_rss_bytes{{{label}}} {d['peak_rss_bytes']}")
+            lines.append(f"{p}_stage_files_per_second{{{label}}} {d['files_per_s']}")
+            for counter, value in d["counters"].items():
+                lines.append(
+                    f'{p}_stage_counter{{{label},counter="{counter}"}} {value}'
+                )
+            for part, value in d["timers"].items():
+                lines.append(f'{p}_stage_part_seconds{{{label},part="{part}"}} {value}')
+        lines.append(f"{p}_run_seconds {time.time() - self.started}")
+        lines.append(f"{p}_run_timestamp_seconds {self.started}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, filepath, format="json"):
+        """
+        Writes the metrics to a file. The file is written next to its target
+        and renamed, so that a textfile collector never reads a partial file.
+
+        Args:
+            filepath: the file to write
+            format: json or prometheus
+        """
+        if format == "prometheus":
+            content = self.toPrometheus()
+        else:
+            content = json.dumps(self.toDict(), indent=2) + "\n"
+        tmp_filepath = f"{filepath}.tmp"
+        with open(tmp_filepath, "w") as f:
+            f.write(content)
+        os.replace(tmp_filepath, filepath)
+
+    def summary(self):
+        for name, stage in self.stages.items():
+            d = stage.toDict()
+            counters = ", ".join(f"{k}={v}" for k, v in d["counters"].items())
+            timers = ", ".join(f"{k}={v:.2f}s" for k, v in d["timers"].items())
+            print(
+                f"{name}: {d['seconds']:.2f}s, {d['files_per_s']:.1f} files/s, "
+                f"peak RSS {d['peak_rss_bytes'] / 1e6:.1f} MB"
+                + (f", {counters}" if counters else "")
+                + (f", {timers}" if timers else "")
+            )
+
+
+class Profiler:
+    """
+    An optional profiler around a run.
+
+    Attributes:
+            kind (str): none, cprofile or py-spy
+            output (str): The file to write the profile to
+    """
+
+    def __init__(self, kind="none", output=None):
+        self.kind = kind
+        self.output = output
+        self.profile = None
+        self.process = None
+
+    def start(self):
+        if self.kind == "cprofile":
+            import cProfile
+
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif self.kind == "py-spy":
+            py_spy = shutil.which("py-spy")
+            if py_spy is None:
+                print("py-spy is not installed, profiling disabled")
+                return
+            self.process = subprocess.Popen(
+                [
+                    py_spy,
+                    "record",
+                    "--pid",
+                    str(os.getpid()),
+                    "--output",
+                    self.output or "profile.svg",
+                ]
+            )
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.output or "profile.prof")
+        if self.process is not None:
+            # py-spy writes its output when it is interrupted
+            self.process.send_signal(signal.SIGINT)
+            self.process.wait()
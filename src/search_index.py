@@ -0,0 +1,182 @@
+import argparse
+import sqlite3
+import time
+
+from indication_record import readRecords
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    set_id TEXT NOT NULL,
+    version_number TEXT NOT NULL,
+    xml_id TEXT,
+    type TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_key ON sections (set_id, version_number);
+CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts USING fts5 (
+    text, content='sections', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS sections_ai AFTER INSERT ON sections BEGIN
+    INSERT INTO sections_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS sections_ad AFTER DELETE ON sections BEGIN
+    INSERT INTO sections_fts (sections_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+END;
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL
+);
+"""
+
+
+class SearchIndex:
+    """
+    A full-text index of extracted sections in a SQLite FTS5 table, keyed by
+    setId and version number. The fingerprint of the results of each release
+    file is recorded once they are indexed, so that results left by a run
+    without the index can be indexed later.
+
+    Attributes:
+            filepath (str): The path of the SQLite file
+    """
+
+    def __init__(self, filepath, commit_every=1000):
+        self.filepath = filepath
+        self.commit_every = commit_every
+        self.pending = 0
+        self.db = sqlite3.connect(filepath)
+        self.db.executescript(SCHEMA)
+
+    def replace(self, set_id, version_number, rows):
+        """
+        Replaces the indexed sections of a label version.
+
+        Args:
+            set_id: the setId of the label
+            version_number: the version of the label
+            rows: the IndicationRecord of its sections
+        """
+        self.db.execute(
+            "DELETE FROM sections WHERE set_id = ? AND version_number = ?",
+            (set_id, str(version_number)),
+        )
+        self.db.executemany(
+            "INSERT INTO sections (set_id, version_number, xml_id, type, text) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(set_id, str(version_number), r.xml_id, r.type, r.text) for r in rows],
+        )
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def addRows(self, rows):
+        """Indexes records, grouped by label version as process() emits them."""
+        groups = {}
+        for row in rows:
+            key = (row.set_id, str(row.version_number))
+            groups.setdefault(key, []).append(row)
+        for (set_id, version_number), group in groups.items():
+            self.replace(set_id, version_number, group)
+
+    def sourceFingerprint(self, source):
+        """Returns the fingerprint of the indexed results of a release file,
+        or None if they were never indexed."""
+        row = self.db.execute(
+            "SELECT fingerprint FROM sources WHERE source = ?", (source,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def recordSource(self, source, fingerprint):
+        """Records that the results of a release file are indexed."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO sources (source, fingerprint) VALUES (?, ?)",
+            (source, fingerprint),
+        )
+        self.commit()
+
+    def query(self, query, limit=20, phrase=False):
+        """
+        Searches the indexed sections.
+
+        Args:
+            query: FTS5 query terms, e.g. 'hypertension AND adults'
+            limit: the maximum number of results
+            phrase: search for the query as an exact phrase
+
+        Returns:
+            list[tuple] (set_id, version_number, xml_id, snippet) by relevance
+        """
+        if phrase:
+            query = '"' + query.replace('"', '""') + '"'
+        return self.db.execute(
+            """SELECT s.set_id, s.version_number, s.xml_id,
+                snippet(sections_fts, 0, '[', ']', '...', 16)
+            FROM sections_fts JOIN sections s ON s.id = sections_fts.rowid
+            WHERE sections_fts MATCH ?
+            ORDER BY bm25(sections_fts)
+            LIMIT ?""",
+            (query, limit),
+        ).fetchall()
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def buildFromCSV(index, csv_filename):
+    """Indexes every row of an indications CSV file."""
+    batch = []
+    for record in readRecords(csv_filename):
+        batch.append(record)
+        if len(batch) >= 10000:
+            index.addRows(batch)
+            batch = []
+    index.addRows(batch)
+    index.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build or query a full-text index of extracted indications."
+    )
+    parser.add_argument(
+        "-i",
+        "--index",
+        default="/data/dailymed/results/indications.sqlite",
+        help="Path to the index file",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Index an indications CSV file")
+    build.add_argument("csv_file", help="Path to the indications CSV file")
+    query = subparsers.add_parser("query", help="Search the index")
+    query.add_argument("query", help="FTS5 query, e.g. 'hypertension AND adults'")
+    query.add_argument("--phrase", action="store_true", help="Exact phrase search")
+    query.add_argument("-n", "--limit", type=int, default=20, help="Max results")
+    args = parser.parse_args()
+
+    with SearchIndex(args.index) as index:
+        if args.command == "build":
+            buildFromCSV(index, args.csv_file)
+            print(f"Indexed {index.count()} section(s) in {args.index}")
+        else:
+            start = time.perf_counter()
+            results = index.query(args.query, args.limit, args.phrase)
+            elapsed = (time.perf_counter() - start) * 1000
+            for set_id, version_number, xml_id, snippet in results:
+                print(f"{set_id} v{version_number} {xml_id}\n    {snippet}")
+            print(f"{len(results)} result(s) in {elapsed:.1f} ms")
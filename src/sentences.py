@@ -0,0 +1,133 @@
+import re
+
+# words ending with a period that do not end a sentence
+ABBREVIATIONS = {
+    "approx",
+    "ca",
+    "cf",
+    "dr",
+    "e.g",
+    "etc",
+    "fig",
+    "i.e",
+    "inc",
+    "incl",
+    "max",
+    "min",
+    "mr",
+    "mrs",
+    "ms",
+    "no",
+    "st",
+    "u.s",
+    "viz",
+    "vs",
+}
+BOUNDARY = re.compile(r"[.!?]+[\"')\]]*(?=\s|$)|\n")
+# the last word before a period, and the word before it if any
+LAST_WORDS = re.compile(r"(?:(\S+)\s+)?(\S+)$")
+# the first word after a period
+NEXT_WORD = re.compile(r"[.!?\"')\]]*\s+(\S+)")
+DOTTED = re.compile(r"(?:[A-Za-z]\.)+[A-Za-z]")
+INITIAL = re.compile(r"[A-Z]")
+NEXT_INITIAL = re.compile(r"[A-Z]\.")
+SURNAME = re.compile(r"[A-Z][a-z]+(?:[-'][A-Za-z]+)*[,;:.]?")
+
+
+def isInitial(previous, following):
+    """
+    Tells whether a capital letter followed by a period is the initial of a
+    name, as in "J. R. Smith" or "Dr. J. Smith", rather than a letter ending
+    a sentence, as in "hepatitis C. Also for HIV-1 infection."
+
+    Args:
+        previous: the word before the letter, None at the start of a sentence
+        following: the word after the period, None at the end of the text
+    """
+    if following is None:
+        return False
+    if NEXT_INITIAL.fullmatch(following):
+        return True
+    # a surname after the letter, and no lowercase word before it
+    return SURNAME.fullmatch(following) is not None and (
+        previous is None or previous.lstrip("(['\"")[:1].isupper()
+    )
+
+
+def isAbbreviation(text, start, end):
+    """Tells whether the period at end follows an abbreviation or an initial."""
+    match = LAST_WORDS.search(text, start, end)
+    if match is None:
+        return False
+    previous, word = match.groups()
+    word = word.lstrip("(['\"")
+    if word.lower() in ABBREVIATIONS or DOTTED.fullmatch(word):
+        return True
+    if INITIAL.fullmatch(word):
+        following = NEXT_WORD.match(text, end)
+        return isInitial(previous, following.group(1) if following else None)
+    return False
+
+
+def segmentSentences(text):
+    """
+    Splits a text into sentences.
+
+    A sentence ends with a line break, or with a period, exclamation or
+    question mark followed by a space, unless the mark follows an
+    abbreviation or an initial, is inside parentheses, or the next word
+    starts in lowercase.
+
+    Args:
+        text: the text of a section
+
+    Returns:
+        list[tuple(int, int)] The start and end offsets of every sentence,
+            without surrounding whitespace
+    """
+    spans = []
+    start = 0
+    depth = 0
+    scanned = 0
+    for match in BOUNDARY.finditer(text):
+        end = match.end()
+        if match.group() != "\n":
+            depth += text.count("(", scanned, match.start())
+            depth -= text.count(")", scanned, match.start())
+            scanned = match.start()
+            next_char = text[end : end + 2].strip()[:1]
+            if (
+                depth > 0
+                or next_char.islower()
+                or (
+                    match.group()[0] == "."
+                    and isAbbreviation(text, start, match.start())
+                )
+            ):
+                continue
+        addSpan(text, start, end, spans)
+        start = end
+        scanned = end
+        depth = 0
+    addSpan(text, start, len(text), spans)
+    return spans
+
+
+def addSpan(text, start, end, spans):
+    """Appends the span of text[start:end] without surrounding whitespace."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start < end:
+        spans.append((start, end))
+
+
+def formatSpans(spans):
+    """Formats sentence spans as "start:end" pairs separated by spaces."""
+    return " ".join(f"{start}:{end}" for start, end in spans)
+
+
+def parseSpans(value):
+    """Parses sentence spans formatted by formatSpans()."""
+    return [tuple(map(int, pair.split(":"))) for pair in value.split()]
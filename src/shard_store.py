@@ -0,0 +1,204 @@
+import glob
+import mmap
+import os
+import re
+import threading
+from collections import namedtuple
+
+from spl_codec import Codec, decompress
+
+SET_ID_PATTERN = re.compile(rb'<setId\s+root="([^"]+)"')
+
+# A document in a shard: its name (the XML filename), its setId, the shard
+# file holding it, and the offset and length of its gzip member in that shard.
+ShardEntry = namedtuple("ShardEntry", ["name", "set_id", "shard", "offset", "length"])
+
+
+def sniffSetId(xml_bytes):
+    """Finds the setId of an SPL document without parsing it."""
+    # the setId is part of the document header, so look there first
+    match = SET_ID_PATTERN.search(xml_bytes, 0, 16384) or SET_ID_PATTERN.search(
+        xml_bytes
+    )
+    return match.group(1).decode() if match else ""
+
+
+class ShardWriter:
+    """
+    Packs documents into a few large shard files instead of one file each.
+
+    Every document is compressed on its own, as an independent gzip member
+    or zstd frame, and appended to the current shard, and a line is added to
+    the sidecar index of the shard (name, setId, offset, length). A new shard
+    is started once the current one exceeds max_bytes.
+
+    Attributes:
+            directory (str): The directory containing the shards
+            prefix (str): The prefix of the shard filenames
+            max_bytes (int): The size at which a new shard is started
+            codec (Codec): The compression of the documents, gzip by default
+    """
+
+    def __init__(self, directory, prefix="shard", max_bytes=1024**3, codec=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.codec = codec if codec is not None else Codec("gzip")
+        self.n_shards = 0
+        self.path = None
+        self.data_fp = None
+        self.index_fp = None
+        os.makedirs(directory, exist_ok=True)
+        # shards with the same prefix are replaced, not appended to
+        for path in glob.glob(f"{directory}/{prefix}-*.bin") + glob.glob(
+            f"{directory}/{prefix}-*.idx"
+        ):
+            os.remove(path)
+
+    def nextShard(self):
+        self.closeShard()
+        self.path = f"{self.directory}/{self.prefix}-{self.n_shards:05d}.bin"
+        self.n_shards += 1
+        self.data_fp = open(self.path, "wb")
+        self.index_fp = open(self.path[: -len(".bin")] + ".idx", "w")
+
+    def add(self, name, xml_bytes):
+        """
+        Appends a document to the current shard.
+
+        Args:
+            name: the name of the document, usually its XML filename
+            xml_bytes: the content of the document
+
+        Returns:
+            ShardEntry: The location of the document
+        """
+        return self.addCompressed(
+            name, self.codec.compress(xml_bytes), sniffSetId(xml_bytes)
+        )
+
+    def addCompressed(self, name, member, set_id):
+        """
+        Appends a document already compressed with the codec of the writer,
+        so that it can be compressed on another thread.
+
+        Args:
+            name: the name of the document, usually its XML filename
+            member: the compressed content of the document
+            set_id: the setId of the document, see sniffSetId()
+
+        Returns:
+            ShardEntry: The location of the document
+        """
+        if self.data_fp is None or self.data_fp.tell() >= self.max_bytes:
+            self.nextShard()
+        offset = self.data_fp.tell()
+        self.data_fp.write(member)
+        entry = ShardEntry(name, set_id, self.path, offset, len(member))
+        self.index_fp.write(f"{name}\t{set_id}\t{offset}\t{len(member)}\n")
+        return entry
+
+    def closeShard(self):
+        if self.data_fp is not None:
+            self.data_fp.close()
+            self.index_fp.close()
+            self.data_fp = None
+            self.index_fp = None
+
+    def close(self):
+        self.closeShard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardStore:
+    """
+    Reads the shards of a directory, either by random access to one
+    document, or by a sequential scan over memory-mapped shards.
+
+    Attributes:
+            directory (str): The directory containing the shards
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.maps = {}
+        self.lock = threading.Lock()
+        self.by_name = None
+        self.by_set_id = None
+
+    @staticmethod
+    def isShardDirectory(directory):
+        return len(glob.glob(f"{directory}/*.idx")) > 0
+
+    def shards(self):
+        return sorted(glob.glob(f"{self.directory}/*.bin"))
+
+    def entries(self):
+        """Yields the entries of every shard, in storage order."""
+        for shard in self.shards():
+            index_path = shard[: -len(".bin")] + ".idx"
+            with open(index_path, "r") as f:
+                for line in f:
+                    name, set_id, offset, length = line.rstrip("\n").split("\t")
+                    yield ShardEntry(name, set_id, shard, int(offset), int(length))
+
+    def loadIndex(self):
+        """Builds the name and setId lookups of the store."""
+        self.by_name = {}
+        self.by_set_id = {}
+        for entry in self.entries():
+            self.by_name[entry.name] = entry
+            self.by_set_id.setdefault(entry.set_id, []).append(entry)
+
+    def find(self, key):
+        """
+        Finds the documents with a given setId or name.
+
+        Returns:
+            list[ShardEntry] The matching entries
+        """
+        if self.by_name is None:
+            self.loadIndex()
+        if key in self.by_set_id:
+            return self.by_set_id[key]
+        return [self.by_name[key]] if key in self.by_name else []
+
+    def map(self, shard):
+        # documents may be read from several threads, see prefetch()
+        with self.lock:
+            if shard not in self.maps:
+                with open(shard, "rb") as f:
+                    self.maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self.maps[shard]
+
+    def read(self, shard, offset, length):
+        """Returns the decompressed content of the document at offset, whatever
+        its codec."""
+        return decompress(self.map(shard)[offset : offset + length])
+
+    def readEntry(self, entry):
+        return self.read(entry.shard, entry.offset, entry.length)
+
+    def scan(self):
+        """Yields (entry, content) for every document, reading each shard
+        sequentially."""
+        for entry in self.entries():
+            if entry.shard not in self.maps and hasattr(mmap, "MADV_SEQUENTIAL"):
+                self.map(entry.shard).madvise(mmap.MADV_SEQUENTIAL)
+            yield entry, self.readEntry(entry)
+
+    def close(self):
+        for m in self.maps.values():
+            m.close()
+        self.maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
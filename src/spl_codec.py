@@ -0,0 +1,91 @@
+import gzip
+import threading
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+DEFAULT_LEVELS = {"gzip": 9, "zstd": 3, "none": None}
+
+
+def importZstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The zstd codec requires the zstandard package")
+    return zstandard
+
+
+class Codec:
+    """
+    The compression of the extracted XML files.
+
+    Attributes:
+            name (str): gzip, zstd or none
+            level (int): The compression level, None for none
+            extension (str): The filename extension of the compressed files
+    """
+
+    def __init__(self, name="gzip", level=None):
+        if name not in EXTENSIONS:
+            raise ValueError(
+                f"Unknown codec {name}, expected one of {list(EXTENSIONS)}"
+            )
+        self.name = name
+        self.level = DEFAULT_LEVELS[name] if level is None else level
+        self.extension = EXTENSIONS[name]
+        # a ZstdCompressor must not be shared by threads, so each thread
+        # compressing documents has its own
+        self.local = threading.local()
+        if name == "zstd":
+            importZstandard()
+
+    def compress(self, data):
+        if self.name == "gzip":
+            # no timestamp, so that the same content compresses the same way
+            return gzip.compress(data, self.level, mtime=0)
+        if self.name == "zstd":
+            return self.compressor().compress(data)
+        return data
+
+    def compressor(self):
+        compressor = getattr(self.local, "compressor", None)
+        if compressor is None:
+            compressor = importZstandard().ZstdCompressor(level=self.level)
+            self.local.compressor = compressor
+        return compressor
+
+    def __str__(self):
+        return self.name if self.level is None else f"{self.name}:{self.level}"
+
+
+def parseCodec(spec):
+    """Parses a codec specification such as gzip, gzip:6, zstd:3 or none."""
+    name, _, level = spec.partition(":")
+    return Codec(name, int(level) if level else None)
+
+
+def detectCodec(data):
+    """Tells the codec of compressed data from its magic bytes."""
+    if data[:2] == GZIP_MAGIC:
+        return "gzip"
+    if data[:4] == ZSTD_MAGIC:
+        return "zstd"
+    return "none"
+
+
+def decompress(data):
+    """Decompresses gzip, zstd or uncompressed data, detected by its magic bytes."""
+    codec = detectCodec(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd":
+        # frames written by ZstdCompressor.compress() record the content size
+        return importZstandard().ZstdDecompressor().decompress(data)
+    return bytes(data)
+
+
+def readFile(filepath):
+    """Reads the content of a file, whatever its codec."""
+    with open(filepath, "rb") as f:
+        return decompress(f.read())
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+
+VOCABULARY_VERSION = 3
+
+
+class Vocabulary:
+    """
+    A vocabulary of trigger phrases grouped by category, compiled into a
+    single sentence matcher.
+
+    A phrase listed in several categories belongs to the first one. Phrases
+    are tried in the order they are listed, as the flat term lists are.
+
+    Attributes:
+            terms (list[str]): The phrases, in matching order
+            categories (dict): phrase -> category, None for a flat term list
+            source_md5 (str): The MD5 of the file the vocabulary was loaded from
+    """
+
+    def __init__(self, categories, source_md5=None):
+        self.terms = []
+        self.categories = {}
+        self.source_md5 = source_md5
+        for category, phrases in categories.items():
+            for phrase in phrases:
+                phrase = phrase.strip()
+                if phrase and phrase not in self.categories:
+                    self.categories[phrase] = category
+                    self.terms.append(phrase)
+        escaped_terms = [re.escape(term) for term in self.terms]
+        self.term_pattern = re.compile(r"\b(" + "|".join(escaped_terms) + r")\b")
+
+    def findInSentences(self, text, spans):
+        """
+        Finds the first phrase of every sentence of a text.
+
+        Args:
+            text: the text
+            spans: the (start, end) offsets of its sentences
+
+        Returns:
+            list[tuple(str, str)] The phrase and category of every match
+        """
+        matches = []
+        for start, end in spans:
+            match = self.term_pattern.search(text, start, end)
+            if match is not None:
+                term = match.group(1)
+                matches.append((term, self.categories[term]))
+        return matches
+
+    def category(self, term):
+        return self.categories.get(term)
+
+
+def loadTerms(filename):
+    """
+    Loads phrases from a JSON file mapping categories to lists of phrases,
+    or from a text file with one phrase per line.
+
+    Returns:
+        dict: category -> list of phrases, the category being None for a
+            text file
+    """
+    with open(filename, "r") as f:
+        if filename.endswith(".json"):
+            return json.load(f)
+        return {None: [line.rstrip("\n") for line in f]}
+
+
+def compileVocabulary(filename, cache_filename=None):
+    """
+    Loads the vocabulary of a terms file, from its compiled form when it was
+    compiled before from the same file.
+
+    Args:
+        filename: the terms file, .json or .txt
+        cache_filename: where the compiled vocabulary is kept, or None to
+            compile it every time
+
+    Returns:
+        Vocabulary: The compiled vocabulary
+    """
+    with open(filename, "rb") as f:
+        source_md5 = hashlib.md5(f.read()).hexdigest()
+
+    if cache_filename is not None:
+        try:
+            with open(cache_filename, "rb") as f:
+                version, vocabulary = pickle.load(f)
+            if version == VOCABULARY_VERSION and vocabulary.source_md5 == source_md5:
+                return vocabulary
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+
+    vocabulary = Vocabulary(loadTerms(filename), source_md5)
+    if cache_filename is not None:
+        os.makedirs(os.path.dirname(cache_filename) or ".", exist_ok=True)
+        tmp_filename = f"{cache_filename}.tmp"
+        with open(tmp_filename, "wb") as f:
+            pickle.dump((VOCABULARY_VERSION, vocabulary), f)
+        os.replace(tmp_filename, cache_filename)
+    return vocabulary
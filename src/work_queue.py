@@ -0,0 +1,295 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+def defaultWorkerId():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def writeAtomically(filename, content):
+    tmp_filename = f"{filename}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_filename, "w") as f:
+        f.write(content)
+    os.replace(tmp_filename, filename)
+
+
+class LeaseLost(Exception):
+    """Raised in a worker whose lease on a unit was taken over, or may have
+    expired, so that it stops writing the outputs of the unit."""
+
+
+class Heartbeat:
+    """
+    Keeps the lease of a unit alive from a thread, and tells the worker when
+    the lease is lost.
+
+    Attributes:
+            queue (LeaseQueue): The queue of the unit
+            run_id (str): The run of the unit
+            unit (str): The unit
+            renewed (float): The time of the last renewal of the lease
+            lost (threading.Event): Set once the lease was taken over
+    """
+
+    def __init__(self, queue, run_id, unit):
+        self.queue = queue
+        self.run_id = run_id
+        self.unit = unit
+        self.renewed = time.time()
+        self.lost = threading.Event()
+        self.stopped = threading.Event()
+
+    def beat(self):
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            if not self.queue.renew(self.run_id, self.unit):
+                self.lost.set()
+                return
+            self.renewed = time.time()
+
+    def check(self):
+        """
+        Raises LeaseLost if the lease was taken over, or was not renewed for
+        two thirds of lease_seconds, as when the node paused: another worker
+        may then be running the unit.
+        """
+        if self.lost.is_set():
+            raise LeaseLost(f"{self.unit} was taken over by another worker")
+        if time.time() - self.renewed > self.queue.lease_seconds * 2 / 3:
+            raise LeaseLost(f"The lease of {self.unit} was not renewed in time")
+
+
+class LeaseQueue:
+    """
+    A queue of work units in a directory shared by the nodes of a run, which
+    relies only on atomic file creation and renames.
+
+    A coordinator starts a run by listing its units. A worker claims a unit
+    by creating the first generation of its lease exclusively, keeps the
+    lease alive by touching it, and commits the unit by writing its done
+    marker. A lease that was not touched for lease_seconds has expired: its
+    worker is presumed dead, and another worker takes the unit over by
+    creating the next generation exclusively, so that only one of them
+    succeeds. A worker only renews, commits or releases a unit while its
+    generation is the latest one, and holds its claim token.
+
+    A unit is not safe to run twice at once, as its extraction writes in
+    place. A worker that pauses for longer than lease_seconds loses its
+    unit, so the worker checks its Heartbeat before every write, and stops
+    the unit once the lease is lost or was not renewed in time.
+
+    Layout: <directory>/current holds the id of the current run, and
+    <directory>/<run id>/ holds units/<unit>, leases/<unit>.<generation>
+    and done/<unit>.
+
+    Attributes:
+            directory (str): The queue directory
+            lease_seconds (float): The time after which a lease expires
+            worker_id (str): The identifier of this worker
+    """
+
+    def __init__(self, directory, lease_seconds=600, worker_id=None):
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or defaultWorkerId()
+        # the generation and token of the leases claimed by this worker
+        self.leases = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, units):
+        """
+        Starts a new run over units, which becomes the current run.
+
+        Returns:
+            str: The id of the run
+        """
+        run_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+        run_dir = f"{self.directory}/{run_id}"
+        for name in ["units", "leases", "done"]:
+            os.makedirs(f"{run_dir}/{name}", exist_ok=True)
+        for unit in units:
+            writeAtomically(f"{run_dir}/units/{unit}", json.dumps({"unit": unit}))
+        writeAtomically(f"{self.directory}/current", run_id)
+        return run_id
+
+    def currentRun(self):
+        try:
+            with open(f"{self.directory}/current", "r") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def waitForRun(self, timeout):
+        """
+        Waits for a coordinator to start a run with pending units. A run
+        whose units are all committed, left by a previous coordinator, is
+        not waited on.
+
+        Returns:
+            str: The id of the current run, or None if no run with pending\
+                units was started within timeout seconds
+        """
+        deadline = time.time() + timeout
+        while True:
+            run_id = self.currentRun()
+            if run_id is not None and self.pending(run_id):
+                return run_id
+            if time.time() >= deadline:
+                return None
+            time.sleep(min(5, self.lease_seconds / 3))
+
+    def path(self, run_id, kind, unit):
+        return f"{self.directory}/{run_id}/{kind}/{unit}"
+
+    def leasePath(self, run_id, unit, generation):
+        return f"{self.path(run_id, 'leases', unit)}.{generation}"
+
+    def generations(self, run_id, unit):
+        """Lists the generations of the lease files of a unit, in order."""
+        prefix = f"{unit}."
+        return sorted(
+            int(name[len(prefix) :])
+            for name in os.listdir(f"{self.directory}/{run_id}/leases")
+            if name.startswith(prefix) and name[len(prefix) :].isdigit()
+        )
+
+    def units(self, run_id):
+        return sorted(os.listdir(f"{self.directory}/{run_id}/units"))
+
+    def isDone(self, run_id, unit):
+        return os.path.exists(self.path(run_id, "done", unit))
+
+    def pending(self, run_id):
+        """Lists the units of a run that are not committed yet."""
+        return [u for u in self.units(run_id) if not self.isDone(run_id, u)]
+
+    def tryLease(self, run_id, unit):
+        """Claims a unit, or takes over its expired lease."""
+        generations = self.generations(run_id, unit)
+        generation = 0
+        if generations:
+            latest = generations[-1]
+            try:
+                modified = os.stat(self.leasePath(run_id, unit, latest)).st_mtime
+                if time.time() - modified < self.lease_seconds:
+                    return False
+            except FileNotFoundError:
+                # released or taken over since it was listed
+                pass
+            generation = latest + 1
+        # only one worker can create a generation
+        try:
+            fd = os.open(
+                self.leasePath(run_id, unit, generation),
+                os.O_CREAT | os.O_EXCL | os.O_WRONLY,
+            )
+        except FileExistsError:
+            return False
+        token = f"{self.worker_id} {uuid.uuid4().hex}"
+        with os.fdopen(fd, "w") as f:
+            f.write(token)
+        self.leases[(run_id, unit)] = (generation, token)
+        if not self.owns(run_id, unit):
+            # a later generation was created while the leases were listed
+            self.release(run_id, unit, force=True)
+            return False
+        for previous in generations:
+            try:
+                os.remove(self.leasePath(run_id, unit, previous))
+            except FileNotFoundError:
+                pass
+        return True
+
+    def owns(self, run_id, unit):
+        """Tells whether this worker still holds the lease it claimed on a unit."""
+        if (run_id, unit) not in self.leases:
+            return False
+        generation, token = self.leases[(run_id, unit)]
+        try:
+            with open(self.leasePath(run_id, unit, generation), "r") as f:
+                if f.read() != token:
+                    return False
+        except FileNotFoundError:
+            return False
+        return self.generations(run_id, unit)[-1:] == [generation]
+
+    def claim(self):
+        """
+        Claims a pending unit of the current run.
+
+        Returns:
+            tuple(str, str) The run id and the unit, or None if every unit\
+                is done or leased
+        """
+        run_id = self.currentRun()
+        if run_id is None:
+            return None
+        for unit in self.pending(run_id):
+            if self.tryLease(run_id, unit):
+                # the unit may have been committed since it was listed
+                if self.isDone(run_id, unit):
+                    self.release(run_id, unit)
+                    continue
+                return run_id, unit
+        return None
+
+    def renew(self, run_id, unit):
+        """
+        Touches the lease of a unit, if this worker still holds it.
+
+        Returns:
+            bool: False if the unit was taken over
+        """
+        if not self.owns(run_id, unit):
+            return False
+        generation, _ = self.leases[(run_id, unit)]
+        try:
+            os.utime(self.leasePath(run_id, unit, generation))
+        except FileNotFoundError:
+            return False
+        return True
+
+    @contextmanager
+    def heartbeat(self, run_id, unit):
+        """Keeps the lease of a unit alive while the block runs, until the
+        unit is taken over, and yields the Heartbeat to check."""
+        heartbeat = Heartbeat(self, run_id, unit)
+        thread = threading.Thread(target=heartbeat.beat, daemon=True)
+        thread.start()
+        try:
+            yield heartbeat
+        finally:
+            heartbeat.stopped.set()
+            thread.join()
+
+    def commit(self, run_id, unit, result=None):
+        """
+        Marks a unit as done, with an optional JSON serializable result, if
+        this worker still holds its lease.
+
+        Returns:
+            bool: False if the unit was taken over, and is left to its new\
+                worker
+        """
+        if not self.owns(run_id, unit):
+            self.leases.pop((run_id, unit), None)
+            return False
+        record = {"unit": unit, "worker": self.worker_id, "result": result}
+        writeAtomically(self.path(run_id, "done", unit), json.dumps(record))
+        self.release(run_id, unit)
+        return True
+
+    def release(self, run_id, unit, force=False):
+        """Gives up the lease of a unit, if this worker still holds it, or
+        with force, the generation it claimed whatever came after it."""
+        if force or self.owns(run_id, unit):
+            generation, _ = self.leases[(run_id, unit)]
+            try:
+                os.remove(self.leasePath(run_id, unit, generation))
+            except FileNotFoundError:
+                pass
+        self.leases.pop((run_id, unit), None)